@@ -0,0 +1,344 @@
+"""Micro-benchmarks of the game's hot paths.
+
+Every case runs offline on synthetic decks of several sizes (and games of
+several player counts). The results are compared with the saved baseline
+(benchmarks/baseline.json, machine specific so it is not committed) and the
+command fails if any case got slower than the threshold.
+
+    python benchmarks/bench.py              # compare with the baseline
+    python benchmarks/bench.py --save       # and make this run the baseline
+    python benchmarks/bench.py -k deck      # only the cases matching "deck"
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import sys
+import tempfile
+import timeit
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterator
+from uuid import uuid4
+
+ROOT_PATH = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_PATH))
+sys.path.append(str(ROOT_PATH / 'multiplayer'))
+
+from pydantic_core import from_json  # noqa: E402
+
+import main  # noqa: E402
+import models  # noqa: E402
+from cards import Deduplicator, normalize_text  # noqa: E402
+from codec import BINARY_CODEC, JSON_CODEC  # noqa: E402
+from compose import merge_packs  # noqa: E402
+from eventlog import EventLog  # noqa: E402
+from matchmaking import Matchmaker, QueueKey  # noqa: E402
+from rooms import RoomRegistry  # noqa: E402
+from server import start_round  # noqa: E402
+from sync import player_joined  # noqa: E402
+
+
+BASELINE_PATH: Path = Path(__file__).parent / 'baseline.json'
+# A case regresses when it is this much slower than its baseline
+THRESHOLD: float = 0.2
+REPEAT: int = 3
+
+# White cards of the synthetic decks (with a black card every 5 white ones)
+DECK_SIZES: tuple[int, ...] = (300, 3_000, 30_000)
+PLAYER_COUNTS: tuple[int, ...] = (3, 10, 20)
+# Rooms saved for the recovery case (half in the snapshot, half in the log)
+ROOM_COUNT: int = 1_000
+# Cards deduplicated (one in ten is repeated) and packs merged into one deck
+DEDUPE_SIZES: tuple[int, ...] = (100_000, 300_000)
+PACK_COUNT: int = 3
+# Players that want a game at once (spread over every combination of settings)
+QUEUED_PLAYERS: int = 50_000
+
+
+@dataclass
+class Case:
+    name: str
+    run: Callable[[], Any]
+
+
+def deck_json(white_count: int) -> dict[str, Any]:
+    rng = random.Random(white_count)
+    words = ['gato', 'abuela', 'tostada', 'impuestos', 'dragón', 'lunes', 'karaoke', 'vecino', '&quot;ñ&quot;']
+    return {
+        'name': f'Bench {white_count}',
+        'codeName': f'bench-{white_count}',
+        'official': False,
+        'blackCards': [
+            {'text': f'{i} ' + ' '.join(rng.choices(words, k=6)) + ' _&period;', 'pick': rng.choice((1, 1, 1, 2, 3))}
+            for i in range(white_count // 5)
+        ],
+        'whiteCards': [f'{i} ' + ' '.join(rng.choices(words, k=3)) for i in range(white_count)],
+    }
+
+
+def write_deck(directory: Path, data: dict[str, Any]) -> Path:
+    """Writes the deck where main.get_deck looks for it (./decks/CAH.json)."""
+
+    decks = directory / 'decks'
+    decks.mkdir(parents=True, exist_ok=True)
+    path = decks / 'CAH.json'
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    return path
+
+
+def deck_cases(workdir: Path) -> Iterator[Case]:
+    for size in DECK_SIZES:
+        data = deck_json(size)
+        directory = workdir / str(size)
+        write_deck(directory, data)
+
+        def get_deck(directory: Path = directory) -> main.Deck:
+            with contextlib.chdir(directory):
+                return main.get_deck()
+
+        get_deck()  # Compiles the deck once, like any run after the first
+        yield Case(f'main.get_deck[{size}]', get_deck)
+        yield Case(f'models.Deck(**json)[{size}]', lambda data=data: models.Deck(**data))
+
+        cards = [main.WhiteCard(text=text) for text in data['whiteCards']]
+        yield Case(f'check_no_repeating[{size}]', lambda cards=cards: main.check_no_repeating(cards))
+
+        piles = (list(range(size)), [])
+
+        def draw(piles: tuple[list[int], list[int]] = piles) -> None:
+            drawing, tracking = piles
+            if len(drawing) < main.HAND_SIZE:
+                drawing.extend(tracking)
+                tracking.clear()
+            models.random_subset_choice_with_tracking(drawing, tracking, main.HAND_SIZE)
+
+        yield Case(f'random_subset_choice_with_tracking[{size}]', draw)
+
+
+def game_cases(workdir: Path) -> Iterator[Case]:
+    with contextlib.chdir(workdir / str(DECK_SIZES[1])):
+        deck = main.get_deck()
+    for count in PLAYER_COUNTS:
+        players = [main.Player(player_id=i, name=f'Jugador {i}') for i in range(count)]
+        game = main.Game(players=players, deck=deck)
+
+        def init_game(game: main.Game = game) -> None:
+            game.deck.white_pile.reset()
+            for player in game.players:
+                del player.cards[:]
+            game.init_game()
+
+        yield Case(f'Game.init_game[{count}p]', init_game)
+
+
+def game_state(player_count: int) -> models.GameState:
+    deck = models.Deck(**deck_json(DECK_SIZES[1]))
+    state = models.GameState(settings=models.GameSettings(deck=deck), black_card=deck.draw_black_cards()[0])
+    for i in range(player_count):
+        state.players.append(models.Player(
+            id=uuid4(),
+            name=f'Jugador {i}',
+            color='red',
+            hand=deck.draw_white_ids(main.HAND_SIZE),
+        ))
+    return state
+
+
+def state_cases() -> Iterator[Case]:
+    for count in PLAYER_COUNTS:
+        state = game_state(count)
+        player_id = state.players[0].id
+
+        def public_view(state: models.GameState = state) -> bytes:
+            state.version += 1  # Skips the per version cache
+            return state.public_view()
+
+        yield Case(f'GameState.public_view[{count}p]', public_view)
+        yield Case(f'GameState.projection[{count}p]', lambda state=state, player_id=player_id: state.projection(player_id))
+
+        snapshot = models.Message(type=models.NetworkRequest.GET_GAME_STATE, data=from_json(state.projection(player_id)))
+        player_info = models.Message(type=models.NetworkRequest.SET_PLAYER_INFO, data=state.players[0].model_dump(mode='json'))
+        for codec_name, codec in (('json', JSON_CODEC), ('binary', BINARY_CODEC)):
+            for message_name, message in (('SET_PLAYER_INFO', player_info), ('GET_GAME_STATE', snapshot)):
+                if message_name == 'SET_PLAYER_INFO' and count != PLAYER_COUNTS[0]:
+                    continue  # Does not depend on the players
+                label = message_name if message_name == 'SET_PLAYER_INFO' else f'{message_name},{count}p'
+                frame = codec.encode(message)
+                yield Case(f'Message.encode[{codec_name},{label}]', lambda codec=codec, message=message: codec.encode(message))
+                yield Case(f'Message.decode[{codec_name},{label}]', lambda codec=codec, frame=frame: codec.decode(frame))
+
+
+def recovery_cases(workdir: Path) -> Iterator[Case]:
+    deck = models.Deck(**deck_json(DECK_SIZES[1]))
+    directory = workdir / 'rooms'
+
+    async def save_rooms() -> None:
+        rooms = RoomRegistry()
+        log = EventLog(directory)
+        rooms.attach_log(log)
+        for i in range(ROOM_COUNT):
+            room = rooms.create(models.GameSettings(deck=deck), deck_name='bench')
+            room.sync.apply(*(player_joined(models.Player(name=f'Jugador {j}')) for j in range(6)))
+            start_round(room)
+            if i == ROOM_COUNT // 2:
+                await log.snapshot(rooms.snapshot)
+        for room in rooms.rooms.values():
+            room.cancel_deadline()
+        await log.close()
+
+    asyncio.run(save_rooms())
+    yield Case(f'RoomRegistry.recover[{ROOM_COUNT} rooms]', lambda: RoomRegistry().recover(directory, lambda name: deck))
+
+
+def repeated_texts(count: int) -> list[str]:
+    """Card texts where one in ten repeats an earlier one (with other case,
+    accents or spaces)."""
+
+    rng = random.Random(count)
+    words = ['gato', 'abuela', 'tostada', 'impuestos', 'dragón', 'lunes', 'karaoke', 'vecino']
+    texts: list[str] = []
+    for i in range(count):
+        if i and i % 10 == 0:
+            texts.append('  ' + rng.choice(texts).upper().replace('Ó', 'O'))
+        else:
+            texts.append(f'{i} ' + ' '.join(rng.choices(words, k=4)))
+    return texts
+
+
+def dedupe(texts: list[str]) -> list[str]:
+    seen = Deduplicator()
+    for text in texts:
+        seen.add(text)
+    return seen.kept
+
+
+def sorted_scan(texts: list[str]) -> list[str]:
+    """The approach of tests/remove_duplicates_test.py: sort, then keep every
+    text that differs from the one before it (the first of each, by
+    position, to keep the same cards as dedupe)."""
+
+    keys = sorted((normalize_text(text), i) for i, text in enumerate(texts))
+    kept = [keys[0][1]]
+    for (previous, _), (key, i) in zip(keys, keys[1:]):
+        if key != previous:
+            kept.append(i)
+    kept.sort()
+    return [texts[i] for i in kept]
+
+
+def dedupe_cases(workdir: Path) -> Iterator[Case]:
+    for size in DEDUPE_SIZES:
+        texts = repeated_texts(size)
+        yield Case(f'Deduplicator[{size}]', lambda texts=texts: dedupe(texts))
+        yield Case(f'sorted_scan[{size}]', lambda texts=texts: sorted_scan(texts))
+
+    size = DEDUPE_SIZES[0]
+    decks = workdir / 'packs'
+    decks.mkdir()
+    packs = [f'pack-{i}' for i in range(PACK_COUNT)]
+    for i, pack in enumerate(packs):
+        # The packs share their black cards and a tenth of their white cards
+        data = deck_json(size // PACK_COUNT)
+        data['whiteCards'] = [text if j % 10 == 0 else f'{i}-{text}' for j, text in enumerate(data['whiteCards'])]
+        (decks / f'{pack}.json').write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    merged = workdir / 'merged.cahd'
+    merge_packs(packs, decks, merged)  # Compiles the packs once
+    yield Case(f'merge_packs[{PACK_COUNT}x{size // PACK_COUNT}]', lambda: merge_packs(packs, decks, merged))
+
+
+def matchmaking_cases() -> Iterator[Case]:
+    rng = random.Random(QUEUED_PLAYERS)
+    keys = [QueueKey(f'deck-{deck}', hand, rounds) for deck in range(5) for hand in (4, 5, 6, 8) for rounds in (3, 5, 10)]
+    players = [(uuid4(), rng.choice(keys)) for _ in range(QUEUED_PLAYERS)]
+
+    def arrivals() -> None:
+        matchmaker = Matchmaker(3, max_wait=None)
+        for i, (player, key) in enumerate(players):
+            matchmaker.enqueue(player, key)
+            if i % 5 == 4:
+                # One in five gives up before being matched
+                matchmaker.cancel(players[i - 2][0])
+
+    def deep_queue() -> None:
+        # Everyone waits in the same queue until it is matched at once
+        matchmaker = Matchmaker(3, room_size=QUEUED_PLAYERS, max_wait=None)
+        for player, _ in players:
+            matchmaker.enqueue(player, keys[0])
+
+    yield Case(f'Matchmaker.enqueue[{QUEUED_PLAYERS}]', arrivals)
+    yield Case(f'Matchmaker.enqueue[one queue, {QUEUED_PLAYERS}]', deep_queue)
+
+
+def measure(case: Case) -> float:
+    """Best time per call, in seconds."""
+
+    timer = timeit.Timer(case.run)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=REPEAT, number=number)) / number
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('µs', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.2f} {unit}'
+    return f'{seconds / 1e-9:.0f} ns'
+
+
+def load_baseline(path: Path) -> dict[str, float]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths of the game.')
+    parser.add_argument('-k', dest='pattern', default='', help='Only run the cases whose name contains this')
+    parser.add_argument('--save', action='store_true', help='Save the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='Allowed slowdown (0.2 is 20%%)')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    return parser.parse_args()
+
+
+def main_bench() -> int:
+    args = parse_args()
+    baseline = load_baseline(args.baseline)
+    results: dict[str, float] = {}
+    regressions: list[str] = []
+
+    print(f'{"case":<52}{"time":>12}{"baseline":>12}{"change":>9}')
+    with tempfile.TemporaryDirectory() as workdir:
+        cases = [
+            *deck_cases(Path(workdir)),
+            *game_cases(Path(workdir)),
+            *state_cases(),
+            *recovery_cases(Path(workdir)),
+            *dedupe_cases(Path(workdir)),
+            *matchmaking_cases(),
+        ]
+        for case in cases:
+            if args.pattern not in case.name:
+                continue
+            results[case.name] = seconds = measure(case)
+            line = f'{case.name:<52}{format_time(seconds):>12}'
+            if case.name in baseline:
+                change = seconds / baseline[case.name] - 1
+                flag = ''
+                if change > args.threshold:
+                    regressions.append(case.name)
+                    flag = '  REGRESSION'
+                line += f'{format_time(baseline[case.name]):>12}{change:>+9.1%}{flag}'
+            print(line, flush=True)
+
+    if args.save:
+        args.baseline.write_text(json.dumps({**baseline, **results}, indent=2, sort_keys=True) + '\n')
+        print(f'Saved {len(results)} results to {args.baseline}')
+    if regressions:
+        print(f'{len(regressions)} cases are more than {args.threshold:.0%} slower than the baseline')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_bench())
@@ -0,0 +1,62 @@
+"""Compares the binary Message codec with the JSON path it replaces.
+
+    python benchmarks/codec_bench.py
+"""
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / 'multiplayer'))
+
+from codec import BINARY_CODEC, JSON_CODEC  # noqa: E402
+from models import Message, NetworkRequest, Player  # noqa: E402
+
+
+NUMBER: int = 20_000
+
+MESSAGES: dict[str, Message] = {
+    'ACK': Message(type=NetworkRequest.ACK),
+    'SET_PLAYER_INFO': Message(
+        type=NetworkRequest.SET_PLAYER_INFO,
+        data=Player(name='Jugador', color='red').model_dump(mode='json'),
+    ),
+    'STATE_DELTA': Message(type=NetworkRequest.STATE_DELTA, data={
+        'from_version': 41,
+        'version': 42,
+        'deltas': [{'kind': 'score', 'player_id': '2b1e8f9e-3f7a-4c1e-9a55-0f5a1c9d2e11', 'score': 3}],
+    }),
+}
+
+
+def json_encode(message: Message) -> str:
+    return message.model_dump_json()
+
+
+def json_decode(frame: str) -> Message:
+    return Message.model_validate(json.loads(frame))
+
+
+def per_call_us(statement, number: int = NUMBER) -> float:
+    return min(timeit.repeat(statement, number=number, repeat=3)) / number * 1e6
+
+
+def main() -> None:
+    print(f'{"message":<18}{"path":<9}{"encode µs":>11}{"decode µs":>11}{"bytes":>8}')
+    for name, message in MESSAGES.items():
+        frame = json_encode(message)
+        print(f'{name:<18}{"json":<9}'
+              f'{per_call_us(lambda: json_encode(message)):>11.2f}'
+              f'{per_call_us(lambda: json_decode(frame)):>11.2f}'
+              f'{len(frame.encode()):>8}')
+        for path, codec in (('json v1', JSON_CODEC), ('binary', BINARY_CODEC)):
+            encoded = codec.encode(message)
+            assert codec.decode(encoded).model_dump() == message.model_dump()
+            print(f'{"":<18}{path:<9}'
+                  f'{per_call_us(lambda: codec.encode(message)):>11.2f}'
+                  f'{per_call_us(lambda: codec.decode(encoded)):>11.2f}'
+                  f'{len(encoded):>8}')
+
+
+if __name__ == '__main__':
+    main()
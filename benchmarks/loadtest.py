@@ -0,0 +1,322 @@
+"""Puts load on the multiplayer server with scripted clients.
+
+Starts a local server (or targets --uri) and fills rooms with synthetic
+clients. Every room is created by one of its clients with CREATE_ROOM and the
+rest connect to its path. Each client then goes through the same handshake as
+multiplayer/client.py (SET_PLAYER_INFO -> ACK, GET_GAME_STATE, GET_DECK if
+the deck is not cached yet) and plays --rounds rounds of READY, START and
+SET_PLAYER_CHOICES.
+
+Reports the latency of every request type that gets a reply, the messages
+per second (sent and received) and the peak RSS of the server processes.
+
+    python benchmarks/loadtest.py --clients 2000 --players 4 --rounds 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+
+MULTIPLAYER_PATH = Path(__file__).parent.parent / 'multiplayer'
+sys.path.append(str(MULTIPLAYER_PATH))
+
+from websockets.asyncio.client import ClientConnection, connect  # noqa: E402
+from websockets.exceptions import ConnectionClosed  # noqa: E402
+
+from codec import BINARY_SUBPROTOCOL, JSON_SUBPROTOCOL, MAX_MESSAGE_SIZE, codec_for  # noqa: E402
+from deckcache import DeckCache, decode_deck  # noqa: E402
+from models import Deck, Message, NetworkRequest, Player  # noqa: E402
+from server import DEFAULT_HOST, MIN_PLAYER_COUNT  # noqa: E402
+
+
+DEFAULT_PORT: int = 8799
+DEFAULT_DECK: str = 'CAH-ES'
+COLORS: list[str] = ['red', 'blue', 'green', 'yellow']
+# Replies the server may send to each request
+REPLIES: dict[NetworkRequest, tuple[NetworkRequest, ...]] = {
+    NetworkRequest.CREATE_ROOM: (NetworkRequest.CREATE_ROOM,),
+    NetworkRequest.JOIN_ROOM: (NetworkRequest.JOIN_ROOM,),
+    NetworkRequest.SET_PLAYER_INFO: (NetworkRequest.ACK,),
+    NetworkRequest.GET_GAME_STATE: (NetworkRequest.GET_GAME_STATE,),
+    NetworkRequest.GET_DECK: (NetworkRequest.GET_DECK,),
+    NetworkRequest.READY: (NetworkRequest.READY,),
+    # Only the START that starts the round gets a START: the rest are refused
+    NetworkRequest.START: (NetworkRequest.START, NetworkRequest.DISCONNECT),
+}
+
+
+@dataclass
+class Stats:
+    latencies: dict[NetworkRequest, list[float]] = field(default_factory=lambda: defaultdict(list))
+    sent: int = 0
+    received: int = 0
+    errors: int = 0
+    games: int = 0
+
+    def report(self, elapsed: float) -> str:
+        lines = [f'{"request":<20}{"count":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}']
+        for request, samples in sorted(self.latencies.items(), key=lambda item: int(item[0].value)):
+            samples.sort()
+            lines.append(
+                f'{request.name:<20}{len(samples):>8}'
+                + ''.join(f'{percentile(samples, p) * 1000:>10.2f}' for p in (50, 95, 99))
+            )
+        lines.append('')
+        lines.append(f'{self.games} games in {elapsed:.2f}s, {self.errors} errors')
+        lines.append(f'{self.sent} sent, {self.received} received, {(self.sent + self.received) / elapsed:,.0f} msgs/s')
+        return '\n'.join(lines)
+
+
+def percentile(samples: list[float], p: float) -> float:
+    """Nearest rank percentile of sorted samples."""
+
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+class SyntheticClient:
+    """A scripted player. A reader task matches every reply with the request
+    waiting for it; pushed messages (STATE_DELTA, COUNTDOWN) are only counted."""
+
+    def __init__(self, websocket: ClientConnection, stats: Stats, decks: DeckCache) -> None:
+        self.websocket = websocket
+        self.codec = codec_for(websocket)
+        self.stats = stats
+        self.pending: dict[NetworkRequest, deque[asyncio.Future[Message]]] = defaultdict(deque)
+        # Shared by every client: once a deck is in it, no client downloads it again
+        self.decks = decks
+        self.deck: Deck | None = None
+        # Last black card drawn: its pick is the number of cards to play
+        self.black_card_id: int | None = None
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+        try:
+            async for frame in self.websocket:
+                self.stats.received += 1
+                message = self.codec.decode(frame)
+                if message.type is NetworkRequest.STATE_DELTA:
+                    for delta in message.data['deltas']:
+                        if delta['kind'] == 'black_card':
+                            self.black_card_id = delta['card_id']
+                waiting = self.pending.get(message.type)
+                # Requests waiting for several replies stay in every queue
+                while waiting and waiting[0].done():
+                    waiting.popleft()
+                if waiting:
+                    waiting.popleft().set_result(message)
+                elif message.type is NetworkRequest.DISCONNECT:
+                    break
+        except ConnectionClosed:
+            pass
+        finally:
+            for waiting in self.pending.values():
+                for future in waiting:
+                    if not future.done():
+                        future.set_exception(ConnectionError('Connection closed'))
+
+    async def send(self, message: Message) -> None:
+        self.stats.sent += 1
+        await self.websocket.send(self.codec.encode(message), text=self.codec.text)
+
+    async def request(self, message: Message) -> Message:
+        """Sends a request, waits for its reply and records the latency."""
+
+        future = asyncio.get_running_loop().create_future()
+        for reply in REPLIES[message.type]:
+            self.pending[reply].append(future)
+        start = time.perf_counter()
+        await self.send(message)
+        reply = await future
+        self.stats.latencies[message.type].append(time.perf_counter() - start)
+        return reply
+
+    async def handshake(self, name: str) -> None:
+        player = Player(name=name, color=random.choice(COLORS))
+        await self.request(Message(type=NetworkRequest.SET_PLAYER_INFO, data=player.model_dump(mode='json')))
+        state = await self.request(Message(type=NetworkRequest.GET_GAME_STATE))
+        digest = state.data['state']['settings']['deck_digest']
+        self.deck = self.decks.get(digest)
+        if self.deck is None:
+            reply = await self.request(Message(type=NetworkRequest.GET_DECK, data={'digest': digest}))
+            self.deck = self.decks.put(digest, decode_deck(reply.data['deck']))
+
+    @property
+    def pick(self) -> int:
+        if self.deck is None or self.black_card_id is None:
+            return 1
+        return self.deck.table.pick(self.black_card_id)
+
+    async def play(self, rounds: int) -> None:
+        for _ in range(rounds):
+            await self.request(Message(type=NetworkRequest.READY))
+            await self.request(Message(type=NetworkRequest.START))
+            # The server does not reply to the choices
+            await self.send(Message(type=NetworkRequest.SET_PLAYER_CHOICES, data={'cards': list(range(self.pick))}))
+
+    async def close(self) -> None:
+        await self.websocket.close()
+        await self.reader
+
+
+async def play_room(
+    uri: str,
+    args: argparse.Namespace,
+    stats: Stats,
+    decks: DeckCache,
+    connecting: asyncio.Semaphore,
+) -> None:
+    subprotocols = [BINARY_SUBPROTOCOL if args.codec == 'binary' else JSON_SUBPROTOCOL]
+    clients: list[SyntheticClient] = []
+    try:
+        async with connecting:
+            creator = SyntheticClient(await connect(uri, subprotocols=subprotocols, max_size=MAX_MESSAGE_SIZE), stats, decks)
+        clients.append(creator)
+        reply = await creator.request(Message(type=NetworkRequest.CREATE_ROOM, data={'deck': args.deck}))
+        room_uri = f'{uri.rstrip("/")}/{reply.data["room"]}'
+        for _ in range(args.players - 1):
+            async with connecting:
+                clients.append(SyntheticClient(await connect(room_uri, subprotocols=subprotocols, max_size=MAX_MESSAGE_SIZE), stats, decks))
+
+        await asyncio.gather(*(client.handshake(f'bot-{index}') for index, client in enumerate(clients)))
+        await asyncio.gather(*(client.play(args.rounds) for client in clients))
+        stats.games += 1
+    except (OSError, ConnectionError, ConnectionClosed) as error:
+        stats.errors += 1
+        if stats.errors == 1:
+            print(f'First error: {error!r}', file=sys.stderr)
+    finally:
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+
+
+def process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    for child in Path(f'/proc/{pid}/task/{pid}/children').read_text().split():
+        pids.extend(process_tree(int(child)))
+    return pids
+
+
+def peak_rss_kb(pid: int) -> int | None:
+    """Sum of the peak resident set size (VmHWM) of a process and its
+    children. Only available on Linux."""
+
+    try:
+        total = 0
+        for process in process_tree(pid):
+            for line in Path(f'/proc/{process}/status').read_text().splitlines():
+                if line.startswith('VmHWM:'):
+                    total += int(line.split()[1])
+        return total
+    except (OSError, ValueError):
+        return None
+
+
+def listening(host: str, port: int) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+def start_server(host: str, port: int, workers: int) -> subprocess.Popen:
+    if listening(host, port):
+        raise RuntimeError(f'Something is already listening on {host}:{port}')
+    server = subprocess.Popen(
+        # Not through main.py so the client (and its terminal dependencies)
+        # is not imported
+        [
+            sys.executable, '-c',
+            'import sys; from workers import serve_workers; '
+            'serve_workers(int(sys.argv[1]), sys.argv[2], int(sys.argv[3]))',
+            str(workers), host, str(port),
+        ],
+        cwd=MULTIPLAYER_PATH,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        # Its own process group, to stop the workers along with it
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        if listening(host, port):
+            return server
+        time.sleep(0.1)
+    stop_server(server)
+    raise RuntimeError(f'The server did not start listening on {host}:{port}')
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    os.killpg(server.pid, signal.SIGTERM)
+    server.wait()
+
+
+def raise_file_limit(needed: int) -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+
+async def run(args: argparse.Namespace, uri: str) -> Stats:
+    stats = Stats()
+    connecting = asyncio.Semaphore(args.concurrency)
+    rooms = max(1, args.clients // args.players)
+    with tempfile.TemporaryDirectory() as directory:
+        decks = DeckCache(Path(directory))
+        await asyncio.gather(*(play_room(uri, args, stats, decks, connecting) for _ in range(rooms)))
+    return stats
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Load test the multiplayer server.')
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--players', type=int, default=4, help='Clients per room')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--codec', choices=['binary', 'json'], default='binary')
+    parser.add_argument('--deck', default=DEFAULT_DECK)
+    parser.add_argument('--concurrency', type=int, default=200, help='Connections opened at the same time')
+    parser.add_argument('--workers', type=int, default=1, help='Server worker processes')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--uri', help='Test a running server instead of starting one')
+    parser.add_argument('--server-pid', type=int, help='Pid of the --uri server, to report its RSS')
+    args = parser.parse_args()
+    if args.players < MIN_PLAYER_COUNT:
+        parser.error(f'Rooms need at least {MIN_PLAYER_COUNT} players')
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    raise_file_limit(args.clients * 2 + 256)
+
+    server = None
+    uri, server_pid = args.uri, args.server_pid
+    if uri is None:
+        server = start_server(args.host, args.port, args.workers)
+        uri, server_pid = f'ws://{args.host}:{args.port}', server.pid
+    try:
+        start = time.perf_counter()
+        stats = asyncio.run(run(args, uri))
+        elapsed = time.perf_counter() - start
+        print(stats.report(elapsed))
+        if server_pid is not None and (rss := peak_rss_kb(server_pid)) is not None:
+            print(f'Server peak RSS: {rss / 1024:.1f} MiB')
+    finally:
+        if server is not None:
+            stop_server(server)
+
+
+if __name__ == '__main__':
+    main()
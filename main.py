@@ -1,14 +1,24 @@
-from json import load
+from pathlib import Path
 from html import unescape
-from pydantic import BaseModel, AfterValidator
+from array import array
+from pydantic import BaseModel, AfterValidator, Field
 from pydantic.dataclasses import dataclass
-from typing import Annotated, Optional
+from typing import Annotated, Callable, Optional, TypeVar
 from enum import Enum, auto
 from itertools import cycle
+import argparse
 import random
+import warnings
+
+from multiplayer.cards import CardIds, CardTable, Deduplicator, card_ids
+from multiplayer.deckfile import ensure_compiled, load_compiled
+from multiplayer.drawing import DrawPile, CAHDrawingListEmpty, seeded_rng
+from multiplayer.profiler import DEFAULT_PROFILE_DIR, DEFAULT_RATE, Profiler
+from multiplayer.screen import BOLD, CARD_WIDTH, Screen, draw_black_card, draw_cards, draw_scoreboard
 
 MAX_LENGTH_USER = 100
 HAND_SIZE = 5
+WINNING_POINTS = 5
 
 class TypePlayer(Enum):
     ZAR    = auto()
@@ -19,7 +29,9 @@ class Card(BaseModel):
     text: Annotated[str, AfterValidator(unescape)]
     
     def __eq__(self, value: object) -> bool:
-        return self.text == value
+        if not isinstance(value, Card):
+            return NotImplemented
+        return self.text == value.text
     
     def __hash__(self) -> int:
         return hash(self.text)
@@ -31,6 +43,9 @@ class BlackCard(Card):
     pick: int
 
 
+CardType = TypeVar('CardType', bound=Card)
+
+
 class Player(BaseModel):
     player_id: int 
     name: Annotated[str, AfterValidator(lambda s: s if len(s) < MAX_LENGTH_USER else s[:MAX_LENGTH_USER])]
@@ -38,7 +53,7 @@ class Player(BaseModel):
     
     points: int = 0
     
-    cards: list[WhiteCard] = []
+    cards: CardIds = Field(default_factory=card_ids)
     
     
     def set_zar(self):
@@ -49,55 +64,66 @@ class Player(BaseModel):
         self.player_type = TypePlayer.NORMAL
         return self
 
-    def show_white_cards(self):
-        for i, card in enumerate(self.cards):
-            print(
-f'''  +{'-'*(len(card.text) + 2)}+
-{i+1} | {card.text} |
-  +{'-'*(len(card.text) + 2)}+''')
+    def show_white_cards(self, table: CardTable, screen: Screen, y: int) -> int:
+        return draw_cards(screen, 0, y, [table.white_text(card_id) for card_id in self.cards])
             
-    def select_cards(self, pick: int):
+    def select_cards(self, pick: int, ask: Callable[[str], str] = input) -> list[int]:
         picked_cards: set[int] = set()
-        print(f'Cartas del jugador {self.name}')
         for p in range(pick):
-            index: int = int(input(f'Selecciona la carta {p+1}: '))
+            index: int = int(ask(f'{self.name}, selecciona la carta {p+1}: '))
             while index < 1 or index > HAND_SIZE:
-                index = int(input(f'Índice inválido. Vuelva a seleccionarla: '))
+                index = int(ask(f'Índice inválido. Vuelva a seleccionarla: '))
             if index in picked_cards:
-                index = int(input(f'Carta ya introducida. Vuelva a seleccionarla: '))
+                index = int(ask(f'Carta ya introducida. Vuelva a seleccionarla: '))
             picked_cards.add(index)
         return [card for i, card in enumerate(self.cards) if (i + 1) in picked_cards]
 
 
-def check_no_repeating(cards: list[Card]) -> list[Card]:
-        card_set: list[Card] = list(set(cards))
-        if len(card_set) < len(cards):
-            raise ValueError('Hay cartas repetidas')
-        return cards
+def check_no_repeating(cards: list[CardType]) -> list[CardType]:
+    # Las cartas repetidas (mismo texto normalizado) se quitan y se avisa de
+    # ellas en vez de rechazar la baraja entera
+    seen = Deduplicator()
+    unique: list[CardType] = []
+    repeated: list[str] = []
+    for card in cards:
+        if seen.add(card.text) is None:
+            unique.append(card)
+        else:
+            repeated.append(card.text)
+    if repeated:
+        warnings.warn(f'Se han quitado {len(repeated)} cartas repetidas: {repeated[:5]}')
+    return unique
 
 @dataclass
 class Deck:
     black_cards: Annotated[list[BlackCard], AfterValidator(check_no_repeating)]
     white_cards: Annotated[list[WhiteCard], AfterValidator(check_no_repeating)]
     
-    def shuffle_cards(self, seed: Optional[int] = None, num_shuffles: Optional[int] = None) -> None:
+    def __post_init__(self) -> None:
+        self.table = CardTable(
+            white_texts=(card.text for card in self.white_cards),
+            black_texts=(card.text for card in self.black_cards),
+            picks=(card.pick for card in self.black_cards),
+        )
+        self.shuffle_cards(random.SystemRandom().getrandbits(64))
+    
+    def shuffle_cards(self, seed: Optional[int] = None) -> None:
+        # Los montones sacan las cartas al azar con sus propios generadores
+        # (un único Fisher-Yates perezoso), así que barajar es sembrarlos
         if seed is None:
             seed = 0
-        if num_shuffles is None:
-            num_shuffles = 5
-        random.seed(seed)
-        shuffle = 0
-        while shuffle < num_shuffles:
-            random.shuffle(self.black_cards)
-            random.shuffle(self.white_cards)
-            shuffle += 1
+        self.black_pile: DrawPile[BlackCard] = DrawPile(self.black_cards, seeded_rng(seed, 'black'))
+        self.white_pile: DrawPile[str] = DrawPile(self.table.white_texts, seeded_rng(seed, 'white'))
             
     def draw_black_card(self) -> Optional[BlackCard]:
         try:
-            return self.black_cards.pop()
-        except IndexError:
+            return self.black_pile.draw()[0]
+        except CAHDrawingListEmpty:
             return None
         
+    def draw_white_ids(self, total: int = 1) -> array:
+        return self.white_pile.draw_ids(total)
+        
 
 class Game:
     players: list[Player]
@@ -107,16 +133,20 @@ class Game:
     
     used_deck: Deck
     
-    def __init__(self, players: list[Player], deck: Deck):
+    def __init__(self, players: list[Player], deck: Deck, seed: Optional[int] = None, screen: Optional[Screen] = None):
         self.players = players
         self.deck = deck
+        self.screen = screen if screen is not None else Screen()
+        # Se muestra encima de la carta negra (el ganador de la última ronda)
+        self.status = ''
+        self.rng = seeded_rng(seed, 'game') if seed is not None else random.Random()
         self.player_ordering_list: list[int] = []
         self.random_zar()
         self.used_deck = Deck(white_cards=[], black_cards=[])
         self.init_game()
 
     def random_zar(self):
-        self.zar = random.choice(self.players).set_zar()
+        self.zar = self.rng.choice(self.players).set_zar()
             
         zar_id = self.zar.player_id
         for i in range(len(self.players)):
@@ -127,74 +157,74 @@ class Game:
         
         
     def init_game(self):
-        for _ in range(HAND_SIZE):
-            for player in self.players:
-                choice = random.choice(self.deck.white_cards)
-                player.cards.append(choice)
-                self.deck.white_cards.remove(choice)
-    
-    def show_choices(self, choices: list[tuple[Player, list[WhiteCard]]]):
-        for i, choice in enumerate(choices):
-            for j in range(len(choice[1])):
-                print(
-f'''  +{'-'*(len(choice[1][j].text) + 2)}+
-{i+1 if j == 0 else ' '} | {choice[1][j].text} |
-  +{'-'*(len(choice[1][j].text) + 2)}+''', end='\n')
-            print()
-        
+        for player in self.players:
+            player.cards.extend(self.deck.draw_white_ids(HAND_SIZE))
     
+    def show_choices(self, choices: list[tuple[Player, list[int]]], y: int) -> int:
+        # Las respuestas de varias cartas van en una sola
+        texts = [' / '.join(self.deck.table.white_text(card) for card in cards) for _, cards in choices]
+        return draw_cards(self.screen, 0, y, texts)
+
+    def draw_round(self, black_card: BlackCard, title: str) -> int:
+        """Dibuja la carta negra, el marcador y el título de la ronda, y
+        devuelve la primera fila libre debajo."""
+
+        screen = self.screen
+        screen.fit_terminal()
+        screen.clear()
+        screen.text(0, 0, self.status, BOLD)
+        height = draw_black_card(screen, 0, 1, black_card.text, f'Escoge {black_card.pick}')
+        self.show_scoreboard(max(CARD_WIDTH * 2 + 2, screen.width - CARD_WIDTH), 1)
+        screen.text(0, height + 2, f'El ZAR es {self.zar.name}. {title}', BOLD)
+        return height + 4
     
     def play(self):
-        print(f'El ZAR es {self.zar.name}')
         black_card: Optional[BlackCard] = self.deck.draw_black_card()
         if black_card is None:
             raise RuntimeError('No quedan cartas negras')
-        print(f'Hay que escoger {black_card.pick} cartas en esta ronda.')
-        print(f'CARTA NEGRA: {black_card.text.replace('_', '_'*5)}')
         actual_players: list[Player] = list(filter(lambda player: player.player_type != TypePlayer.ZAR, self.players))
-        choices: list[tuple[Player, list[WhiteCard]]] = []
+        choices: list[tuple[Player, list[int]]] = []
         self.get_player_choices(black_card, actual_players, choices)
-        random.shuffle(choices)
-        self.show_choices(choices)
-        winner = int(input(f'ZAR {self.zar.name}, elige la mejor respuesta para tu gusto: '))
-        while winner not in range(1, len(actual_players) + 1):
-            winner = int(input(f'Introduce una opción correcta: (1-{len(actual_players) + 1})'))
-        print(f'El ganador de esta ronda es {choices[winner - 1][0].name}!!')
-        choices[winner - 1][0].points += 1
+        self.judge(black_card, choices)
         self.next_zar()
         self.draw_new_cards(black_card, actual_players)
 
+    def judge(self, black_card: BlackCard, choices: list[tuple[Player, list[int]]]) -> None:
+        self.rng.shuffle(choices)
+        self.show_choices(choices, self.draw_round(black_card, 'Respuestas:'))
+        ask = self.screen.input
+        winner = int(ask(f'ZAR {self.zar.name}, elige la mejor respuesta para tu gusto: '))
+        while winner not in range(1, len(choices) + 1):
+            winner = int(ask(f'Introduce una opción correcta: (1-{len(choices)}) '))
+        self.status = f'El ganador de la última ronda es {choices[winner - 1][0].name}!!'
+        choices[winner - 1][0].points += 1
+
     def draw_new_cards(self, black_card: BlackCard, actual_players: list[Player]):
         for player in actual_players:
-            for _ in range(black_card.pick):
-                new_card = random.choice(self.deck.white_cards)
-                player.cards.append(new_card)
-                self.deck.white_cards.remove(new_card)
+            player.cards.extend(self.deck.draw_white_ids(black_card.pick))
 
     def next_zar(self):
         self.zar.set_normal()
         self.zar = self.players[next(self.player_ordering)].set_zar() #type: ignore
 
-    def get_player_choices(self, black_card: BlackCard, actual_players: list[Player], choices: list[tuple[Player, list[WhiteCard]]]) -> None:
+    def get_player_choices(self, black_card: BlackCard, actual_players: list[Player], choices: list[tuple[Player, list[int]]]) -> None:
         for player in actual_players:
-            print(f'Turno de {player.name}')
-            player.show_white_cards()
-            selected_cards = player.select_cards(black_card.pick)
+            y = self.draw_round(black_card, f'Turno de {player.name}:')
+            player.show_white_cards(self.deck.table, self.screen, y)
+            selected_cards = player.select_cards(black_card.pick, self.screen.input)
             choices.append((player, selected_cards))
             for card in selected_cards:
                 player.cards.remove(card)
         
         
-    def show_scoreboard(self):
-        for player in self.players:
-            print('-'*20)
-            print(f'{player.name}: {player.points}')
-        print('-'*20)
+    def show_scoreboard(self, x: int, y: int) -> int:
+        scores = [(player.name, player.points, BOLD if player is self.zar else '') for player in self.players]
+        return draw_scoreboard(self.screen, x, y, scores, 'Puntos')
             
     @property
     def winner(self) -> Optional[Player]:
         for player in self.players:
-            if player.points == 5:
+            if player.points == WINNING_POINTS:
                 return player
         return None
     
@@ -203,16 +233,34 @@ f'''  +{'-'*(len(choice[1][j].text) + 2)}+
         
 
 def get_deck() -> Deck:
-    with open('./decks/CAH.json', 'r', encoding='utf-8') as cah_file:
-        json_deck = load(cah_file)
-        deck = Deck(
-            white_cards=[WhiteCard(text=_) for _ in json_deck['whiteCards']],
-            black_cards=[BlackCard(text=card["text"], pick=card["pick"]) for card in json_deck['blackCards']]
-        )
-        return deck
+    # El fichero compilado ya tiene los textos sin escapar, así que las cartas
+    # se crean sin volver a validarlas
+    compiled = load_compiled(ensure_compiled(Path('./decks/CAH.json')))
+    deck = Deck(
+        white_cards=[WhiteCard.model_construct(text=text) for text in compiled.white_texts],
+        black_cards=[BlackCard.model_construct(text=text, pick=pick) for text, pick in zip(compiled.black_texts, compiled.picks)]
+    )
+    return deck
         
 
-def main() -> None:
+def tag_game(profiler: Profiler) -> None:
+    # Mismas fases que en el modo multijugador (multiplayer/models.py)
+    profiler.tag(Game.get_player_choices, lambda frame: {'phase': 'PLAY_CARDS'})
+    profiler.tag(Game.judge, lambda frame: {'phase': 'JUDGEMENT'})
+    profiler.tag(Game.draw_new_cards, lambda frame: {'phase': 'SETUP'})
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Cards Against Humanity')
+    parser.add_argument(
+        '--profile', nargs='?', type=Path, const=DEFAULT_PROFILE_DIR, metavar='DIR',
+        help=f'Muestrea la partida y escribe las pilas para flame graphs aquí (por defecto: {DEFAULT_PROFILE_DIR})',
+    )
+    parser.add_argument('--profile-rate', type=float, default=DEFAULT_RATE, help='Muestras por segundo')
+    return parser.parse_args()
+
+
+def main(profiler: Optional[Profiler] = None) -> None:
     deck: Deck = get_deck()
     num_players = int(input('Introduce el número de jugadores: '))
     players: list[Player] = []
@@ -221,28 +269,30 @@ def main() -> None:
         players.append(Player(name=name, player_id=player))
         
     seed: Optional[int] = None
-    num_shuffles: Optional[int] = None
     try:
         seed = int(input('Introduce una semilla (opcional): '))
     except ValueError:
         seed = random.randint(0, 100000)
-    try:
-        num_shuffles = int(input('Introduce el número de barajeos (opcional): '))
-    except ValueError:
-        num_shuffles = random.randint(1, 5)
-    deck.shuffle_cards(seed=seed, num_shuffles=num_shuffles)
+    deck.shuffle_cards(seed=seed)
     
-    game = Game(players=players, deck=deck)   
+    game = Game(players=players, deck=deck, seed=seed)   
     
-    print('-------------------------------------')
-    print('Orden de Zar: ', ' -> '.join([players[next(game.player_ordering)].name for _ in range(num_players)])) #type: ignore
-    print('-------------------------------------')
+    game.status = 'Orden de Zar: ' + ' -> '.join([players[next(game.player_ordering)].name for _ in range(num_players)]) #type: ignore
     
-    while not game.end():
-        game.play()
-        game.show_scoreboard()
+    with game.screen:
+        while not game.end():
+            game.play()
     
-    print(f'¡¡¡El ganador es {game.winner}!!!')
+    print(f'¡¡¡El ganador es {game.winner.name}!!!')  # type: ignore[union-attr]
+    if profiler is not None and (path := profiler.write('game')) is not None:
+        print(f'Perfil de la partida en {path}')
     
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    args = parse_args()
+    if args.profile is None:
+        main()
+    else:
+        profiler = Profiler(args.profile, args.profile_rate)
+        tag_game(profiler)
+        with profiler:
+            main(profiler)
\ No newline at end of file
@@ -0,0 +1,217 @@
+"""Full-text search over the cards of every deck.
+
+Every compiled deck (see deckfile.py) gets an index file next to it with the
+trigrams of its normalized card texts (case folded, without accents and with
+single spaces). A trigram is stored as its CRC32, so a lookup is a binary
+search over integers straight from the mmap; the few cards that share a hash
+by chance are filtered out when the candidates are checked against the text.
+
+Layout (little-endian):
+
+- Header: magic, version, trigram count, posting count.
+- Trigram hashes: one uint32 per trigram, sorted.
+- Posting offsets: one uint32 per trigram plus a final one.
+- Postings: uint32 card numbers (black cards first, then white cards).
+
+Indexes are rebuilt like compiled decks, only when their deck changed, so
+CardIndex.refresh() after editing one deck only indexes that deck again.
+
+    python multiplayer/cardindex.py "gato"
+"""
+import argparse
+import mmap
+import struct
+import sys
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Iterator, NamedTuple, Sequence
+
+from cards import normalize_text
+from deckfile import CAH_DECKS_PATH, CompiledDeck, compiled_path_for, ensure_compiled, load_compiled, replacing
+
+
+INDEX_EXTENSION: str = '.cahi'
+INDEX_MAGIC: bytes = b'CAHI'
+INDEX_VERSION: int = 1
+INDEX_HEADER = struct.Struct('<4sHxxII')
+NGRAM: int = 3
+
+
+def ngram_hashes(normalized: str) -> set[int]:
+    return {zlib.crc32(normalized[i:i + NGRAM].encode()) for i in range(len(normalized) - NGRAM + 1)}
+
+
+def index_path_for(json_path: Path) -> Path:
+    return compiled_path_for(json_path).with_suffix(INDEX_EXTENSION)
+
+
+def build_index(compiled: CompiledDeck, index_path: Path) -> Path:
+    postings: dict[int, array] = {}
+    texts = [*compiled.black_texts, *compiled.white_texts]
+    for number, text in enumerate(texts):
+        for key in ngram_hashes(normalize_text(text)):
+            postings.setdefault(key, array('I')).append(number)
+
+    keys = array('I', sorted(postings))
+    offsets = array('I', [0])
+    ids = array('I')
+    for key in keys:
+        ids.extend(postings[key])
+        offsets.append(len(ids))
+    if sys.byteorder != 'little':
+        for values in (keys, offsets, ids):
+            values.byteswap()
+
+    with replacing(index_path) as index_file:
+        index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(keys), len(ids)))
+        index_file.write(keys.tobytes())
+        index_file.write(offsets.tobytes())
+        index_file.write(ids.tobytes())
+    return index_path
+
+
+def ensure_indexed(json_path: Path) -> Path:
+    """Returns the index of a deck, (re)building it (and the compiled deck)
+    if it is missing or older than the deck."""
+
+    compiled_path = ensure_compiled(json_path)
+    index_path = index_path_for(json_path)
+    if not index_path.exists() or index_path.stat().st_mtime < compiled_path.stat().st_mtime:
+        build_index(load_compiled(compiled_path), index_path)
+    return index_path
+
+
+class CardMatch(NamedTuple):
+    deck: str
+    black: bool
+    # Position in the deck's black or white cards
+    card_id: int
+    text: str
+
+
+class DeckIndex:
+    """Index of one deck, memory-mapped: nothing is read until it is used."""
+
+    def __init__(self, name: str, compiled: CompiledDeck, index_path: Path) -> None:
+        self.name = name
+        self.compiled = compiled
+        self.mtime = index_path.stat().st_mtime_ns
+        with open(index_path, 'rb') as index_file:
+            view = memoryview(mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ))
+        magic, version, key_count, id_count = INDEX_HEADER.unpack_from(view)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f'{index_path} is not a card index (version {INDEX_VERSION})')
+        start = INDEX_HEADER.size
+        sections: list[Sequence[int]] = []
+        for count in (key_count, key_count + 1, id_count):
+            section: Sequence[int] = view[start:start + count * 4].cast('I')
+            if sys.byteorder != 'little':
+                section = array('I', section)
+                section.byteswap()
+            sections.append(section)
+            start += count * 4
+        self.keys, self.offsets, self.ids = sections
+
+    def __len__(self) -> int:
+        return len(self.compiled.black_texts) + len(self.compiled.white_texts)
+
+    def postings(self, key: int) -> Sequence[int]:
+        position = bisect_left(self.keys, key)
+        if position == len(self.keys) or self.keys[position] != key:
+            return ()
+        return self.ids[self.offsets[position]:self.offsets[position + 1]]
+
+    def candidates(self, keys: set[int]) -> Iterator[int]:
+        """Cards with every trigram of the query (or every card for queries
+        too short to have one)."""
+
+        if not keys:
+            yield from range(len(self))
+            return
+        # The rarest trigram first, so the intersection stays small
+        lists = sorted((self.postings(key) for key in keys), key=len)
+        if not lists[0]:
+            return
+        found = set(lists[0])
+        for ids in lists[1:]:
+            found.intersection_update(ids)
+            if not found:
+                return
+        yield from sorted(found)
+
+    def card(self, number: int) -> tuple[bool, int, str]:
+        black_count = len(self.compiled.black_texts)
+        if number < black_count:
+            return True, number, self.compiled.black_texts[number]
+        return False, number - black_count, self.compiled.white_texts[number - black_count]
+
+
+class CardIndex:
+    """Search index over every deck of a directory."""
+
+    def __init__(self, decks_path: Path = CAH_DECKS_PATH) -> None:
+        self.decks_path = decks_path
+        self.decks: dict[str, DeckIndex] = {}
+
+    def refresh(self) -> list[str]:
+        """Indexes the decks that were added or changed since the last
+        refresh and forgets the deleted ones. Returns the decks (re)loaded."""
+
+        updated: list[str] = []
+        present: set[str] = set()
+        for json_path in sorted(self.decks_path.glob('*.json')):
+            name = json_path.stem
+            present.add(name)
+            index_path = ensure_indexed(json_path)
+            current = self.decks.get(name)
+            if current is None or current.mtime != index_path.stat().st_mtime_ns:
+                self.decks[name] = DeckIndex(name, load_compiled(compiled_path_for(json_path)), index_path)
+                updated.append(name)
+        for name in self.decks.keys() - present:
+            del self.decks[name]
+        return updated
+
+    def search(self, query: str) -> Iterator[CardMatch]:
+        """Cards whose text contains the query, ignoring case, accents and
+        repeated spaces."""
+
+        normalized = normalize_text(query)
+        keys = ngram_hashes(normalized)
+        for deck in self.decks.values():
+            for number in deck.candidates(keys):
+                black, card_id, text = deck.card(number)
+                if normalized in normalize_text(text):
+                    yield CardMatch(deck.name, black, card_id, text)
+
+    def decks_matching(self, query: str) -> dict[str, int]:
+        """Number of matching cards of every deck with any."""
+
+        counts: dict[str, int] = {}
+        for match in self.search(query):
+            counts[match.deck] = counts.get(match.deck, 0) + 1
+        return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='search-cards', description='Find cards by their text in every deck.')
+    parser.add_argument('query')
+    parser.add_argument('--decks', type=Path, default=CAH_DECKS_PATH, help='Deck directory')
+    parser.add_argument('--limit', type=int, default=20, help='Cards shown (the count is always complete)')
+    args = parser.parse_args()
+
+    index = CardIndex(args.decks)
+    index.refresh()
+    start = time.perf_counter()
+    matches = list(index.search(args.query))
+    elapsed = time.perf_counter() - start
+    for match in matches[:args.limit]:
+        print(f'{match.deck:<20} {"black" if match.black else "white"} {match.card_id:>5}  {match.text}')
+    decks = {match.deck for match in matches}
+    print(f'{len(matches)} cards in {len(decks)} of {len(index.decks)} decks ({elapsed * 1000:.2f} ms)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import re
+import sys
+import unicodedata
+from array import array
+from typing import Annotated, Any, Iterable, Self, Sequence
+
+from pydantic import PlainSerializer, PlainValidator
+
+
+CARD_ID_TYPECODE: str = "I"
+# Accents and the other marks NFKD splits from their letters
+COMBINING_MARKS = re.compile("[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+
+
+def card_ids(ids: Iterable[int] = ()) -> array:
+    return array(CARD_ID_TYPECODE, ids)
+
+
+def _validate_card_ids(value: Any) -> array:
+    if isinstance(value, array) and value.typecode == CARD_ID_TYPECODE:
+        return value
+    return card_ids(value)
+
+
+# Hands, selections and piles are plain arrays of card ids: 4 bytes per card
+# instead of one pydantic model per card. They go through the wire as a list.
+CardIds = Annotated[
+    array,
+    PlainValidator(_validate_card_ids),
+    PlainSerializer(lambda ids: ids.tolist(), return_type=list[int]),
+]
+
+
+class CardTable:
+    """Immutable table with the text of every card of a deck.
+
+    White and black cards are identified by their position in the table. The
+    texts are interned once and the pick of each black card is stored in a
+    byte array, so a game only needs to keep card ids around and build a card
+    model out of them when it has to show or send it.
+    """
+
+    __slots__ = ("white_texts", "black_texts", "picks")
+
+    white_texts: Sequence[str]
+    black_texts: Sequence[str]
+    picks: Sequence[int]
+
+    def __init__(
+        self,
+        white_texts: Iterable[str],
+        black_texts: Iterable[str],
+        picks: Iterable[int],
+    ) -> None:
+        object.__setattr__(self, "white_texts", tuple(sys.intern(text) for text in white_texts))
+        object.__setattr__(self, "black_texts", tuple(sys.intern(text) for text in black_texts))
+        object.__setattr__(self, "picks", array("B", picks))
+        if len(self.picks) != len(self.black_texts):
+            raise ValueError("Every black card needs a pick")
+
+    @classmethod
+    def wrap(
+        cls,
+        white_texts: Sequence[str],
+        black_texts: Sequence[str],
+        picks: Sequence[int],
+    ) -> Self:
+        """Builds a table over sequences that are already built, without
+        copying them (e.g. the views over a memory-mapped compiled deck)."""
+
+        table = object.__new__(cls)
+        object.__setattr__(table, "white_texts", white_texts)
+        object.__setattr__(table, "black_texts", black_texts)
+        object.__setattr__(table, "picks", picks)
+        return table
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    @property
+    def white_count(self) -> int:
+        return len(self.white_texts)
+
+    @property
+    def black_count(self) -> int:
+        return len(self.black_texts)
+
+    def white_text(self, card_id: int) -> str:
+        return self.white_texts[card_id]
+
+    def black_text(self, card_id: int) -> str:
+        return self.black_texts[card_id]
+
+    def pick(self, card_id: int) -> int:
+        return self.picks[card_id]
+
+
+def normalize_text(text: str) -> str:
+    """Case folded text without accents and with single spaces: two cards
+    with the same normalized text are the same card."""
+
+    text = text.casefold()
+    if not text.isascii():
+        text = COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", text))
+    return " ".join(text.split())
+
+
+class Deduplicator:
+    """Keeps the first of every card text seen, in one pass.
+
+    Texts are compared by the hash of their normalized text, so nothing but
+    an int per card is kept to find repetitions. The texts are only compared
+    when their hashes match, and different texts that happen to share a hash
+    are still told apart.
+    """
+
+    def __init__(self) -> None:
+        # Texts kept, in the order they were first seen
+        self.kept: list[str] = []
+        self._first: dict[int, int] = {}
+        self._collisions: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.kept)
+
+    def add(self, text: str) -> int | None:
+        """Keeps a text and returns None, or returns the position in kept of
+        the same text if it was already seen."""
+
+        normalized = normalize_text(text)
+        kept = self.kept
+        position = len(kept)
+        first = self._first.setdefault(hash(normalized), position)
+        if first != position and normalize_text(kept[first]) != normalized:
+            # Another text with the same hash
+            first = self._collisions.setdefault(normalized, position)
+        if first == position:
+            kept.append(text)
+            return None
+        return first
@@ -2,12 +2,14 @@ from enum import Enum
 from websockets.asyncio.client import connect, ClientConnection
 from server import DEFAULT_HOST, DEFAULT_PORT, MIN_PLAYER_COUNT
 import ipaddress
-from models import NetworkRequest, Player, GameState, Message
+from models import NetworkRequest, Player, PlayerRole, GameState, Message
+from codec import MAX_MESSAGE_SIZE, SUBPROTOCOLS, recv_message, send_message
+from gameview import GameView
+from keyboard import ENTER, Keyboard
+from screen import Screen
 from loguru import logger
 from colorist import ColorRGB, BgColor
 import asyncio
-import msvcrt
-import threading
 import json
 
 
@@ -28,81 +30,136 @@ COLORS = {
 class PlayerHostType(str, Enum):
     HOST = 'host'
     PLAYER = 'player'
+    # Put in a room with other players by the server (see matchmaking.py)
+    MATCH = 'match'
+    # Only watches a game (see PlayerRole.SPECTATOR)
+    SPECTATE = 'spectate'
 
 PLAYER_HOST_TYPE = PlayerHostType.HOST
 
-async def client(player_host_type: PlayerHostType) -> None:
-    port = DEFAULT_PORT
-    host = DEFAULT_HOST
+async def client(
+    player_host_type: PlayerHostType,
+    room_code: str = '',
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+) -> None:
+    async with Keyboard() as keyboard:
+        if player_host_type is PlayerHostType.SPECTATE:
+            await spectate(keyboard, host, port)
+        else:
+            await join_game(keyboard, player_host_type, room_code, host, port)
+
+
+async def spectate(keyboard: Keyboard, host: str, port: int) -> None:
+    """Follows the game of a room without playing it."""
+
+    room_code = ''
+    while not room_code:
+        room_code = (await keyboard.line('Enter the room code: ')).strip().upper()
+    async with connect(f'ws://{host}:{port}/{room_code}', subprotocols=SUBPROTOCOLS, max_size=MAX_MESSAGE_SIZE) as websocket:
+        await send_message(websocket, Message(type=NetworkRequest.SET_PLAYER_INFO, data={
+            'role': PlayerRole.SPECTATOR
+        }))
+        message = await recv_message(websocket)
+        if message.type != NetworkRequest.ACK:
+            raise RuntimeError(message.data.get('reason', f'Received {message.type}'))
+        with Screen() as screen:
+            await GameView(screen).follow(websocket)
+
+
+async def find_match(keyboard: Keyboard, websocket: ClientConnection) -> str:
+    """Waits in the matchmaking queue of the server and returns the code of
+    the room it puts us in."""
+
+    deck = ''
+    while not deck:
+        deck = (await keyboard.line('Enter the deck to play with: ')).strip()
+    await send_message(websocket, Message(type=NetworkRequest.MATCHMAKE, data={'deck': deck}))
+    while True:
+        message = await recv_message(websocket)
+        if message.type == NetworkRequest.DISCONNECT:
+            raise RuntimeError(message.data['reason'])
+        if message.type != NetworkRequest.MATCHMAKE:
+            continue
+        if 'room' in message.data:
+            logger.success(f'[CLIENT] Matched into room {message.data['room']}')
+            return message.data['room']
+        logger.info(f'[CLIENT] Waiting for a game with {message.data['waiting']} players in the queue')
+
+
+async def join_game(keyboard: Keyboard, player_host_type: PlayerHostType, room_code: str, host: str, port: int) -> None:
     ready = False
     if player_host_type is PlayerHostType.PLAYER:
-        host = input('Enter the host\'s IP: ')
+        host = await keyboard.line('Enter the host\'s IP: ')
         if not host:
             host = DEFAULT_HOST
         while not valid_ip(host) and host:
-            host = input('Invalid IP format, try again: ')
-        port = input('Enter the host\'s port: ')
+            host = await keyboard.line('Invalid IP format, try again: ')
+        port = await keyboard.line('Enter the host\'s port: ')
         if not port:
             port = DEFAULT_PORT
         try:
             port = int(port)
             while not valid_port(port) and port != DEFAULT_PORT:
-                port = int(input(f'Invalid port. Port must be between {MIN_PORT} and {MAX_PORT}. Try again: '))
+                port = int(await keyboard.line(f'Invalid port. Port must be between {MIN_PORT} and {MAX_PORT}. Try again: '))
         
         except ValueError:
             port = DEFAULT_PORT    
-    uri = f'ws://{host}:{port}'
+        room_code = (await keyboard.line('Enter the room code: ')).strip().upper()
+    uri = f'ws://{host}:{port}/{room_code}'
 
-    async with connect(uri) as websocket:
+    async with connect(uri, subprotocols=SUBPROTOCOLS, max_size=MAX_MESSAGE_SIZE) as websocket:
+        if player_host_type is PlayerHostType.MATCH:
+            room_code = await find_match(keyboard, websocket)
         message = Message(type=NetworkRequest.SET_PLAYER_INFO)
-        username = input('Enter your username: ')
+        username = await keyboard.line('Enter your username: ')
         while not username.strip():
-            username = input('You cannot have an empty username. Try again: ')
+            username = await keyboard.line('You cannot have an empty username. Try again: ')
         
         logger.info(f'Your {username = }')
         colored_colors = [f'{v}{k}{v.OFF}' for k, v in COLORS.items()]
-        color = await asyncio.to_thread(input, f'Choose a color between this: {' '.join(colored_colors)} ')
+        color = await keyboard.line(f'Choose a color between this: {' '.join(colored_colors)} ')
         while not any([color in c for c in COLORS]):
-            color = await asyncio.to_thread(input, f'Choose a valid color between theese ones: {' '.join(colored_colors)}. Try again: ')
+            color = await keyboard.line(f'Choose a valid color between theese ones: {' '.join(colored_colors)}. Try again: ')
         
         player = Player(name=username, color=color)
         message.data = player.model_dump()
-        await websocket.send(message.model_dump_json())
+        await send_message(websocket, message)
         
-        message = Message.model_validate(json.loads(await websocket.recv()))
+        message = await recv_message(websocket)
         
         if message.type != NetworkRequest.ACK:
             logger.critical(f'Received invalid protocol primitive {message.type}')
             raise RuntimeError('Invalid protocol primitive')
         
         async def check_enter():
-            while True:
-                if msvcrt.kbhit() and msvcrt.getch() == b'\r':
-                    if ready:
-                        await websocket.send(Message(type=NetworkRequest.START).model_dump_json())
+            async for key in keyboard:
+                if key.name == ENTER and ready:
+                    await send_message(websocket, Message(type=NetworkRequest.START))
                     
-        enter_thread = threading.Thread(target=check_enter, daemon=True)
-        enter_thread.start()
+        enter_task = asyncio.create_task(check_enter())
         
-        if player_host_type == PlayerHostType.HOST:
+        if player_host_type == PlayerHostType.MATCH:
+            # Matched rooms have enough players: the last one in starts the game
+            await send_message(websocket, Message(type=NetworkRequest.START))
+        elif player_host_type == PlayerHostType.HOST:
             async for message in websocket:
-                await websocket.send(Message(type=NetworkRequest.READY).model_dump_json())
-                response = Message.model_validate(json.loads(await websocket.recv()))
+                await send_message(websocket, Message(type=NetworkRequest.READY))
+                response = await recv_message(websocket)
                 ready = response.data['players'] >= MIN_PLAYER_COUNT
                 logger.info(f'[CLIENT] There are {response.data['players']} in lobby now. You can{' start now if you want.' if ready else 'not start by now. Wait until more people join.'}')
                 if response.type == NetworkRequest.START:
                     break
         else:
             async for message in websocket:
-                response = Message.model_validate(json.loads(await websocket.recv()))
+                response = await recv_message(websocket)
                 if response.type == NetworkRequest.START:
                     break
+        enter_task.cancel()
         logger.success('[CLIENT] Game starts NOW!!')
         
-        
-        
-        
-        
+        with Screen() as screen:
+            await GameView(screen).follow(websocket, keyboard)
         
         await websocket.close()
         
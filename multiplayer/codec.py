@@ -0,0 +1,132 @@
+"""Wire formats for Message.
+
+Clients and server agree on the format through the WebSocket subprotocol:
+
+- cah.bin.v1: one byte with the NetworkRequest opcode, a uint32 with the
+  payload length and the payload (the message data as compact JSON, empty
+  when there is no data). The type and data are encoded and decoded without
+  going through the JSON of the whole Message model.
+- cah.json.v1: the message as JSON, like it has always been sent. It is also
+  what connections without a subprotocol get.
+"""
+import struct
+from typing import Any, Protocol, Sequence
+
+from pydantic_core import from_json, to_json
+from websockets.asyncio.client import ClientConnection
+from websockets.asyncio.server import ServerConnection
+from websockets.typing import Subprotocol
+
+from models import Message, NetworkRequest
+
+
+BINARY_SUBPROTOCOL = Subprotocol('cah.bin.v1')
+JSON_SUBPROTOCOL = Subprotocol('cah.json.v1')
+# In order of preference
+SUBPROTOCOLS: list[Subprotocol] = [BINARY_SUBPROTOCOL, JSON_SUBPROTOCOL]
+# Largest message both ends accept (websockets' default is 1 MiB): a whole
+# deck goes in a single GET_DECK message
+MAX_MESSAGE_SIZE: int = 64 * 2 ** 20
+
+HEADER = struct.Struct('<BI')
+
+Connection = ServerConnection | ClientConnection
+
+
+class Codec(Protocol):
+    # Whether frames go as text (str or UTF-8 bytes) or binary
+    text: bool
+
+    def encode(self, message: Message) -> bytes: ...
+
+    def encode_raw(self, request: NetworkRequest, data: bytes) -> bytes:
+        """Encodes a message whose data is already serialized as JSON."""
+        ...
+
+    def decode(self, frame: str | bytes) -> Message: ...
+
+
+def _dump_data(data: dict[str, Any]) -> bytes:
+    if not data:
+        return b''
+    return to_json(data)
+
+
+class JsonCodec:
+    text = True
+
+    def encode(self, message: Message) -> bytes:
+        return message.model_dump_json().encode()
+
+    def encode_raw(self, request: NetworkRequest, data: bytes) -> bytes:
+        return b'{"type":"%s","data":%s}' % (request.value.encode(), data or b'{}')
+
+    def decode(self, frame: str | bytes) -> Message:
+        return Message.model_validate_json(frame)
+
+
+class BinaryCodec:
+    text = False
+
+    def __init__(self) -> None:
+        self.requests: list[NetworkRequest | None] = [None] * 256
+        for request in NetworkRequest:
+            self.requests[int(request.value)] = request
+
+    def encode(self, message: Message) -> bytes:
+        return self.encode_raw(message.type, _dump_data(message.data))
+
+    def encode_raw(self, request: NetworkRequest, data: bytes) -> bytes:
+        return HEADER.pack(int(request.value), len(data)) + data
+
+    def decode(self, frame: str | bytes) -> Message:
+        if isinstance(frame, str):
+            raise ValueError('Binary protocol frames cannot be text')
+        if len(frame) < HEADER.size:
+            raise ValueError(f'Truncated frame ({len(frame)} bytes)')
+        opcode, length = HEADER.unpack_from(frame)
+        request = self.requests[opcode]
+        if request is None or len(frame) != HEADER.size + length:
+            raise ValueError(f'Malformed frame (opcode {opcode}, length {length})')
+        data = from_json(frame[HEADER.size:]) if length else {}
+        if not isinstance(data, dict):
+            raise ValueError(f'{request.name} data is not an object')
+        # The opcode already is a valid type: no need to validate the model
+        return Message.model_construct(type=request, data=data)
+
+
+JSON_CODEC = JsonCodec()
+BINARY_CODEC = BinaryCodec()
+CODECS: dict[Subprotocol | None, Codec] = {
+    BINARY_SUBPROTOCOL: BINARY_CODEC,
+    JSON_SUBPROTOCOL: JSON_CODEC,
+    None: JSON_CODEC,
+}
+
+
+def select_subprotocol(connection: ServerConnection, subprotocols: Sequence[Subprotocol]) -> Subprotocol | None:
+    """Picks our preferred subprotocol among the client's ones. Clients that
+    offer none (or none we know) are served with plain JSON."""
+
+    for subprotocol in SUBPROTOCOLS:
+        if subprotocol in subprotocols:
+            return subprotocol
+    return None
+
+
+def codec_for(websocket: Connection) -> Codec:
+    return CODECS.get(websocket.subprotocol, JSON_CODEC)
+
+
+async def send_message(websocket: Connection, message: Message) -> None:
+    codec = codec_for(websocket)
+    await websocket.send(codec.encode(message), text=codec.text)
+
+
+async def send_raw(websocket: Connection, request: NetworkRequest, data: bytes) -> None:
+    codec = codec_for(websocket)
+    await websocket.send(codec.encode_raw(request, data), text=codec.text)
+
+
+async def recv_message(websocket: Connection) -> Message:
+    return codec_for(websocket).decode(await websocket.recv())
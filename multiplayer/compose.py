@@ -0,0 +1,131 @@
+"""Decks made of several packs.
+
+compose_deck merges any number of packs of decks/ into one deck, keeping the
+first of every repeated card (same normalized text, see cards.Deduplicator)
+and reporting the rest. Cards are streamed from the compiled packs in a
+single pass, so packs of any size can be merged.
+
+The merged deck is saved as a compiled deck (and its duplicates next to it),
+keyed by the packs and their modification times: composing the same packs
+again just maps that file.
+
+Servers compose a deck for any deck name made of up to MAX_PACKS pack names
+joined by "+", in any order (the packs are sorted, so CAH-EN+CAH-ES is the
+same deck):
+
+    CAH-ES+CAH-EN
+"""
+import hashlib
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import NamedTuple, Sequence
+
+from pydantic_core import from_json, to_json
+
+from cards import Deduplicator
+from deckfile import CAH_DECKS_PATH, COMPILED_DIR, COMPILED_EXTENSION, ensure_compiled, load_compiled, replacing, write_compiled
+from models import Deck, deck_from_compiled
+
+
+PACK_SEPARATOR: str = '+'
+# Every combination is composed on disk, so clients cannot ask for too many
+MAX_PACKS: int = 4
+JSON_EXTENSION: str = '.json'
+DUPLICATES_EXTENSION: str = '.duplicates.json'
+# Bumped whenever the merge changes, so older merged decks are not reused
+COMPOSE_VERSION: int = 1
+
+
+class Duplicate(NamedTuple):
+    text: str
+    black: bool
+    # Pack of the repeated card, left out of the deck
+    pack: str
+    # Pack of the card kept instead
+    kept_pack: str
+
+
+@dataclass
+class Composition:
+    deck: Deck
+    duplicates: list[Duplicate]
+    path: Path
+
+
+def split_packs(deck_name: str) -> list[str]:
+    """Packs of a deck name, sorted so any order names the same deck."""
+
+    packs = deck_name.split(PACK_SEPARATOR)
+    if len(packs) > MAX_PACKS:
+        raise ValueError(f'A deck can have at most {MAX_PACKS} packs')
+    return sorted(packs)
+
+
+def composed_path(packs: Sequence[str], decks_path: Path = CAH_DECKS_PATH) -> Path:
+    """Compiled file of a merge of packs, named after what it depends on."""
+
+    key = hashlib.sha256(f'{COMPOSE_VERSION}'.encode())
+    for pack in packs:
+        stat = (decks_path / (pack + JSON_EXTENSION)).stat()
+        key.update(f'\0{pack}\0{stat.st_mtime_ns}\0{stat.st_size}'.encode())
+    return decks_path / COMPILED_DIR / f'composed-{key.hexdigest()[:16]}{COMPILED_EXTENSION}'
+
+
+def compose_deck(packs: Sequence[str], decks_path: Path = CAH_DECKS_PATH) -> Composition:
+    """Deck with the cards of every pack (by name, in decks_path) without
+    repeated cards. The first pack with a card keeps it."""
+
+    if not packs:
+        raise ValueError('A deck needs at least one pack')
+    if len(set(packs)) != len(packs):
+        raise ValueError(f'Repeated packs in {PACK_SEPARATOR.join(packs)}')
+    path = composed_path(packs, decks_path)
+    duplicates_path = path.with_suffix(DUPLICATES_EXTENSION)
+    if not (path.exists() and duplicates_path.exists()):
+        duplicates = merge_packs(packs, decks_path, path)
+        with replacing(duplicates_path) as file:
+            file.write(to_json(duplicates))
+    else:
+        duplicates = [Duplicate(*duplicate) for duplicate in from_json(duplicates_path.read_bytes())]
+    return Composition(deck_from_compiled(load_compiled(path)), duplicates, path)
+
+
+def merge_packs(packs: Sequence[str], decks_path: Path, path: Path) -> list[Duplicate]:
+    """Writes the merged deck to path and returns the cards left out."""
+
+    black, white = Deduplicator(), Deduplicator()
+    # Pack of every card kept (its position in packs) and pick of the black ones
+    black_packs, white_packs = array('H'), array('H')
+    picks = array('B')
+    duplicates: list[Duplicate] = []
+    names: list[str] = []
+    official = True
+    for number, pack in enumerate(packs):
+        compiled = load_compiled(ensure_compiled(decks_path / (pack + JSON_EXTENSION)))
+        names.append(compiled.name)
+        official = official and compiled.official
+        for text, pick in zip(compiled.black_texts, compiled.picks):
+            first = black.add(text)
+            if first is None:
+                black_packs.append(number)
+                picks.append(pick)
+            else:
+                duplicates.append(Duplicate(text, True, pack, packs[black_packs[first]]))
+        for text in compiled.white_texts:
+            first = white.add(text)
+            if first is None:
+                white_packs.append(number)
+            else:
+                duplicates.append(Duplicate(text, False, pack, packs[white_packs[first]]))
+
+    write_compiled(
+        path,
+        ' + '.join(names),
+        PACK_SEPARATOR.join(packs),
+        official,
+        black.kept,
+        picks,
+        white.kept,
+    )
+    return duplicates
@@ -0,0 +1,109 @@
+"""Decks stored by content.
+
+A deck is published as its compiled file (see deckfile.py) and named after
+the SHA-256 of that file. Game states only carry the digest of their deck and
+card ids: a client asks for the deck (GET_DECK) only if its cache does not
+have a file with that digest yet, and reads every card from it from then on.
+Joining a game, reconnecting or starting a new game with a known deck costs
+no card text at all.
+
+Decks go over the wire compressed with zlib and base64 encoded (message data
+is JSON with either codec).
+"""
+import base64
+import hashlib
+import os
+import tempfile
+import zlib
+from pathlib import Path
+
+from deckfile import COMPILED_EXTENSION, load_compiled, write_compiled
+from models import Deck, deck_from_compiled
+
+
+DEFAULT_CACHE_DIR: Path = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'cah' / 'decks'
+DIGEST_LENGTH: int = 64
+
+
+def file_digest(path: Path) -> str:
+    with open(path, 'rb') as file:
+        return hashlib.file_digest(file, 'sha256').hexdigest()
+
+
+def encode_deck(data: bytes) -> str:
+    return base64.b64encode(zlib.compress(data, 9)).decode()
+
+
+def decode_deck(payload: str) -> bytes:
+    return zlib.decompress(base64.b64decode(payload))
+
+
+class DeckCache:
+    """Directory of compiled decks named after their digest."""
+
+    def __init__(self, directory: Path = DEFAULT_CACHE_DIR) -> None:
+        self.directory = directory
+        # Decks already loaded, so every game with them shares their table
+        self.loaded: dict[str, Deck] = {}
+
+    def path(self, digest: str) -> Path:
+        if len(digest) != DIGEST_LENGTH or not all(c in '0123456789abcdef' for c in digest):
+            raise ValueError(f'Invalid deck digest {digest!r}')
+        return self.directory / (digest + COMPILED_EXTENSION)
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self.loaded or self.path(digest).exists()
+
+    def get(self, digest: str) -> Deck | None:
+        """The deck with the given digest, if it is in the cache."""
+
+        if digest not in self.loaded:
+            path = self.path(digest)
+            if not path.exists():
+                return None
+            deck = deck_from_compiled(load_compiled(path))
+            deck.digest = digest
+            self.loaded[digest] = deck
+        return self.loaded[digest]
+
+    def _store(self, tmp_path: Path, expected: str | None = None) -> str:
+        digest = file_digest(tmp_path)
+        if expected is not None and digest != expected:
+            tmp_path.unlink()
+            raise ValueError(f'Deck {expected} arrived with digest {digest}')
+        # Same digest, same content: a copy already there is as good
+        os.replace(tmp_path, self.path(digest))
+        return digest
+
+    def _tmp_path(self) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        handle, name = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        os.close(handle)
+        return Path(name)
+
+    def add(self, deck: Deck) -> str:
+        """Stores a deck and sets its digest (unless it already has one)."""
+
+        if deck.digest is None:
+            tmp_path = self._tmp_path()
+            table = deck.table
+            write_compiled(tmp_path, deck.name, deck.code_name, deck.official,
+                           table.black_texts, table.picks, table.white_texts)
+            deck.digest = self._store(tmp_path)
+        return deck.digest
+
+    def put(self, digest: str, data: bytes) -> Deck:
+        """Stores a compiled deck received from a server, checking that its
+        content has the digest it was announced with."""
+
+        tmp_path = self._tmp_path()
+        tmp_path.write_bytes(data)
+        self._store(tmp_path, digest)
+        deck = self.get(digest)
+        assert deck is not None
+        return deck
+
+    def payload(self, digest: str) -> str:
+        """The deck as it goes in a GET_DECK message."""
+
+        return encode_deck(self.path(digest).read_bytes())
@@ -0,0 +1,388 @@
+"""Compiled deck files.
+
+A deck JSON file is compiled once into a binary file with the text of every
+card already unescaped. The JSON file is streamed and every card is written
+as soon as it is read, so compiling a pack takes the same memory whatever its
+size. The compiled file is loaded with mmap and the cards are read straight
+from it, so loading a deck does not depend on its size either.
+
+Layout (little-endian):
+
+- Header: magic, version, official flag, black card count, white card count.
+- Offset index: one uint32 per string plus a final one with the blob size.
+- Picks: one byte per black card.
+- String blob: UTF-8 texts of the deck name, code name, black cards and white
+  cards, in that order.
+
+Compile every deck with `python multiplayer/deckfile.py` (compile-decks).
+"""
+import argparse
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from html import unescape
+from pathlib import Path
+from typing import Any, BinaryIO, NamedTuple, TextIO, overload
+
+
+CAH_DECKS_PATH: Path = Path(__file__).parent.parent / 'decks'
+COMPILED_DIR: str = 'compiled'
+COMPILED_EXTENSION: str = '.cahd'
+
+MAGIC: bytes = b'CAHD'
+VERSION: int = 1
+HEADER = struct.Struct('<4sHBxII')
+
+NAME_INDEX: int = 0
+CODE_NAME_INDEX: int = 1
+FIRST_CARD_INDEX: int = 2
+MAX_PICK: int = 255
+
+# Characters read from a deck file at a time
+CHUNK_SIZE: int = 1 << 16
+OFFSETS_PER_WRITE: int = 1 << 14
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# Lists of the deck file that are read one card at a time
+CARD_LISTS: tuple[str, ...] = ('blackCards', 'whiteCards')
+
+
+class MappedTexts(Sequence[str]):
+    """Read-only sequence of strings decoded on demand from a string blob."""
+
+    __slots__ = ('_blob', '_offsets', '_start', '_stop')
+
+    def __init__(self, blob: memoryview, offsets: Sequence[int], start: int, stop: int) -> None:
+        self._blob = blob
+        self._offsets = offsets
+        self._start = start
+        self._stop = stop
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+    @overload
+    def __getitem__(self, index: slice) -> list[str]: ...
+    def __getitem__(self, index: int | slice) -> str | list[str]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('card index out of range')
+        position = self._start + index
+        return str(self._blob[self._offsets[position]:self._offsets[position + 1]], 'utf-8')
+
+
+class CompiledDeck(NamedTuple):
+    name: str
+    code_name: str
+    official: bool
+    black_texts: Sequence[str]
+    white_texts: Sequence[str]
+    picks: Sequence[int]
+
+
+def compiled_path_for(json_path: Path) -> Path:
+    return json_path.parent / COMPILED_DIR / (json_path.stem + COMPILED_EXTENSION)
+
+
+class DeckStream:
+    """Incremental reader of a deck JSON file.
+
+    The file is read in CHUNK_SIZE pieces and only the value being parsed is
+    kept in memory: the elements of "blackCards" and "whiteCards" are parsed
+    and yielded one at a time, so a pack of any size is read with the memory
+    of its biggest card.
+    """
+
+    def __init__(self, file: TextIO, chunk_size: int = CHUNK_SIZE) -> None:
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self._decode = json.JSONDecoder().raw_decode
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # What was already parsed is dropped
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def _skip_whitespace(self) -> None:
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()  # type: ignore[union-attr]
+            if self.position < len(self.buffer) or not self._fill():
+                return
+
+    def _peek(self) -> str:
+        self._skip_whitespace()
+        if self.position == len(self.buffer):
+            raise ValueError('Unexpected end of the deck file')
+        return self.buffer[self.position]
+
+    def _expect(self, characters: str) -> str:
+        character = self._peek()
+        if character not in characters:
+            raise ValueError(f'Expected one of {characters!r} in the deck file, found {character!r}')
+        self.position += 1
+        return character
+
+    def _value(self) -> Any:
+        if self.position == len(self.buffer) or self.buffer[self.position] in ' \t\n\r':
+            self._peek()
+        while True:
+            try:
+                value, end = self._decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                # The value goes on in the next chunk (or the file is broken)
+                if self._fill():
+                    continue
+                raise
+            # A number could also go on in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.position = end
+            return value
+
+    def __iter__(self) -> Iterator[tuple[str, Any]]:
+        """Yields (key, value) for every key of the deck, and (key, card)
+        for every card of "blackCards" and "whiteCards"."""
+
+        self._expect('{')
+        if self._peek() == '}':
+            return
+        while True:
+            key = self._value()
+            if not isinstance(key, str):
+                raise ValueError('Deck keys must be strings')
+            self._expect(':')
+            if key in CARD_LISTS and self._peek() == '[':
+                self.position += 1
+                if self._peek() == ']':
+                    self.position += 1
+                else:
+                    while True:
+                        yield key, self._value()
+                        if self._expect(',]') == ']':
+                            break
+            else:
+                yield key, self._value()
+            if self._expect(',}') == '}':
+                return
+
+
+def black_card(card: Any, index: int) -> tuple[str, int]:
+    """Unescaped text and pick of a black card, checking its fields."""
+
+    if not isinstance(card, dict) or not isinstance(card.get('text'), str):
+        raise ValueError(f'Black card {index} has no text')
+    pick = card.get('pick')
+    if not isinstance(pick, int) or isinstance(pick, bool) or not 1 <= pick <= MAX_PICK:
+        raise ValueError(f'Black card {index} has an invalid pick: {pick!r}')
+    return unescape(card['text']), pick
+
+
+def white_card(card: Any, index: int) -> str:
+    """Unescaped text of a white card."""
+
+    # Some packs store white cards as plain strings and others as objects
+    text = card.get('text') if isinstance(card, dict) else card
+    if not isinstance(text, str):
+        raise ValueError(f'White card {index} has no text')
+    return unescape(text)
+
+
+class CompiledWriter:
+    """Writes a compiled deck one card at a time.
+
+    The texts of the cards go to temporary files until the deck is finished,
+    so only their offsets (4 bytes per card) and picks stay in memory.
+    """
+
+    def __init__(self, compiled_path: Path) -> None:
+        self.compiled_path = compiled_path
+        self.black_blob = tempfile.TemporaryFile()
+        self.white_blob = tempfile.TemporaryFile()
+        self.black_lengths = array('I')
+        self.white_lengths = array('I')
+        self.picks = array('B')
+
+    def __enter__(self) -> 'CompiledWriter':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.black_blob.close()
+        self.white_blob.close()
+
+    def add_black(self, text: str, pick: int) -> None:
+        self.black_lengths.append(self.black_blob.write(text.encode('utf-8')))
+        self.picks.append(pick)
+
+    def add_white(self, text: str) -> None:
+        self.white_lengths.append(self.white_blob.write(text.encode('utf-8')))
+
+    def finish(self, name: str, code_name: str, official: bool) -> Path:
+        header = name.encode('utf-8') + code_name.encode('utf-8')
+        self.compiled_path.parent.mkdir(parents=True, exist_ok=True)
+        with replacing(self.compiled_path) as compiled_file:
+            compiled_file.write(HEADER.pack(
+                MAGIC, VERSION, official, len(self.black_lengths), len(self.white_lengths)
+            ))
+            offsets = array('I', [0, len(name.encode('utf-8')), len(header)])
+            end = len(header)
+            for lengths in (self.black_lengths, self.white_lengths):
+                for length in lengths:
+                    end += length
+                    offsets.append(end)
+                    if len(offsets) == OFFSETS_PER_WRITE:
+                        _write_offsets(compiled_file, offsets)
+            _write_offsets(compiled_file, offsets)
+            compiled_file.write(self.picks.tobytes())
+            compiled_file.write(header)
+            for blob in (self.black_blob, self.white_blob):
+                blob.seek(0)
+                shutil.copyfileobj(blob, compiled_file)
+        return self.compiled_path
+
+
+@contextmanager
+def replacing(path: Path) -> Iterator[BinaryIO]:
+    """Writes a file under a temporary name of its own and moves it to path
+    once it is complete. Worker processes may write the same file at once:
+    each one replaces it with a whole file of its own."""
+
+    handle, tmp_name = tempfile.mkstemp(prefix=path.name + '.', suffix='.tmp', dir=path.parent)
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            yield file
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def _write_offsets(file: BinaryIO, offsets: array) -> None:
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    file.write(offsets.tobytes())
+    del offsets[:]
+
+
+def compile_deck(json_path: Path, compiled_path: Path | None = None, chunk_size: int = CHUNK_SIZE) -> Path:
+    """Writes the compiled version of a deck JSON file and returns its path.
+
+    The file is streamed (see DeckStream): every card is unescaped, checked
+    and written as soon as it is read.
+    """
+
+    if compiled_path is None:
+        compiled_path = compiled_path_for(json_path)
+
+    fields: dict[str, Any] = {}
+    with open(json_path, 'r', encoding='utf-8') as deck_file, CompiledWriter(compiled_path) as writer:
+        for key, value in DeckStream(deck_file, chunk_size):
+            if key == 'blackCards':
+                writer.add_black(*black_card(value, len(writer.picks)))
+            elif key == 'whiteCards':
+                writer.add_white(white_card(value, len(writer.white_lengths)))
+            else:
+                fields[key] = value
+        for key in ('name', 'codeName'):
+            if not isinstance(fields.get(key), str):
+                raise ValueError(f'{json_path} has no {key}')
+        return writer.finish(fields['name'], fields['codeName'], bool(fields.get('official', False)))
+
+
+def write_compiled(
+    compiled_path: Path,
+    name: str,
+    code_name: str,
+    official: bool,
+    black_texts: Iterable[str],
+    picks: Iterable[int],
+    white_texts: Iterable[str],
+) -> Path:
+    """Writes a compiled deck from card texts that are already unescaped."""
+
+    with CompiledWriter(compiled_path) as writer:
+        for text, pick in zip(black_texts, picks, strict=True):
+            writer.add_black(text, pick)
+        for text in white_texts:
+            writer.add_white(text)
+        return writer.finish(name, code_name, official)
+
+
+def ensure_compiled(json_path: Path) -> Path:
+    """Returns the compiled file of a deck, (re)compiling it if it is missing
+    or older than the JSON file."""
+
+    compiled_path = compiled_path_for(json_path)
+    if not compiled_path.exists() or compiled_path.stat().st_mtime < json_path.stat().st_mtime:
+        compile_deck(json_path, compiled_path)
+    return compiled_path
+
+
+def load_compiled(compiled_path: Path) -> CompiledDeck:
+    """Memory-maps a compiled deck. Nothing is copied: the texts are decoded
+    from the map when they are accessed."""
+
+    with open(compiled_path, 'rb') as compiled_file:
+        mapped = mmap.mmap(compiled_file.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+
+    magic, version, official, black_count, white_count = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{compiled_path} is not a compiled deck (version {VERSION})')
+
+    string_count = FIRST_CARD_INDEX + black_count + white_count
+    offsets_start = HEADER.size
+    picks_start = offsets_start + (string_count + 1) * 4
+    blob_start = picks_start + black_count
+
+    offsets: Sequence[int] = view[offsets_start:picks_start].cast('I')
+    if sys.byteorder != 'little':
+        offsets = array('I', offsets)
+        offsets.byteswap()
+    blob = view[blob_start:]
+
+    def text(index: int) -> str:
+        return str(blob[offsets[index]:offsets[index + 1]], 'utf-8')
+
+    white_start = FIRST_CARD_INDEX + black_count
+    return CompiledDeck(
+        name=text(NAME_INDEX),
+        code_name=text(CODE_NAME_INDEX),
+        official=bool(official),
+        black_texts=MappedTexts(blob, offsets, FIRST_CARD_INDEX, white_start),
+        white_texts=MappedTexts(blob, offsets, white_start, string_count),
+        picks=view[picks_start:blob_start],
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='compile-decks', description='Compile deck JSON files.')
+    parser.add_argument('decks', nargs='*', type=Path, help='Deck JSON files (default: every deck in decks/)')
+    args = parser.parse_args()
+    for json_path in args.decks or sorted(CAH_DECKS_PATH.glob('*.json')):
+        print(f'{json_path} -> {compile_deck(json_path)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import random
+from array import array
+from typing import Generic, Iterator, Sequence, TypeVar
+
+
+T = TypeVar("T")
+
+
+class CAHDrawingListEmpty(Exception): ...
+
+
+def seeded_rng(seed: int, stream: str) -> random.Random:
+    """Generator of one stream ("black", "white", ...) of a game seed. Every
+    stream is independent, so the cards drawn from one pile do not depend on
+    how many were drawn from the others."""
+
+    return random.Random(f'{seed}:{stream}')
+
+
+class DrawPile(Generic[T]):
+    """Random draw pile over a fixed sequence of cards.
+
+    The cards are never copied nor removed. The pile behaves like a
+    permutation of their indexes with a cursor: everything before the cursor
+    has already been drawn (the used cards) and everything after it is still
+    in the pile. Each draw swaps a random remaining index into the cursor
+    position, so drawing a card is O(1) no matter how big the deck is.
+
+    The permutation is never materialized: only the positions that have been
+    swapped are stored, so creating a pile is O(1) too.
+    """
+
+    def __init__(self, cards: Sequence[T], rng: random.Random | None = None) -> None:
+        self.cards = cards
+        # Without an explicit generator the global one is used, so
+        # random.seed keeps working as before.
+        self.randrange = (rng if rng is not None else random).randrange
+        self.size = len(cards)
+        self.drawn = array("I")
+        self._swaps: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return self.size - len(self.drawn)
+
+    def draw_ids(self, total: int = 1) -> array:
+        """Draws "total" random card indexes and marks them as used."""
+
+        if total > len(self):
+            raise CAHDrawingListEmpty
+
+        swaps = self._swaps
+        randrange = self.randrange
+        end = self.size
+        start = len(self.drawn)
+        ids = array("I")
+        for i in range(start, start + total):
+            j = randrange(i, end)
+            at_i = swaps.pop(i, i)
+            if j == i:
+                ids.append(at_i)
+            else:
+                ids.append(swaps.get(j, j))
+                swaps[j] = at_i
+        self.drawn.extend(ids)
+        return ids
+
+    def take_ids(self, ids: Sequence[int]) -> None:
+        """Draws the given card indexes, in order. Used to bring a pile back
+        to a known position (see eventlog.py)."""
+
+        swaps = self._swaps
+        # Where the cards that are not at their own position are
+        positions = {card: position for position, card in swaps.items()}
+        for card in ids:
+            i = len(self.drawn)
+            position = positions.pop(card, card)
+            if position < i or position >= self.size or swaps.get(position, position) != card:
+                raise ValueError(f'Card {card} is not in the pile')
+            at_i = swaps.pop(i, i)
+            if position != i:
+                if at_i == position:
+                    swaps.pop(position, None)
+                    positions.pop(at_i, None)
+                else:
+                    swaps[position] = at_i
+                    positions[at_i] = position
+            self.drawn.append(card)
+
+    def replay_ids(self, ids: Sequence[int]) -> None:
+        """Draws the given card indexes again. A pile with the same seed as
+        the one that drew them draws exactly them, and then goes on with the
+        same sequence; any other pile just takes them out (see take_ids)."""
+
+        start, swaps = len(self.drawn), dict(self._swaps)
+        try:
+            if list(self.draw_ids(len(ids))) == list(ids):
+                return
+        except CAHDrawingListEmpty:
+            pass
+        del self.drawn[start:]
+        self._swaps = swaps
+        self.take_ids(ids)
+
+    def draw(self, total: int = 1) -> list[T]:
+        """Draws "total" random cards and marks them as used."""
+
+        cards = self.cards
+        return [cards[i] for i in self.draw_ids(total)]
+
+    def used_ids(self) -> array:
+        """Indexes of the cards drawn so far, in drawing order.
+
+        This is the pile's own array, not a copy: do not modify it.
+        """
+
+        return self.drawn
+
+    def used(self) -> Iterator[T]:
+        cards = self.cards
+        return (cards[i] for i in self.drawn)
+
+    def reset(self) -> None:
+        """Puts every drawn card back into the pile."""
+
+        self.drawn = array("I")
+        self._swaps.clear()
@@ -0,0 +1,214 @@
+"""Append-only event log and snapshots of the rooms, for crash recovery.
+
+Every change of a room (see RecordKind) is appended to an in-memory buffer,
+which a background task writes and fsyncs every FLUSH_INTERVAL seconds, so
+logging costs the rooms a struct.pack and no system call. Every
+SNAPSHOT_INTERVAL seconds the whole registry is written to a snapshot and the
+log starts over: a restart only replays the records written since then.
+
+Log records are an uint32 payload length, the CRC32 of the payload, an uint64
+sequence number, the record kind (uint8) and the payload: [room code, body]
+as JSON. Reading stops at the first torn or corrupted record.
+
+The snapshot is a header with the last sequence number it includes followed
+by the rooms (see RoomRegistry.snapshot) as JSON.
+"""
+import asyncio
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from enum import IntEnum
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Sequence
+from uuid import UUID
+
+from loguru import logger
+from pydantic_core import from_json, to_json
+
+from deckfile import replacing
+
+
+LOG_NAME: str = 'events.log'
+SNAPSHOT_NAME: str = 'snapshot.bin'
+FLUSH_INTERVAL: float = 0.05
+SNAPSHOT_INTERVAL: float = 60.0
+
+SNAPSHOT_MAGIC: bytes = b'CAHS'
+SNAPSHOT_VERSION: int = 1
+# Magic, format version, last sequence number
+SNAPSHOT_HEADER = struct.Struct('<4sHQ')
+# Payload length, payload CRC32, sequence number, kind
+RECORD_HEADER = struct.Struct('<IIQB')
+
+
+class RecordKind(IntEnum):
+    # {"deck": file name, "settings": GameSettings without the deck}
+    CREATE = 1
+    # {"from_version": N, "deltas": [delta dumps]}
+    DELTAS = 2
+    # {"black": [drawn ids], "white": [drawn ids], "hands": {player id: [ids]}}
+    DEAL = 3
+    # {"player_id": id, "cards": [ids]}
+    CHOICES = 4
+    # {}
+    REMOVE = 5
+
+
+class Record(NamedTuple):
+    sequence: int
+    kind: RecordKind
+    code: str
+    body: dict[str, Any]
+
+
+class EventLog:
+    def __init__(self, directory: Path, sequence: int = 0) -> None:
+        """Opens the log of a directory to append records after "sequence"
+        (the last one that was recovered)."""
+
+        directory.mkdir(parents=True, exist_ok=True)
+        self.directory = directory
+        self.path = directory / LOG_NAME
+        self.sequence = sequence
+        self.buffer = bytearray()
+        # Drop whatever could not be read back (a torn last record)
+        self.file = open(self.path, 'ab')
+        self.file.truncate(valid_log_length(self.path))
+        self._lock = asyncio.Lock()
+        self._flusher: asyncio.Task[None] | None = None
+
+    def append(self, kind: RecordKind, code: str, body: dict[str, Any]) -> None:
+        self.sequence += 1
+        payload = to_json([code, body])
+        self.buffer += RECORD_HEADER.pack(len(payload), zlib.crc32(payload), self.sequence, kind)
+        self.buffer += payload
+
+    def start(self) -> None:
+        self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if self.buffer:
+                data, self.buffer = bytes(self.buffer), bytearray()
+                await asyncio.to_thread(self._write, data)
+
+    def _write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    async def snapshot(self, rooms: Callable[[], list[dict[str, Any]]]) -> None:
+        """Writes a snapshot of the rooms and starts the log over."""
+
+        async with self._lock:
+            # Taken at once, so it matches exactly the records up to sequence
+            sequence, state = self.sequence, to_json(rooms())
+            data, self.buffer = bytes(self.buffer), bytearray()
+            await asyncio.to_thread(self._write_snapshot, sequence, state, data)
+
+    def _write_snapshot(self, sequence: int, state: bytes, pending: bytes) -> None:
+        if pending:
+            self._write(pending)
+        with replacing(self.directory / SNAPSHOT_NAME) as file:
+            file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, sequence))
+            file.write(state)
+            file.flush()
+            os.fsync(file.fileno())
+        # Every record so far is in the snapshot (and would be skipped anyway)
+        self.file.truncate(0)
+
+    async def snapshot_periodically(self, rooms: Callable[[], list[dict[str, Any]]]) -> None:
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            try:
+                await self.snapshot(rooms)
+            except OSError:
+                logger.exception('Could not write the snapshot')
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        self.file.close()
+
+
+@dataclass
+class RoomLog:
+    """The records of one room."""
+
+    log: EventLog
+    code: str
+
+    def created(self, deck: str, settings: dict[str, Any]) -> None:
+        self.log.append(RecordKind.CREATE, self.code, {'deck': deck, 'settings': settings})
+
+    def deltas(self, from_version: int, dumps: list[dict[str, Any]]) -> None:
+        self.log.append(RecordKind.DELTAS, self.code, {'from_version': from_version, 'deltas': dumps})
+
+    def dealt(self, black: Sequence[int], white: Sequence[int], hands: dict[UUID, Sequence[int]]) -> None:
+        self.log.append(RecordKind.DEAL, self.code, {
+            'black': list(black),
+            'white': list(white),
+            'hands': {str(player_id): list(hand) for player_id, hand in hands.items()},
+        })
+
+    def choices(self, player_id: UUID, cards: Iterable[int]) -> None:
+        self.log.append(RecordKind.CHOICES, self.code, {'player_id': str(player_id), 'cards': list(cards)})
+
+    def removed(self) -> None:
+        self.log.append(RecordKind.REMOVE, self.code, {})
+
+
+def read_log(path: Path) -> Iterator[Record]:
+    for record, _ in _read_records(path):
+        yield record
+
+
+def valid_log_length(path: Path) -> int:
+    """Length of the part of the log that can be read back."""
+
+    end = 0
+    for _, end in _read_records(path):
+        pass
+    return end
+
+
+def _read_records(path: Path) -> Iterator[tuple[Record, int]]:
+    if not path.exists():
+        return
+    data = path.read_bytes()
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        length, crc, sequence, kind = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) != length or zlib.crc32(payload) != crc or kind not in RecordKind._value2member_map_:
+            logger.warning(f'Ignoring the end of {path} from byte {offset}')
+            return
+        offset = start + length
+        code, body = from_json(payload)
+        yield Record(sequence, RecordKind(kind), code, body), offset
+
+
+def read_snapshot(directory: Path) -> tuple[int, list[dict[str, Any]]]:
+    """Last sequence number in the snapshot and its rooms (0 and no rooms
+    without a snapshot)."""
+
+    path = directory / SNAPSHOT_NAME
+    if not path.exists():
+        return 0, []
+    data = path.read_bytes()
+    magic, version, sequence = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError(f'{path} is not a snapshot')
+    return sequence, from_json(data[SNAPSHOT_HEADER.size:])
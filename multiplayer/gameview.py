@@ -0,0 +1,184 @@
+"""Live view of a game for the client.
+
+Keeps a copy of the public state (from GET_GAME_STATE, then STATE_DELTA) and
+the private hand of the player, and draws them with screen.py. Cards arrive
+as ids: their texts are read from the deck of the game, downloaded once into
+the local deck cache (see deckcache.py). Cards are
+chosen with the number keys and played with enter. COUNTDOWN
+messages only arrive once a second, so the timer is drawn from the deadline
+they announce: redrawing at 10 fps moves the bar smoothly while every other
+cell stays put and is not written again.
+"""
+import asyncio
+import time
+from typing import Any
+
+from websockets.asyncio.client import ClientConnection
+from websockets.exceptions import ConnectionClosed
+
+from codec import recv_message, send_message
+from deckcache import DeckCache, decode_deck
+from keyboard import BACKSPACE, CHAR, ENTER, Key, Keyboard
+from models import Deck, Message, NetworkRequest, Phase
+from screen import BOLD, CARD_WIDTH, COLOR_STYLES, Screen, draw_black_card, draw_cards, draw_scoreboard, draw_timer
+from sync import BlackCardDrawn, Delta, PhaseChanged, PlayerJoined, PlayerLeft, PlayerReady, PlayerReconnected, parse_deltas
+
+
+FRAMES_PER_SECOND: int = 10
+
+
+def apply_public_delta(state: dict[str, Any], delta: Delta) -> None:
+    """sync.apply_delta for the public view, which is kept as plain JSON."""
+
+    players: list[dict[str, Any]] = state['players']
+    match delta:
+        case PhaseChanged(phase=phase):
+            state['phase'] = phase.value
+        case BlackCardDrawn(card_id=card_id):
+            state['black_card_id'] = card_id
+        case PlayerJoined():
+            players.append(delta.model_dump(mode='json', exclude={'kind'}))
+        case PlayerLeft(player_id=player_id):
+            state['players'] = [player for player in players if player['id'] != str(player_id)]
+        case PlayerReady(player_id=player_id, ready=ready):
+            for player in players:
+                if player['id'] == str(player_id):
+                    player['ready'] = ready
+        case PlayerReconnected(player_id=player_id, id=new_id):
+            for player in players:
+                if player['id'] == str(player_id):
+                    player['id'] = str(new_id)
+
+
+class GameView:
+    def __init__(self, screen: Screen, cache: DeckCache | None = None) -> None:
+        self.screen = screen
+        self.cache = cache if cache is not None else DeckCache()
+        self.deck: Deck | None = None
+        self.version: int | None = None
+        self.state: dict[str, Any] | None = None
+        # Ids of the white cards of the player
+        self.hand: list[int] = []
+        # Monotonic time the current phase ends at (see COUNTDOWN)
+        self.deadline: float | None = None
+        # Positions in the hand of the cards chosen so far
+        self.chosen: list[int] = []
+
+    def receive(self, message: Message, now: float | None = None) -> Message | None:
+        """Updates the view with a message from the server. Returns what has
+        to be asked for: the state again if some versions were missed, or the
+        deck of the game if it is not in the cache."""
+
+        match message.type:
+            case NetworkRequest.GET_GAME_STATE:
+                self.version = message.data['version']
+                self.state = message.data['state']
+                if 'private' in message.data:
+                    self.hand = message.data['private']['hand']
+                    self.chosen.clear()
+                digest = self.state['settings'].get('deck_digest')
+                if digest is not None and (self.deck is None or self.deck.digest != digest):
+                    self.deck = self.cache.get(digest)
+                    if self.deck is None:
+                        return Message(type=NetworkRequest.GET_DECK, data={'digest': digest})
+            case NetworkRequest.STATE_DELTA:
+                if self.state is None or message.data['from_version'] != (self.version or 0) + 1:
+                    return Message(type=NetworkRequest.GET_GAME_STATE, data={'version': self.version})
+                for delta in parse_deltas(message.data['deltas']):
+                    apply_public_delta(self.state, delta)
+                self.version = message.data['version']
+            case NetworkRequest.COUNTDOWN:
+                self.deadline = (time.monotonic() if now is None else now) + message.data['remaining']
+            case NetworkRequest.GET_DECK:
+                self.deck = self.cache.put(message.data['digest'], decode_deck(message.data['deck']))
+        return None
+
+    @property
+    def pick(self) -> int | None:
+        """Cards to play this round, if there is a black card."""
+
+        black_card_id = None if self.state is None else self.state.get('black_card_id')
+        if black_card_id is None or self.deck is None:
+            return None
+        return self.deck.table.pick(black_card_id)
+
+    def draw(self, now: float | None = None) -> None:
+        screen = self.screen
+        screen.clear()
+        if self.state is None or self.deck is None:
+            screen.text(0, 0, 'Waiting for the game...' if self.state is None else 'Downloading the deck...', BOLD)
+            return
+        table = self.deck.table
+        phase = Phase(self.state['phase'])
+        screen.text(0, 0, f'Phase: {phase.name.replace("_", " ").lower()}', BOLD)
+        y = 2
+        black_card_id = self.state.get('black_card_id')
+        if black_card_id is not None:
+            y += draw_black_card(screen, 0, y, table.black_text(black_card_id), f'Pick {self.pick}') + 1
+        scores = [
+            (player['name'], player['score'], COLOR_STYLES.get(player.get('color') or '', ''))
+            for player in self.state['players']
+        ]
+        draw_scoreboard(screen, max(CARD_WIDTH * 2 + 2, screen.width - CARD_WIDTH), 2, scores, 'Scores')
+        if self.deadline is not None:
+            remaining = self.deadline - (time.monotonic() if now is None else now)
+            draw_timer(screen, 0, 1, remaining, self.state['settings']['max_round_time'], CARD_WIDTH * 2)
+        if self.hand:
+            screen.text(0, y, 'Your hand (number keys to choose, enter to play):', BOLD)
+            draw_cards(screen, 0, y + 1, [table.white_text(card_id) for card_id in self.hand], selected=self.chosen)
+
+    def press(self, key: Key) -> Message | None:
+        """Chooses cards with the keyboard. Returns the message that plays
+        them once enough are chosen and enter is pressed."""
+
+        pick = self.pick
+        if self.state is None or pick is None or self.state['phase'] != Phase.PLAY_CARDS.value:
+            return None
+        if key.name == CHAR and key.char.isdigit():
+            position = int(key.char) - 1
+            if position in self.chosen:
+                self.chosen.remove(position)
+            elif 0 <= position < len(self.hand) and len(self.chosen) < pick:
+                self.chosen.append(position)
+        elif key.name == BACKSPACE and self.chosen:
+            self.chosen.pop()
+        elif key.name == ENTER and len(self.chosen) == pick:
+            return Message(type=NetworkRequest.SET_PLAYER_CHOICES, data={'cards': list(self.chosen)})
+        return None
+
+    async def refresh(self, frames_per_second: int = FRAMES_PER_SECOND) -> None:
+        """Redraws until cancelled. Frames that did not change write nothing."""
+
+        while True:
+            self.screen.fit_terminal()
+            self.draw()
+            self.screen.flush()
+            await asyncio.sleep(1 / frames_per_second)
+
+    async def play(self, websocket: ClientConnection, keyboard: Keyboard) -> None:
+        async for key in keyboard:
+            message = self.press(key)
+            if message is not None:
+                await send_message(websocket, message)
+
+    async def follow(self, websocket: ClientConnection, keyboard: Keyboard | None = None) -> None:
+        """Shows the game played on websocket until the server closes it,
+        playing the cards chosen on keyboard."""
+
+        tasks = [asyncio.create_task(self.refresh())]
+        if keyboard is not None:
+            tasks.append(asyncio.create_task(self.play(websocket, keyboard)))
+        try:
+            await send_message(websocket, Message(type=NetworkRequest.GET_GAME_STATE))
+            while True:
+                message = await recv_message(websocket)
+                if message.type is NetworkRequest.DISCONNECT:
+                    break
+                request = self.receive(message)
+                if request is not None:
+                    await send_message(websocket, request)
+        except ConnectionClosed:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,201 @@
+"""Keyboard input on the asyncio event loop.
+
+The terminal is put in cbreak mode (no line buffering nor echo, but Ctrl+C
+still interrupts) and stdin is watched with loop.add_reader: nothing runs
+until a key is pressed, and the key reaches whoever awaits it right away.
+Keys come as Key events; Keyboard.line() edits a whole line on top of them.
+
+Windows consoles cannot be watched by the event loop, so there a daemon
+thread blocks on msvcrt.getwch() and hands every key to the loop.
+
+    async with Keyboard() as keyboard:
+        name = await keyboard.line('Enter your username: ')
+        async for key in keyboard:
+            ...
+"""
+import asyncio
+import codecs
+import os
+import sys
+import threading
+from typing import AsyncIterator, NamedTuple, TextIO
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import termios
+    import tty
+
+
+READ_SIZE: int = 1024
+
+ENTER: str = 'enter'
+BACKSPACE: str = 'backspace'
+ESCAPE: str = 'escape'
+TAB: str = 'tab'
+UP: str = 'up'
+DOWN: str = 'down'
+RIGHT: str = 'right'
+LEFT: str = 'left'
+# Any key that types a character
+CHAR: str = 'char'
+
+CONTROL_KEYS: dict[str, str] = {
+    '\r': ENTER,
+    '\n': ENTER,
+    '\x7f': BACKSPACE,
+    '\b': BACKSPACE,
+    '\t': TAB,
+}
+# Final character of the escape sequences of the arrows (ESC [ A or ESC O A)
+ARROWS: dict[str, str] = {'A': UP, 'B': DOWN, 'C': RIGHT, 'D': LEFT}
+# Windows sends a prefix and then the key code for the arrows
+WINDOWS_ARROWS: dict[str, str] = {'H': UP, 'P': DOWN, 'M': RIGHT, 'K': LEFT}
+WINDOWS_PREFIXES: str = '\x00\xe0'
+
+
+class Key(NamedTuple):
+    name: str
+    char: str = ''
+
+
+def parse_keys(text: str) -> tuple[list[Key], str]:
+    """Keys typed in text and what is left of an escape sequence cut in the
+    middle (to be parsed again with the next read)."""
+
+    keys: list[Key] = []
+    position = 0
+    while position < len(text):
+        char = text[position]
+        if char == '\x1b':
+            if position + 1 == len(text):
+                # A lone escape: nothing else came in the same read
+                keys.append(Key(ESCAPE))
+                position += 1
+                continue
+            if text[position + 1] not in '[O':
+                keys.append(Key(ESCAPE))
+                position += 1
+                continue
+            end = position + 2
+            # Parameters, then the final character of the sequence
+            while end < len(text) and not '\x40' <= text[end] <= '\x7e':
+                end += 1
+            if end == len(text):
+                return keys, text[position:]
+            if text[end] in ARROWS:
+                keys.append(Key(ARROWS[text[end]]))
+            # Other sequences (function keys...) are ignored
+            position = end + 1
+        elif char in CONTROL_KEYS:
+            keys.append(Key(CONTROL_KEYS[char]))
+            # \r\n is a single enter
+            position += 2 if text.startswith('\r\n', position) else 1
+        elif char.isprintable():
+            keys.append(Key(CHAR, char))
+            position += 1
+        else:
+            position += 1
+    return keys, ''
+
+
+class Keyboard:
+    def __init__(self, stdin: TextIO = sys.stdin, echo: TextIO = sys.stdout) -> None:
+        self.stdin = stdin
+        self.echo = echo
+        self.keys: asyncio.Queue[Key] = asyncio.Queue()
+        self._decoder = codecs.getincrementaldecoder(getattr(stdin, 'encoding', None) or 'utf-8')('replace')
+        self._pending = ''
+        self._saved_mode: list | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def interactive(self) -> bool:
+        return self.stdin.isatty()
+
+    def feed(self, text: str) -> None:
+        """Queues the keys typed in text."""
+
+        keys, self._pending = parse_keys(self._pending + text)
+        for key in keys:
+            self.keys.put_nowait(key)
+
+    def _on_readable(self) -> None:
+        try:
+            data = os.read(self.stdin.fileno(), READ_SIZE)
+        except BlockingIOError:
+            return
+        if not data:
+            # End of input: nobody will press enter again
+            assert self._loop is not None
+            self._loop.remove_reader(self.stdin.fileno())
+            self.feed(self._decoder.decode(b'', final=True) + '\n')
+            return
+        self.feed(self._decoder.decode(data))
+
+    def _read_console(self) -> None:
+        assert self._loop is not None
+        while True:
+            char = msvcrt.getwch()
+            if char in WINDOWS_PREFIXES:
+                name = WINDOWS_ARROWS.get(msvcrt.getwch())
+                if name is not None:
+                    self._loop.call_soon_threadsafe(self.keys.put_nowait, Key(name))
+                continue
+            self._loop.call_soon_threadsafe(self.feed, char)
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        if os.name == 'nt':
+            threading.Thread(target=self._read_console, daemon=True).start()
+            return
+        fd = self.stdin.fileno()
+        if self.interactive:
+            self._saved_mode = termios.tcgetattr(fd)
+            tty.setcbreak(fd)
+        self._loop.add_reader(fd, self._on_readable)
+
+    def stop(self) -> None:
+        if os.name == 'nt' or self._loop is None:
+            return
+        fd = self.stdin.fileno()
+        self._loop.remove_reader(fd)
+        if self._saved_mode is not None:
+            termios.tcsetattr(fd, termios.TCSADRAIN, self._saved_mode)
+            self._saved_mode = None
+
+    async def __aenter__(self) -> 'Keyboard':
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        self.stop()
+
+    async def key(self) -> Key:
+        return await self.keys.get()
+
+    def __aiter__(self) -> AsyncIterator[Key]:
+        return self
+
+    async def __anext__(self) -> Key:
+        return await self.keys.get()
+
+    def _write(self, text: str) -> None:
+        self.echo.write(text)
+        self.echo.flush()
+
+    async def line(self, prompt: str = '') -> str:
+        """A line typed after prompt, echoed as it is edited (input() for the
+        event loop)."""
+
+        self._write(prompt)
+        chars: list[str] = []
+        while (key := await self.keys.get()).name != ENTER:
+            if key.name == CHAR:
+                chars.append(key.char)
+                self._write(key.char)
+            elif key.name == BACKSPACE and chars:
+                chars.pop()
+                self._write('\b \b')
+        self._write('\n')
+        return ''.join(chars)
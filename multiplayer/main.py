@@ -12,24 +12,64 @@ from models import (
 )
 
 
-from server import host
+from server import host, DEFAULT_HOST, DEFAULT_PORT
+import argparse
+from pathlib import Path
 import asyncio
 from websockets.asyncio.server import Server as WSServer, serve
 from client import client, PlayerHostType
+from profiler import DEFAULT_PROFILE_DIR, DEFAULT_RATE
+from rooms import new_room_code
+from workers import serve_workers
 
 
-async def main() -> None:
-    # Ask to user to host or join another host
-    if mode := input('Host or Join? (H/J) ').capitalize()[0]:
+async def main(
+    profile_dir: Path | None = None,
+    profile_rate: float = DEFAULT_RATE,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+) -> None:
+    # Ask to user to host, join another host, be matched with other players or watch a game
+    if mode := input('Host, Join, Match or Spectate? (H/J/M/S) ').capitalize()[0]:
         if mode.startswith('H'):
             
-            await asyncio.gather(host(), client(PlayerHostType.HOST))
+            room_code = new_room_code()
+            await asyncio.gather(host(room_code, profile_dir, profile_rate), client(PlayerHostType.HOST, room_code))
             
         if mode.startswith('J'):
             # Client mode
             await client(PlayerHostType.PLAYER)
+
+        if mode.startswith('M'):
+            # Matchmaking on the server at --host and --port
+            await client(PlayerHostType.MATCH, host=host, port=port)
+
+        if mode.startswith('S'):
+            # Watching a room of the server at --host and --port
+            await client(PlayerHostType.SPECTATE, host=host, port=port)
+    
+    
     
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Cards Against Humanity multiplayer')
+    parser.add_argument('--workers', type=int, help='Only run the server, with this many worker processes')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--state-dir', type=Path, help='Save the rooms here to recover them after a restart')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on this port (and the next ones with --workers)')
+    parser.add_argument(
+        '--profile', nargs='?', type=Path, const=DEFAULT_PROFILE_DIR, metavar='DIR',
+        help=f'Sample the server and write flame graph stacks here (default: {DEFAULT_PROFILE_DIR})',
+    )
+    parser.add_argument('--profile-rate', type=float, default=DEFAULT_RATE, help='Samples per second')
+    return parser.parse_args()
     
     
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    args = parse_args()
+    if args.workers:
+        serve_workers(
+            args.workers, args.host, args.port, args.state_dir, args.metrics_port, args.profile, args.profile_rate
+        )
+    else:
+        asyncio.run(main(args.profile, args.profile_rate, args.host, args.port))
\ No newline at end of file
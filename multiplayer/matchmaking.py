@@ -0,0 +1,173 @@
+"""Matchmaking queues.
+
+Players without a room code wait for a game with the settings they want
+(deck, hand size and rounds). Every combination of settings has its own
+priority queue, a heap ordered by arrival, so enqueueing and taking a
+player are O(log n) however many players wait.
+
+A group is matched into a room as soon as ROOM_SIZE players wait for the
+same settings. Smaller groups (of at least the minimum player count) are
+matched once the first of them has waited MAX_WAIT seconds, so nobody waits
+long for a full room when there are enough players for a game.
+
+Leaving the queue only marks the ticket: it is dropped when it gets to the
+top of its heap (or when the heap is rebuilt because most of it is gone).
+"""
+import heapq
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, NamedTuple
+from uuid import UUID
+
+from timers import Timer, timer_wheel
+
+
+ROOM_SIZE: int = 6
+MAX_WAIT: float = 5.0
+# Heaps are rebuilt when they have this many times more entries than tickets
+COMPACT_RATIO: int = 4
+COMPACT_MIN: int = 64
+
+
+class QueueKey(NamedTuple):
+    """Settings players must agree on to play together."""
+
+    deck: str
+    max_hand_size: int
+    max_rounds: int
+
+
+@dataclass(eq=False)
+class Ticket:
+    connection_id: UUID
+    key: QueueKey
+    enqueued_at: float = field(default_factory=time.monotonic)
+    # False once matched or cancelled
+    waiting: bool = True
+
+
+class MatchQueue:
+    """Heap of the tickets waiting for one QueueKey."""
+
+    __slots__ = ('heap', 'waiting', 'timer')
+
+    def __init__(self) -> None:
+        # (enqueued_at, sequence, ticket)
+        self.heap: list[tuple[float, int, Ticket]] = []
+        self.waiting = 0
+        # Fires when the first ticket has waited long enough (see Matchmaker)
+        self.timer: Timer | None = None
+
+    def push(self, ticket: Ticket, sequence: int) -> None:
+        heapq.heappush(self.heap, (ticket.enqueued_at, sequence, ticket))
+        self.waiting += 1
+
+    def first(self) -> Ticket:
+        """The next ticket to be matched (there must be one)."""
+
+        while not self.heap[0][-1].waiting:
+            heapq.heappop(self.heap)
+        return self.heap[0][-1]
+
+    def pop(self) -> Ticket:
+        ticket = self.first()
+        heapq.heappop(self.heap)
+        self.waiting -= 1
+        return ticket
+
+    def discard(self) -> None:
+        """Accounts for a ticket that stopped waiting."""
+
+        self.waiting -= 1
+        if len(self.heap) > max(COMPACT_MIN, COMPACT_RATIO * self.waiting):
+            self.heap = [entry for entry in self.heap if entry[-1].waiting]
+            heapq.heapify(self.heap)
+
+
+class Matchmaker:
+    def __init__(self, min_size: int, room_size: int = ROOM_SIZE, max_wait: float | None = MAX_WAIT) -> None:
+        if not 0 < min_size <= room_size:
+            raise ValueError(f'Invalid group sizes ({min_size} to {room_size})')
+        self.min_size = min_size
+        self.room_size = room_size
+        # None to only match full rooms
+        self.max_wait = max_wait
+        self.queues: dict[QueueKey, MatchQueue] = {}
+        self.tickets: dict[UUID, Ticket] = {}
+        # Called with every group matched
+        self.on_match: Callable[[QueueKey, list[Ticket]], Any] | None = None
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.tickets)
+
+    def __contains__(self, connection_id: UUID) -> bool:
+        return connection_id in self.tickets
+
+    def waiting(self, key: QueueKey) -> int:
+        queue = self.queues.get(key)
+        return 0 if queue is None else queue.waiting
+
+    def enqueue(self, connection_id: UUID, key: QueueKey) -> Ticket:
+        """Queues a connection (again, if it was waiting with other settings)
+        and matches its group if this completes one."""
+
+        self.cancel(connection_id)
+        ticket = Ticket(connection_id, key)
+        self.tickets[connection_id] = ticket
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = MatchQueue()
+        queue.push(ticket, next(self._sequence))
+        self._check(key, queue)
+        return ticket
+
+    def cancel(self, connection_id: UUID) -> bool:
+        ticket = self.tickets.pop(connection_id, None)
+        if ticket is None:
+            return False
+        queue = self.queues[ticket.key]
+        was_first = queue.first() is ticket
+        ticket.waiting = False
+        queue.discard()
+        if not queue.waiting:
+            self._drop(ticket.key)
+        elif was_first and queue.timer is not None:
+            # The wait is now counted from the next oldest ticket
+            queue.timer.cancel()
+            queue.timer = None
+            self._check(ticket.key, queue)
+        return True
+
+    def _drop(self, key: QueueKey) -> None:
+        queue = self.queues.pop(key)
+        if queue.timer is not None:
+            queue.timer.cancel()
+
+    def _match(self, key: QueueKey, queue: MatchQueue, size: int) -> None:
+        group = [queue.pop() for _ in range(size)]
+        for ticket in group:
+            ticket.waiting = False
+            del self.tickets[ticket.connection_id]
+        if not queue.waiting:
+            self._drop(key)
+        if self.on_match is not None:
+            self.on_match(key, group)
+
+    def _check(self, key: QueueKey, queue: MatchQueue) -> None:
+        while queue.waiting >= self.room_size:
+            self._match(key, queue, self.room_size)
+        if self.max_wait is not None and queue.timer is None and queue.waiting >= self.min_size:
+            delay = queue.first().enqueued_at + self.max_wait - time.monotonic()
+            queue.timer = timer_wheel().schedule(max(0.0, delay), lambda: self._expire(key))
+
+    def _expire(self, key: QueueKey) -> None:
+        queue = self.queues.get(key)
+        if queue is None:
+            return
+        queue.timer = None
+        if queue.waiting >= self.min_size:
+            self._match(key, queue, min(queue.waiting, self.room_size))
+        if key in self.queues:
+            self._check(key, queue)
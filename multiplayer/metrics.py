@@ -0,0 +1,202 @@
+"""Server metrics in the Prometheus text format.
+
+Counters and histograms are plain Python objects updated in place (an
+addition, or a bisect and two additions for a histogram), cheap enough for
+every message. Gauges are read when the metrics are scraped, so keeping them
+up to date costs nothing. The metrics are served on their own HTTP port:
+
+    curl http://localhost:9100/metrics
+"""
+import asyncio
+from bisect import bisect_left
+from functools import wraps
+from time import perf_counter
+from typing import Awaitable, Callable, Iterator, ParamSpec
+
+from loguru import logger
+
+
+DEFAULT_METRICS_PORT: int = 9100
+# Seconds
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0,
+)
+
+P = ParamSpec('P')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Metric:
+    kind: str
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = labels
+
+    def header(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind}'
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labels)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.values.items():
+            yield f'{self.name}{_labels(self.label_names, labels)} {_number(value)}'
+
+
+class Gauge(Metric):
+    """Value read from a function when the metrics are scraped."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]) -> None:
+        super().__init__(name, help)
+        self.read = read
+
+    def samples(self) -> Iterator[str]:
+        yield f'{self.name} {_number(self.read())}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        # Per label values: count per bucket (the last one is +Inf) and sum
+        self.counts: dict[tuple[str, ...], list[int]] = {}
+        self.sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def samples(self) -> Iterator[str]:
+        for labels, counts in self.counts.items():
+            total = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                total += count
+                le = f'le="{bound}"'
+                yield f'{self.name}_bucket{_labels(self.label_names, labels, le)} {total}'
+            yield f'{self.name}_sum{_labels(self.label_names, labels)} {self.sums[labels]!r}'
+            yield f'{self.name}_count{_labels(self.label_names, labels)} {total}'
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))  # type: ignore[return-value]
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Histogram:
+        return self.register(Histogram(name, help, labels))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, help, read))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    'cah_handler_seconds', 'Time spent handling each type of request', ('request',)
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    'cah_handler_errors_total', 'Requests whose handler raised', ('request',)
+)
+MESSAGES_IN = REGISTRY.counter('cah_messages_received_total', 'Messages received', ('request',))
+INVALID_MESSAGES = REGISTRY.counter('cah_invalid_messages_total', 'Frames that could not be decoded')
+BYTES_IN = REGISTRY.counter('cah_bytes_received_total', 'Bytes of the frames received')
+BYTES_OUT = REGISTRY.counter('cah_bytes_sent_total', 'Bytes of the frames sent')
+DROPPED_CLIENTS = REGISTRY.counter('cah_dropped_clients_total', 'Clients closed because their outbox (or write buffer) was full')
+
+
+def instrument(name: str, handler: Callable[P, Awaitable[None]]) -> Callable[P, Awaitable[None]]:
+    """Wraps a protocol handler to count it and time it."""
+
+    @wraps(handler)
+    async def instrumented(*args: P.args, **kwargs: P.kwargs) -> None:
+        start = perf_counter()
+        try:
+            await handler(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(perf_counter() - start, name)
+
+    return instrumented
+
+
+async def _serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await reader.readline()
+        # Headers are not needed
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        if request_line.split()[:2] == [b'GET', b'/metrics']:
+            body = REGISTRY.render().encode()
+            status = b'200 OK'
+        else:
+            body = b'Not found\n'
+            status = b'404 Not Found'
+        writer.write(
+            b'HTTP/1.1 %s\r\nContent-Type: text/plain; version=0.0.4\r\n'
+            b'Content-Length: %d\r\nConnection: close\r\n\r\n' % (status, len(body))
+        )
+        writer.write(body)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(host: str, port: int) -> asyncio.Server:
+    server = await asyncio.start_server(_serve_metrics, host, port)
+    logger.info(f'Metrics on http://{host}:{port}/metrics')
+    return server
@@ -1,15 +1,27 @@
 import random
-import time
+from array import array
 from enum import Enum, auto
 from html import unescape
-from typing import Annotated, TypeVar, Any
+from typing import Annotated, Iterable, Sequence, TypeVar, Any
+from pathlib import Path
 from uuid import uuid4
 
-from pydantic import AfterValidator, BaseModel, BeforeValidator, Field
+from pydantic import (
+    AfterValidator,
+    BaseModel,
+    ConfigDict,
+    Field,
+    PrivateAttr,
+    computed_field,
+    model_validator,
+)
 from pydantic.types import UUID4
+from pydantic_core import to_json
 from enum import IntEnum, auto
 
-class CAHDrawingListEmpty(Exception): ...
+from cards import CardIds, CardTable, card_ids
+from deckfile import CompiledDeck, ensure_compiled, load_compiled
+from drawing import CAHDrawingListEmpty, DrawPile, seeded_rng
 
 
 T = TypeVar("T")
@@ -18,6 +30,8 @@ T = TypeVar("T")
 class PlayerRole(str, Enum):
     JUDGE = "judge"
     PLAYER = "player"
+    # Watches the public state of a game without playing (see sync.py)
+    SPECTATOR = "spectator"
 
 
 class Card(BaseModel):
@@ -36,65 +50,199 @@ class Player(BaseModel):
     id: UUID4 = Field(default_factory=uuid4)
     color: None | str = None
     role: PlayerRole = PlayerRole.PLAYER
-    hand: list[WhiteCard] = Field(default_factory=list)
-    selected_cards: list[WhiteCard] = Field(default_factory=list)
+    hand: CardIds = Field(default_factory=card_ids)
+    selected_cards: CardIds = Field(default_factory=card_ids)
     score: int = 0
+    ready: bool = False
 
 
 def random_subset_choice_with_tracking(
     drawing_list: list[T],
     tracking_list: list[T],
     total: int = 1,
+    rng: random.Random | None = None,
 ) -> list[T]:
     """Returns a subset of "total" length of random items from the drawing_list.
 
     It updates both drawing_list and tracking_list so that the items are removed
-    from the drawing_list and added into the tracking_list.
+    from the drawing_list and added into the tracking_list. Each chosen item is
+    swapped with the last one before popping it, so the order of drawing_list
+    is not kept but every draw is O(1). Draws from rng if given (the global
+    generator otherwise).
     """
 
     if total > len(drawing_list):
         raise CAHDrawingListEmpty
 
+    randrange = (rng if rng is not None else random).randrange
     choices: list[T] = []
 
     for _ in range(total):
-        choice = drawing_list.pop(random.randrange(len(drawing_list)))
+        index = randrange(len(drawing_list))
+        drawing_list[index], drawing_list[-1] = drawing_list[-1], drawing_list[index]
+        choice = drawing_list.pop()
         tracking_list.append(choice)
         choices.append(choice)
 
     return choices
 
 
+def _card_text(card: Any) -> str:
+    if isinstance(card, Card):
+        return card.text
+    if isinstance(card, dict):
+        return unescape(card["text"])
+    return unescape(card)
+
+
 class Deck(BaseModel):
+    """Deck of cards backed by a shared, immutable CardTable.
+
+    The cards are not kept as pydantic models: "blackCards" and "whiteCards"
+    are turned into a CardTable when the deck is validated, and every card is
+    referred to by its id from then on. The black_cards and white_cards
+    properties build the card models on demand (and are what gets serialized).
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True, populate_by_name=True)
+
     name: str
     code_name: str = Field(alias="codeName")
     official: bool
-    black_cards: list[BlackCard] = Field(alias="blackCards", default_factory=list)
-    white_cards: Annotated[
-        list[WhiteCard],
-        BeforeValidator(lambda x: [WhiteCard(text=text) for text in x]),
-    ] = Field(alias="whiteCards", default_factory=list)
+    table: CardTable = Field(exclude=True)
+    # SHA-256 of the deck once it is published (see deckcache.py)
+    digest: str | None = Field(default=None, exclude=True)
+
+    _black_pile: DrawPile[str] = PrivateAttr()
+    _white_pile: DrawPile[str] = PrivateAttr()
+
+    @model_validator(mode="before")
+    @classmethod
+    def build_table(cls, data: Any) -> Any:
+        if not isinstance(data, dict) or "table" in data:
+            return data
+        data = dict(data)
+        black_cards = data.pop("blackCards", data.pop("black_cards", []))
+        white_cards = data.pop("whiteCards", data.pop("white_cards", []))
+        data["table"] = CardTable(
+            white_texts=(_card_text(card) for card in white_cards),
+            black_texts=(_card_text(card) for card in black_cards),
+            picks=(card.pick if isinstance(card, BlackCard) else card["pick"] for card in black_cards),
+        )
+        return data
+
+    def model_post_init(self, context: Any) -> None:
+        self.seed()
+
+    def seed(self, seed: int | None = None) -> None:
+        """Puts every card back in the piles, which draw from their own
+        generators: seeded with seed or, without one, from the OS."""
+
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        self._black_pile = DrawPile(self.table.black_texts, seeded_rng(seed, 'black'))
+        self._white_pile = DrawPile(self.table.white_texts, seeded_rng(seed, 'white'))
+
+    def fresh(self, seed: int | None = None) -> "Deck":
+        """Same deck (sharing its CardTable) with every card back in the
+        piles, seeded with seed (see seed)."""
+
+        deck = Deck.model_construct(
+            name=self.name,
+            code_name=self.code_name,
+            official=self.official,
+            table=self.table,
+            digest=self.digest,
+        )
+        if seed is not None:
+            deck.seed(seed)
+        return deck
+
+    def black_card(self, card_id: int) -> BlackCard:
+        return BlackCard.model_construct(
+            text=self.table.black_text(card_id),
+            pick=self.table.pick(card_id),
+        )
 
-    used_black_cards: list[BlackCard] = Field(default_factory=list)
-    used_white_cards: list[WhiteCard] = Field(default_factory=list)
+    def white_card(self, card_id: int) -> WhiteCard:
+        return WhiteCard.model_construct(text=self.table.white_text(card_id))
 
-    def draw_black_cards(self, total: int = 1) -> list[BlackCard]:
-        """Draw a random black card."""
+    def white_cards_of(self, card_ids: Iterable[int]) -> list[WhiteCard]:
+        return [self.white_card(card_id) for card_id in card_ids]
+
+    @computed_field(alias="blackCards")
+    @property
+    def black_cards(self) -> list[BlackCard]:
+        return [self.black_card(card_id) for card_id in range(self.table.black_count)]
+
+    @computed_field(alias="whiteCards")
+    @property
+    def white_cards(self) -> list[WhiteCard]:
+        return self.white_cards_of(range(self.table.white_count))
+
+    @property
+    def used_black_cards(self) -> list[BlackCard]:
+        return [self.black_card(card_id) for card_id in self._black_pile.used_ids()]
+
+    @property
+    def used_white_cards(self) -> list[WhiteCard]:
+        return self.white_cards_of(self._white_pile.used_ids())
+
+    def draw_black_ids(self, total: int = 1) -> array:
+        """Draw "total" random black card ids."""
+
+        return self._black_pile.draw_ids(total)
+
+    def draw_white_ids(self, total: int = 1) -> array:
+        """Draw "total" random white card ids."""
+
+        return self._white_pile.draw_ids(total)
 
-        return random_subset_choice_with_tracking(
-            self.black_cards,
-            self.used_black_cards,
-            total,
+    def drawn_ids(self) -> tuple[array, array]:
+        """Black and white card ids drawn so far, in drawing order."""
+
+        return self._black_pile.used_ids(), self._white_pile.used_ids()
+
+    def replay_ids(self, black: Sequence[int] = (), white: Sequence[int] = ()) -> None:
+        """Draws the given card ids again (to put a deck back where it was)."""
+
+        self._black_pile.replay_ids(black)
+        self._white_pile.replay_ids(white)
+
+    def card_sequence(self, seed: int) -> tuple[array, array]:
+        """Every black and white card id in the order a deck seeded with
+        seed (see fresh) draws them."""
+
+        return (
+            DrawPile(range(self.table.black_count), seeded_rng(seed, 'black')).draw_ids(self.table.black_count),
+            DrawPile(range(self.table.white_count), seeded_rng(seed, 'white')).draw_ids(self.table.white_count),
         )
 
+    def draw_black_cards(self, total: int = 1) -> list[BlackCard]:
+        """Draw "total" random black cards."""
+
+        return [self.black_card(card_id) for card_id in self.draw_black_ids(total)]
+
     def draw_white_cards(self, total: int = 1) -> list[WhiteCard]:
-        """Draw a random white card."""
+        """Draw "total" random white cards."""
+
+        return self.white_cards_of(self.draw_white_ids(total))
+
+def load_deck(json_path: Path) -> Deck:
+    """Loads a deck from its compiled file (compiling it first if needed)
+    without parsing or validating any card."""
+
+    return deck_from_compiled(load_compiled(ensure_compiled(json_path)))
+
+
+def deck_from_compiled(compiled: CompiledDeck) -> Deck:
+    return Deck.model_construct(
+        name=compiled.name,
+        code_name=compiled.code_name,
+        official=compiled.official,
+        table=CardTable.wrap(compiled.white_texts, compiled.black_texts, compiled.picks),
+    )
 
-        return random_subset_choice_with_tracking(
-            self.white_cards,
-            self.used_white_cards,
-            total,
-        )
 
 class NetworkRequest(str, Enum):
     DISCONNECT = auto()
@@ -104,6 +252,12 @@ class NetworkRequest(str, Enum):
     GET_GAME_STATE = auto()
     SET_PLAYER_INFO = auto()
     SET_PLAYER_CHOICES = auto()
+    CREATE_ROOM = auto()
+    JOIN_ROOM = auto()
+    STATE_DELTA = auto()
+    COUNTDOWN = auto()
+    GET_DECK = auto()
+    MATCHMAKE = auto()
     
 class Message(BaseModel):
     type: NetworkRequest
@@ -126,7 +280,8 @@ class GameSettings(BaseModel):
     max_hand_size: int = 5
     max_round_time: int = 30
     max_rounds: int = 3
-    random_seed: int = int(time.time())
+    # Every room draws its cards from its own generators, seeded with this
+    random_seed: int = Field(default_factory=lambda: random.getrandbits(32))
 
 
 class Phase(str, Enum):
@@ -135,8 +290,61 @@ class Phase(str, Enum):
     JUDGEMENT = auto()
 
 
+# Fields that never leave the server: the deck (with every undrawn card) and
+# the players' hands.
+PUBLIC_STATE_EXCLUDE: dict[str, Any] = {
+    'settings': {'deck'},
+    'players': {'__all__': {'hand', 'selected_cards'}},
+}
+
+
 class GameState(BaseModel):
+    """State of a game. Every change must bump the version (see sync.py):
+    the serialized public view is cached per version."""
+
     settings: GameSettings
+    version: int = 0
     phase: Phase = Phase.SETUP  
     players: list[Player] = []
-    black_card: BlackCard | None = None
\ No newline at end of file
+    # Id of the black card of the round in the deck of the settings
+    black_card_id: int | None = None
+
+    _public_view: tuple[int, bytes] | None = PrivateAttr(default=None)
+
+    def player(self, player_id: UUID4) -> Player:
+        for player in self.players:
+            if player.id == player_id:
+                return player
+        raise KeyError(player_id)
+
+    def public_view(self) -> bytes:
+        """What every player can see, as JSON. Serialized once per version."""
+
+        if self._public_view is None or self._public_view[0] != self.version:
+            state = self.model_dump(mode='json', exclude=PUBLIC_STATE_EXCLUDE)
+            state['settings']['deck'] = self.settings.deck.name
+            state['settings']['deck_digest'] = self.settings.deck.digest
+            self._public_view = (self.version, to_json(state))
+        return self._public_view[1]
+
+    def private_view(self, player_id: UUID4) -> bytes:
+        """What only the given player can see (their hand), as JSON. Cards go
+        as their ids in the deck."""
+
+        player = self.player(player_id)
+        return to_json({
+            'hand': player.hand.tolist(),
+            'selected_cards': player.selected_cards.tolist(),
+        })
+
+    def projection(self, player_id: UUID4 | None = None) -> bytes:
+        """Data of the GET_GAME_STATE message for one recipient, as JSON: the
+        shared public view plus their private view (if they are a player)."""
+
+        data = b'{"version":%d,"state":%s' % (self.version, self.public_view())
+        if player_id is not None:
+            try:
+                data += b',"private":' + self.private_view(player_id)
+            except KeyError:
+                pass
+        return data + b'}'
@@ -0,0 +1,84 @@
+import asyncio
+
+from loguru import logger
+from websockets.asyncio.server import ServerConnection
+from websockets.exceptions import ConnectionClosed
+from websockets.frames import CloseCode
+
+from codec import codec_for
+from metrics import BYTES_OUT, DROPPED_CLIENTS
+from models import Message, NetworkRequest
+
+
+OUTBOX_SIZE: int = 64
+
+
+def drop_client(websocket: ServerConnection) -> asyncio.Task[None]:
+    """Closes the connection of a client that does not keep up with us."""
+
+    logger.warning(f'Dropping slow client {websocket.remote_address}')
+    DROPPED_CLIENTS.inc()
+    return asyncio.create_task(websocket.close(CloseCode.TRY_AGAIN_LATER, 'Too slow'))
+
+
+class Outbox:
+    """Bounded queue of encoded frames for one connection.
+
+    A writer task sends the frames in order, so a slow client only slows down
+    its own queue. Replies to the client's own requests wait for room in the
+    queue (backpressure on its receive loop). Broadcasts never wait: if the
+    queue of a client is full, that client is disconnected instead.
+    """
+
+    def __init__(self, websocket: ServerConnection, maxsize: int = OUTBOX_SIZE) -> None:
+        self.websocket = websocket
+        self.codec = codec_for(websocket)
+        self.queue: asyncio.Queue[bytes] = asyncio.Queue(maxsize)
+        self._writer: asyncio.Task[None] | None = None
+        # Closing task of a client that was dropped (see offer)
+        self._closing: asyncio.Task[None] | None = None
+
+    @property
+    def dropped(self) -> bool:
+        return self._closing is not None
+
+    def start(self) -> None:
+        self._writer = asyncio.create_task(self._write())
+
+    async def _write(self) -> None:
+        text = self.codec.text
+        while True:
+            frame = await self.queue.get()
+            try:
+                await self.websocket.send(frame, text=text)
+            except ConnectionClosed:
+                return
+            BYTES_OUT.inc(amount=len(frame))
+
+    async def send(self, message: Message) -> None:
+        await self.queue.put(self.codec.encode(message))
+
+    async def send_raw(self, request: NetworkRequest, data: bytes) -> None:
+        await self.queue.put(self.codec.encode_raw(request, data))
+
+    def offer(self, frame: bytes) -> bool:
+        """Queues a frame already encoded with this outbox's codec without
+        waiting. Returns False (and drops the client) if the queue is full,
+        or if the client was already dropped."""
+
+        if self.dropped:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            self._closing = drop_client(self.websocket)
+            return False
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
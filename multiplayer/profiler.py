@@ -0,0 +1,141 @@
+"""Opt-in sampling profiler.
+
+A background thread looks at the stack of the profiled thread `rate` times
+per second and counts it. Profiles are written as collapsed stacks (one line
+per distinct stack, root first, frames separated by ";", then the number of
+samples), the input of flamegraph.pl, inferno or speedscope:
+
+    flamegraph.pl profiles/room-ABCDE-20250101-120000.folded > room.svg
+
+Samples are tagged by the functions on the stack: tag() registers a function
+whose frames add tags (the phase, the request being handled...) read from
+their local variables when the sample is taken. Tags go at the root of the
+stacks, so the flame graph is split by phase and request first.
+
+Nothing is hooked into the profiled code, so it runs exactly as usual when
+profiling is off.
+"""
+import inspect
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import CodeType, FrameType
+from typing import Any, Callable, Mapping
+
+
+DEFAULT_RATE: float = 100.0
+DEFAULT_PROFILE_DIR: Path = Path('profiles')
+PROFILE_EXTENSION: str = '.folded'
+# Tags written at the root of every stack, in this order
+PREFIX_TAGS: tuple[str, ...] = ('phase', 'request')
+
+Tagger = Callable[[FrameType], Mapping[str, str] | None]
+# Tags of a sample (sorted key/value pairs) and its collapsed stack
+SampleKey = tuple[tuple[tuple[str, str], ...], str]
+
+
+class Profiler:
+    def __init__(
+        self,
+        directory: Path = DEFAULT_PROFILE_DIR,
+        rate: float = DEFAULT_RATE,
+        thread: threading.Thread | None = None,
+    ) -> None:
+        """Profiles "thread" (the current one by default)."""
+
+        if rate <= 0:
+            raise ValueError('The sampling rate must be positive')
+        self.directory = directory
+        self.interval = 1 / rate
+        self.thread_id = (thread or threading.current_thread()).ident
+        self.samples: Counter[SampleKey] = Counter()
+        self.taggers: dict[CodeType, Tagger] = {}
+        self._names: dict[CodeType, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: threading.Thread | None = None
+
+    def tag(self, function: Callable[..., Any], tagger: Tagger) -> None:
+        """Tags the samples taken while "function" runs. The tags of inner
+        frames win over the ones of outer frames."""
+
+        self.taggers[inspect.unwrap(function).__code__] = tagger
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def __enter__(self) -> 'Profiler':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)  # type: ignore[arg-type]
+            if frame is None:
+                # The profiled thread is gone
+                return
+            self.sample(frame)
+            del frame
+
+    def sample(self, frame: FrameType | None) -> None:
+        names: list[str] = []
+        tags: dict[str, str] = {}
+        taggers = self.taggers
+        while frame is not None:
+            code = frame.f_code
+            name = self._names.get(code)
+            if name is None:
+                name = self._names[code] = frame_name(code)
+            names.append(name)
+            tagger = taggers.get(code)
+            if tagger is not None:
+                for key, value in (tagger(frame) or {}).items():
+                    # Going outwards: the innermost frame already set it
+                    tags.setdefault(key, value)
+            frame = frame.f_back
+        names.reverse()
+        with self._lock:
+            self.samples[tuple(sorted(tags.items())), ';'.join(names)] += 1
+
+    def collapsed(self, match: Callable[[dict[str, str]], bool] | None = None) -> list[str]:
+        """Takes the samples whose tags match out of the profiler, as
+        collapsed stacks."""
+
+        with self._lock:
+            taken = [key for key in self.samples if match is None or match(dict(key[0]))]
+            counts = [(key, self.samples.pop(key)) for key in taken]
+        lines: Counter[str] = Counter()
+        for (tags, stack), count in counts:
+            values = dict(tags)
+            prefix = ''.join(f'{tag}:{values[tag]};' for tag in PREFIX_TAGS if tag in values)
+            lines[prefix + stack] += count
+        return [f'{stack} {count}' for stack, count in sorted(lines.items())]
+
+    def write(self, name: str, match: Callable[[dict[str, str]], bool] | None = None) -> Path | None:
+        """Writes the samples whose tags match to "<name>-<time>.folded"
+        (nothing if there is none)."""
+
+        lines = self.collapsed(match)
+        if not lines:
+            return None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f'{name}-{time.strftime("%Y%m%d-%H%M%S")}{PROFILE_EXTENSION}'
+        path.write_text('\n'.join(lines) + '\n')
+        return path
+
+
+def frame_name(code: CodeType) -> str:
+    return f'{code.co_qualname} ({Path(code.co_filename).name}:{code.co_firstlineno})'.replace(';', ',')
@@ -0,0 +1,317 @@
+import random
+import string
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable
+from uuid import UUID
+
+from loguru import logger
+from pydantic_core import to_json
+from websockets.asyncio.server import ServerConnection
+
+from cards import card_ids
+from eventlog import LOG_NAME, EventLog, RecordKind, RoomLog, read_log, read_snapshot
+from models import Deck, GameSettings, GameState, NetworkRequest, Player
+from sync import PlayerLeft, PlayerReconnected, StateSync, apply_delta, parse_deltas
+from timers import Timer, timer_wheel
+
+
+ROOM_CODE_LENGTH: int = 5
+# No 0/O or 1/I so codes can be read out loud
+ROOM_CODE_ALPHABET: str = ''.join(c for c in string.ascii_uppercase + string.digits if c not in '01IO')
+# Seconds players have to reconnect to a recovered room before it is removed
+RECLAIM_TIMEOUT: float = 120.0
+
+
+class RoomNotFound(Exception): ...
+
+
+def new_room_code() -> str:
+    return ''.join(random.choices(ROOM_CODE_ALPHABET, k=ROOM_CODE_LENGTH))
+
+
+@dataclass(frozen=True)
+class Shard:
+    """One of the worker processes of a server. Room codes are split between
+    workers by their hash, so every process knows who owns any room."""
+
+    index: int
+    count: int
+
+    @staticmethod
+    def owner(code: str, count: int) -> int:
+        return zlib.crc32(code.upper().encode()) % count
+
+    def owns(self, code: str) -> bool:
+        return self.owner(code, self.count) == self.index
+
+    @staticmethod
+    def direct_port(port: int, index: int) -> int:
+        """Besides the shared port, worker i also listens on port + 1 + i so
+        that clients can be redirected to it."""
+
+        return port + 1 + index
+
+
+@dataclass
+class Room:
+    code: str
+    game_state: GameState
+    clients: dict[UUID, Player] = field(default_factory=dict)
+    connections: dict[UUID, ServerConnection] = field(default_factory=dict)
+    # Connections watching the game instead of playing (PlayerRole.SPECTATOR)
+    spectators: set[UUID] = field(default_factory=set)
+    finished: bool = False
+    # Deck file name (without extension), to load it again on recovery
+    deck_name: str = ''
+    # Made by matchmaking: starts once every connection has joined the game
+    matched: bool = False
+    sync: StateSync = field(init=False)
+    # Deadline of the current phase (see timers.py)
+    deadline: Timer | None = None
+    log: RoomLog | None = None
+
+    def __post_init__(self) -> None:
+        self.sync = StateSync(self.game_state)
+
+    def attach_log(self, log: RoomLog) -> None:
+        self.log = log
+        self.sync.log = log
+
+    def snapshot(self) -> dict[str, Any]:
+        """Everything needed to rebuild the room (see RoomRegistry.recover)."""
+
+        settings = self.game_state.settings
+        black, white = settings.deck.drawn_ids()
+        return {
+            'code': self.code,
+            'deck': self.deck_name,
+            'settings': settings.model_dump(mode='json', exclude={'deck'}),
+            'state': self.game_state.model_dump(mode='json', exclude={'settings'}),
+            'black': black.tolist(),
+            'white': white.tolist(),
+        }
+
+    def unclaimed(self) -> list[Player]:
+        """Players of a recovered room whose client has not come back yet."""
+
+        return [player for player in self.game_state.players if player.id not in self.clients]
+
+    def reclaim(self, player_id: UUID, connection_id: UUID) -> Player:
+        """Gives an unclaimed player (hand, score and all) to the connection
+        of its returning client. Raises KeyError if there is no such player."""
+
+        if all(player.id != player_id for player in self.unclaimed()):
+            raise KeyError(player_id)
+        self.sync.apply(PlayerReconnected(player_id=player_id, id=connection_id))
+        player = self.clients[connection_id] = self.sync.player(connection_id)
+        return player
+
+    def set_deadline(self, seconds: float, on_expire: Callable[[], Any]) -> None:
+        """Replaces the deadline of the room. Its subscribers get a COUNTDOWN
+        message every second until it expires."""
+
+        self.cancel_deadline()
+        self.deadline = timer_wheel().schedule(seconds, on_expire, self._countdown)
+
+    def cancel_deadline(self) -> None:
+        if self.deadline is not None:
+            self.deadline.cancel()
+            self.deadline = None
+
+    def _countdown(self, remaining: int) -> None:
+        self.sync.broadcast(NetworkRequest.COUNTDOWN, to_json({
+            'phase': self.game_state.phase,
+            'remaining': remaining,
+        }))
+
+
+@dataclass
+class RoomRegistry:
+    """Every room hosted by a server, keyed by room code.
+
+    Connections are also indexed by their id, so creating, joining, leaving
+    and finding the room of a connection are all O(1).
+    """
+
+    rooms: dict[str, Room] = field(default_factory=dict)
+    connection_rooms: dict[UUID, str] = field(default_factory=dict)
+    # Only codes owned by this shard are handed out (see workers.py)
+    shard: Shard | None = None
+    # Where the changes of every room are recorded (see eventlog.py)
+    log: EventLog | None = None
+    # Called with every room that is removed, once its game is over
+    on_remove: Callable[[Room], Any] | None = None
+
+    def __len__(self) -> int:
+        return len(self.rooms)
+
+    def create(self, settings: GameSettings, code: str | None = None, deck_name: str = '') -> Room:
+        """Creates a room with its own game state (and its own draw piles)."""
+
+        if code is None:
+            code = new_room_code()
+            while code in self.rooms or (self.shard is not None and not self.shard.owns(code)):
+                code = new_room_code()
+        elif code in self.rooms:
+            raise ValueError(f'Room {code} already exists')
+
+        settings = settings.model_copy(update={'deck': settings.deck.fresh(settings.random_seed)})
+        room = Room(code=code, game_state=GameState(settings=settings), deck_name=deck_name)
+        self.rooms[code] = room
+        if self.log is not None:
+            room.attach_log(RoomLog(self.log, code))
+            room.log.created(deck_name, settings.model_dump(mode='json', exclude={'deck'}))  # type: ignore[union-attr]
+        return room
+
+    def get(self, code: str) -> Room:
+        try:
+            return self.rooms[code.upper()]
+        except KeyError:
+            raise RoomNotFound(code) from None
+
+    def join(self, code: str, websocket: ServerConnection) -> Room:
+        room = self.get(code)
+        self.leave(websocket)
+        room.connections[websocket.id] = websocket
+        self.connection_rooms[websocket.id] = room.code
+        return room
+
+    def room_of(self, websocket: ServerConnection) -> Room | None:
+        code = self.connection_rooms.get(websocket.id)
+        return None if code is None else self.rooms.get(code)
+
+    def leave(self, websocket: ServerConnection) -> Room | None:
+        """Takes a connection out of its room. Rooms that end up empty or
+        that are already finished are removed."""
+
+        code = self.connection_rooms.pop(websocket.id, None)
+        room = None if code is None else self.rooms.get(code)
+        if room is None:
+            return None
+        room.connections.pop(websocket.id, None)
+        room.sync.unsubscribe(websocket)
+        room.spectators.discard(websocket.id)
+        player = room.clients.pop(websocket.id, None)
+        if player is not None:
+            room.sync.apply(PlayerLeft(player_id=player.id))
+        if room.finished or not room.connections:
+            self.remove(room.code)
+        return room
+
+    def finish(self, code: str) -> None:
+        """Marks a room as finished. It is removed when its last connection
+        leaves (or right away if there is none)."""
+
+        room = self.rooms.get(code)
+        if room is None:
+            return
+        room.finished = True
+        if not room.connections:
+            self.remove(code)
+
+    def remove(self, code: str) -> None:
+        room = self.rooms.pop(code, None)
+        if room is None:
+            return
+        room.cancel_deadline()
+        if room.log is not None:
+            room.log.removed()
+        for connection_id in room.connections:
+            self.connection_rooms.pop(connection_id, None)
+        if self.on_remove is not None:
+            self.on_remove(room)
+
+    def attach_log(self, log: EventLog) -> None:
+        """Records the changes of every room from now on."""
+
+        self.log = log
+        for room in self.rooms.values():
+            room.attach_log(RoomLog(log, room.code))
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        return [room.snapshot() for room in self.rooms.values() if not room.finished]
+
+    def recover(self, directory: Path, deck: Callable[[str], Deck]) -> int:
+        """Rebuilds the rooms saved in a directory from their last snapshot
+        and the records logged after it. deck loads a deck by its file name.
+        Returns the sequence number of the last record.
+
+        Connections are not saved: the rooms come back without any, and
+        returning clients take their players back (see Room.reclaim).
+        """
+
+        if self.log is not None:
+            raise RuntimeError('Recover the rooms before attaching the log')
+        sequence, rooms = read_snapshot(directory)
+        for data in rooms:
+            try:
+                self._restore(data, deck)
+            except ValueError:
+                logger.exception(f'Could not restore room {data["code"]}')
+        for record in read_log(directory / LOG_NAME):
+            if record.sequence <= sequence:
+                continue
+            sequence = record.sequence
+            try:
+                self._replay(record.kind, record.code, record.body, deck)
+            except (KeyError, ValueError):
+                logger.exception(f'Could not replay record {record.sequence} of room {record.code}')
+        return sequence
+
+    def expire_unclaimed(self, seconds: float = RECLAIM_TIMEOUT) -> None:
+        """Removes the rooms that still have no connection after the given
+        time, and the players nobody reclaimed from the rest. Recovered rooms
+        come back without any connection, and they would only be removed when
+        their last connection leaves."""
+
+        codes = [code for code, room in self.rooms.items() if not room.connections]
+        if codes:
+            timer_wheel().schedule(seconds, lambda: self._expire(codes))
+
+    def _expire(self, codes: list[str]) -> None:
+        for code in codes:
+            room = self.rooms.get(code)
+            if room is None:
+                continue
+            if not room.connections:
+                logger.info(f'Nobody came back to room {code}')
+                self.finish(code)
+            elif unclaimed := room.unclaimed():
+                logger.info(f'{len(unclaimed)} players did not come back to room {code}')
+                room.sync.apply(*(PlayerLeft(player_id=player.id) for player in unclaimed))
+
+    def _restore(self, data: dict[str, Any], deck: Callable[[str], Deck]) -> None:
+        room_deck = deck(data['deck']).fresh(data['settings']['random_seed'])
+        room_deck.replay_ids(data['black'], data['white'])
+        settings = GameSettings(deck=room_deck, **data['settings'])
+        state = GameState(settings=settings, **data['state'])
+        self.rooms[data['code']] = Room(code=data['code'], game_state=state, deck_name=data['deck'])
+
+    def _replay(self, kind: RecordKind, code: str, body: dict[str, Any], deck: Callable[[str], Deck]) -> None:
+        if kind is RecordKind.CREATE:
+            self.create(GameSettings(deck=deck(body['deck']), **body['settings']), code, body['deck'])
+            return
+        room = self.rooms.get(code)
+        if room is None:
+            return
+        state = room.game_state
+        match kind:
+            case RecordKind.DELTAS:
+                version = body['from_version']
+                for delta in parse_deltas(body['deltas']):
+                    if version > state.version:
+                        apply_delta(state, delta)
+                        state.version = version
+                    version += 1
+            case RecordKind.DEAL:
+                state.settings.deck.replay_ids(body['black'], body['white'])
+                for player in state.players:
+                    del player.selected_cards[:]
+                for player_id, hand in body['hands'].items():
+                    state.player(UUID(player_id)).hand = card_ids(hand)
+            case RecordKind.CHOICES:
+                state.player(UUID(body['player_id'])).selected_cards = card_ids(body['cards'])
+            case RecordKind.REMOVE:
+                self.remove(code)
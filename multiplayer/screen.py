@@ -0,0 +1,256 @@
+"""Off-screen terminal renderer.
+
+Frames are drawn into a buffer of cells (a character and its style). Every
+render compares the buffer with what the terminal already shows and writes
+only the cells that changed, as ANSI escapes, in a single write. Redrawing a
+frame that did not change writes nothing, so a view can be redrawn many times
+per second (for a countdown) at almost no cost.
+
+Styles are SGR parameters ('1' is bold, '7' is reversed,
+'38;2;255;0;0' is a red foreground...). Every character takes one cell.
+"""
+import os
+import shutil
+import sys
+import textwrap
+from typing import Sequence, TextIO
+
+
+ESC: str = '\x1b['
+# Rows at the bottom of the screen kept for prompts (see Screen.input)
+PROMPT_ROWS: int = 2
+CARD_WIDTH: int = 24
+# Unchanged cells written again instead of moving the cursor over them
+MAX_GAP: int = 4
+
+BOLD: str = '1'
+DIM: str = '2'
+REVERSE: str = '7'
+COLOR_STYLES: dict[str, str] = {
+    'red': '38;2;255;0;0',
+    'blue': '38;2;0;0;255',
+    'green': '38;2;0;255;0',
+    'yellow': '38;2;255;255;0',
+}
+
+
+class Screen:
+    def __init__(self, width: int | None = None, height: int | None = None, out: TextIO = sys.stdout) -> None:
+        size = shutil.get_terminal_size()
+        self.out = out
+        self.width = width or size.columns
+        self.height = height or size.lines
+        self._allocate()
+
+    def _allocate(self) -> None:
+        self.chars = [[' '] * self.width for _ in range(self.height)]
+        self.styles = [[''] * self.width for _ in range(self.height)]
+        # What the terminal shows (None until the first render clears it)
+        self._shown: list[tuple[list[str], list[str]]] | None = None
+
+    @property
+    def body_height(self) -> int:
+        """Rows that are not kept for prompts."""
+
+        return self.height - PROMPT_ROWS
+
+    def resize(self, width: int, height: int) -> None:
+        """Starts over with another size: the next render redraws it all."""
+
+        if (width, height) != (self.width, self.height):
+            self.width, self.height = width, height
+            self._allocate()
+
+    def fit_terminal(self) -> None:
+        size = shutil.get_terminal_size()
+        self.resize(size.columns, size.lines)
+
+    def clear(self) -> None:
+        for chars, styles in zip(self.chars, self.styles):
+            chars[:] = [' '] * self.width
+            styles[:] = [''] * self.width
+
+    def text(self, x: int, y: int, text: str, style: str = '', width: int | None = None) -> int:
+        """Writes a line of text (clipped to the screen and to width) and
+        returns how many cells it took."""
+
+        if not 0 <= y < self.height or x >= self.width:
+            return 0
+        if width is not None:
+            text = text[:width]
+        if x < 0:
+            text, x = text[-x:], 0
+        text = text[:self.width - x].replace('\n', ' ')
+        self.chars[y][x:x + len(text)] = text
+        self.styles[y][x:x + len(text)] = [style] * len(text)
+        return len(text)
+
+    def box(self, x: int, y: int, width: int, height: int, style: str = '') -> None:
+        self.text(x, y, '+' + '-' * (width - 2) + '+', style)
+        for row in range(y + 1, y + height - 1):
+            self.text(x, row, '|', style)
+            self.text(x + width - 1, row, '|', style)
+        self.text(x, y + height - 1, '+' + '-' * (width - 2) + '+', style)
+
+    def fill(self, x: int, y: int, width: int, height: int, style: str = '') -> None:
+        for row in range(y, y + height):
+            self.text(x, row, ' ' * width, style)
+
+    def render(self) -> str:
+        """Escapes that turn what the terminal shows into the buffer."""
+
+        parts: list[str] = []
+        if self._shown is None:
+            parts.append(f'{ESC}0m{ESC}2J')
+            blank = [' '] * self.width, [''] * self.width
+            self._shown = [(list(blank[0]), list(blank[1])) for _ in range(self.height)]
+        cursor: tuple[int, int] | None = None
+        current_style: str | None = None
+        for y, (chars, styles, (shown_chars, shown_styles)) in enumerate(zip(self.chars, self.styles, self._shown)):
+            if chars == shown_chars and styles == shown_styles:
+                continue
+            for x in range(self.width):
+                char, style = chars[x], styles[x]
+                if char == shown_chars[x] and style == shown_styles[x]:
+                    continue
+                if cursor is not None and cursor[1] == y and 0 < x - cursor[0] <= MAX_GAP and all(
+                    shown_style == current_style for shown_style in styles[cursor[0]:x]
+                ):
+                    # Writing a few unchanged cells again is shorter than moving
+                    parts.append(''.join(chars[cursor[0]:x]))
+                elif cursor != (x, y):
+                    parts.append(f'{ESC}{y + 1};{x + 1}H')
+                if style != current_style:
+                    parts.append(f'{ESC}0;{style}m' if style else f'{ESC}0m')
+                    current_style = style
+                parts.append(char)
+                cursor = (x + 1, y)
+            shown_chars[:] = chars
+            shown_styles[:] = styles
+        if current_style:
+            parts.append(f'{ESC}0m')
+        return ''.join(parts)
+
+    def flush(self) -> int:
+        """Writes the changes since the last flush. Returns how many
+        characters were written (none if nothing changed)."""
+
+        data = self.render()
+        if data:
+            self.out.write(data)
+            self.out.flush()
+        return len(data)
+
+    def enter(self) -> None:
+        """Takes over the terminal: alternate screen, hidden cursor."""
+
+        if os.name == 'nt':
+            # Turns on the ANSI escapes of the Windows console
+            os.system('')
+        self.out.write(f'{ESC}?1049h{ESC}?25l')
+        self._shown = None
+        self.flush()
+
+    def exit(self) -> None:
+        self.out.write(f'{ESC}0m{ESC}?25h{ESC}?1049l')
+        self.out.flush()
+
+    def __enter__(self) -> 'Screen':
+        self.enter()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.exit()
+
+    def prompt(self, text: str) -> None:
+        """Shows the frame and leaves the cursor after text on the prompt row,
+        ready for the user to type."""
+
+        self.flush()
+        self.out.write(f'{ESC}{self.body_height + 1};1H{ESC}2K{text}{ESC}?25h')
+        self.out.flush()
+
+    def input(self, text: str) -> str:
+        """input() on the prompt row. The row below it takes the new line,
+        so the screen does not scroll."""
+
+        self.prompt(text)
+        try:
+            return input()
+        finally:
+            # Blank again, as the buffer expects them
+            row = self.body_height + 1
+            self.out.write(f'{ESC}?25l{ESC}{row};1H{ESC}2K{ESC}{row + 1};1H{ESC}2K')
+
+
+def card_lines(text: str, width: int = CARD_WIDTH) -> list[str]:
+    return textwrap.wrap(text, width - 4) or ['']
+
+
+def draw_card(screen: Screen, x: int, y: int, text: str, label: str = '', style: str = '',
+              width: int = CARD_WIDTH, height: int | None = None) -> int:
+    """Draws a card and returns its height."""
+
+    lines = card_lines(text, width)
+    height = height or len(lines) + 2
+    screen.fill(x, y, width, height, style)
+    screen.box(x, y, width, height, style)
+    if label:
+        screen.text(x + 2, y, f' {label} ', style)
+    for row, line in enumerate(lines[:height - 2]):
+        screen.text(x + 2, y + 1 + row, line, style)
+    return height
+
+
+def draw_cards(screen: Screen, x: int, y: int, texts: Sequence[str], labels: Sequence[str] = (),
+               selected: Sequence[int] = (), width: int = CARD_WIDTH) -> int:
+    """Draws cards side by side (in as many rows as needed) and returns the
+    height they took."""
+
+    per_row = max(1, (screen.width - x) // (width + 1))
+    top = y
+    for start in range(0, len(texts), per_row):
+        row = texts[start:start + per_row]
+        height = max(len(card_lines(text, width)) for text in row) + 2
+        for column, text in enumerate(row):
+            index = start + column
+            draw_card(
+                screen, x + column * (width + 1), y, text,
+                label=labels[index] if index < len(labels) else str(index + 1),
+                style=BOLD if index in selected else '',
+                width=width, height=height,
+            )
+        y += height
+    return y - top
+
+
+def draw_black_card(screen: Screen, x: int, y: int, text: str, label: str = '', width: int = CARD_WIDTH * 2) -> int:
+    return draw_card(screen, x, y, text.replace('_', '_' * 5), label=label, style=REVERSE, width=width)
+
+
+def draw_scoreboard(screen: Screen, x: int, y: int, scores: Sequence[tuple[str, int, str]],
+                    title: str = '', width: int = CARD_WIDTH) -> int:
+    """Draws (name, points, style) rows in a box and returns its height."""
+
+    screen.fill(x, y, width, len(scores) + 2)
+    screen.box(x, y, width, len(scores) + 2, DIM)
+    if title:
+        screen.text(x + 2, y, f' {title} ', BOLD)
+    for row, (name, points, style) in enumerate(scores):
+        points_text = str(points)
+        screen.text(x + 2, y + 1 + row, name, style, width=width - 5 - len(points_text))
+        screen.text(x + width - 2 - len(points_text), y + 1 + row, points_text, BOLD)
+    return len(scores) + 2
+
+
+def draw_timer(screen: Screen, x: int, y: int, remaining: float, total: float, width: int = CARD_WIDTH) -> None:
+    """Seconds left and a bar that empties as they run out."""
+
+    remaining = max(0.0, remaining)
+    label = f'{remaining:4.1f}s '
+    bar = width - len(label)
+    full = round(bar * remaining / total) if total > 0 else 0
+    style = COLOR_STYLES['red'] if remaining <= 5 else ''
+    screen.text(x, y, label, BOLD)
+    screen.text(x + len(label), y, '#' * full, style)
+    screen.text(x + len(label) + full, y, '.' * (bar - full), DIM)
@@ -9,29 +9,51 @@ from models import (
     Player,
     PlayerRole,
     random_subset_choice_with_tracking,
+    load_deck,
     GameSettings,
     NetworkRequest,
     Message
 )
 import threading
 import asyncio
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+from http import HTTPStatus
 from websockets.exceptions import ConnectionClosed
 from websockets.asyncio.server import ServerConnection, Server as WebSocketServer, serve
+from websockets.http11 import Request, Response
 from loguru import logger
 import time
-from typing import Optional, Callable, Self, Any
+from typing import Optional, Callable, Awaitable, Any
 
-from pydantic import Field
 from pathlib import Path
 import os
 import json
 from uuid import uuid4, UUID
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+from cards import card_ids
+from codec import MAX_MESSAGE_SIZE, codec_for, select_subprotocol, send_message
+from compose import PACK_SEPARATOR, compose_deck, split_packs
+from deckcache import DeckCache
+from deckfile import COMPILED_DIR
+from eventlog import EventLog
+from matchmaking import Matchmaker, QueueKey, Ticket
+from metrics import BYTES_IN, INVALID_MESSAGES, MESSAGES_IN, REGISTRY, instrument, serve_metrics
+from outbox import Outbox
+from profiler import DEFAULT_RATE, Profiler
+from rooms import Room, RoomNotFound, RoomRegistry, Shard
+from sync import BlackCardDrawn, PhaseChanged, PlayerReady, player_joined
+from timers import timer_wheel
 
 
 
 CAH_DECKS_PATH: Path = Path(__file__).parent.parent / 'decks'
 JSON_EXTENSION: str = '.json'
+# Decks served to clients, by digest (see deckcache.py)
+PUBLISHED_DECKS_PATH: Path = CAH_DECKS_PATH / COMPILED_DIR / 'published'
+# Decks kept loaded for new rooms (see Server.deck)
+MAX_LOADED_DECKS: int = 16
 
 
 PLAYER_COUNT_DEFAULT: int = 10
@@ -58,6 +80,14 @@ WINNING_SCORE_DEFAULT: int = 5
 MIN_WINNING_SCORE: int = 3
 MAX_WINNING_SCORE: int = 15
 
+# Limits of the settings clients can choose for their rooms
+SETTING_RANGES: dict[str, tuple[int, int]] = {
+    'max_player_count': (MIN_PLAYER_COUNT, MAX_PLAYER_COUNT),
+    'max_hand_size': (MIN_HAND_SIZE, MAX_HAND_SIZE),
+    'max_round_time': (MIN_ROUND_TIME, MAX_ROUND_TIME),
+    'max_rounds': (MIN_ROUND_COUNT, MAX_ROUND_COUNT),
+}
+
 DEFAULT_HOST: str = 'localhost'
 DEFAULT_PORT: int = 8765
 
@@ -65,34 +95,355 @@ DEFAULT_PORT: int = 8765
 
 @dataclass
 class Server:
-    game_state: GameState
+    """WebSocket endpoint hosting any number of independent rooms.
+
+    Connecting to ws://host:port/<room code> joins that room. Connections to
+    the root path can send CREATE_ROOM or JOIN_ROOM instead, or MATCHMAKE to
+    be put in a new room with other players (see matchmaking.py). Sending
+    SET_PLAYER_INFO with the spectator role watches the room without playing.
+    """
+
     host: str = DEFAULT_HOST
     port: int = DEFAULT_PORT
-    clients: dict[UUID, Player] = Field(default_factory=dict)
+    rooms: RoomRegistry = field(default_factory=RoomRegistry)
+    decks: OrderedDict[str, Deck] = field(default_factory=OrderedDict)
+    published: DeckCache = field(default_factory=lambda: DeckCache(PUBLISHED_DECKS_PATH))
+    # GET_DECK data of every published deck, encoded once
+    deck_payloads: dict[str, str] = field(default_factory=dict)
+    matchmaker: Matchmaker = field(default_factory=lambda: Matchmaker(MIN_PLAYER_COUNT))
+    outboxes: dict[UUID, Outbox] = field(default_factory=dict)
+    # Set when running as one of several worker processes (see workers.py)
+    shard: Shard | None = None
+    # Where the rooms are saved to survive a restart (see eventlog.py)
+    state_dir: Path | None = None
+    # HTTP port of the Prometheus metrics, if they are served
+    metrics_port: int | None = None
+    # Where the profiles are written, if the server is profiled
+    profile_dir: Path | None = None
+    profile_rate: float = DEFAULT_RATE
     _websocket: WebSocketServer | None = None
-    
+
+    def __post_init__(self) -> None:
+        self.rooms.shard = self.shard
+        self.matchmaker.on_match = self.start_match
+
+    def deck(self, deck_name: str) -> Deck:
+        """Loaded decks are kept so every room playing with them shares their
+        card table. They are published for the clients to download. Only the
+        MAX_LOADED_DECKS used last stay loaded: rooms keep their own deck."""
+
+        packs = split_packs(deck_name)
+        deck_name = PACK_SEPARATOR.join(packs)
+        if deck_name in self.decks:
+            self.decks.move_to_end(deck_name)
+            return self.decks[deck_name]
+        available = list_decks(print_to_stdout=False)
+        for pack in packs:
+            if pack + JSON_EXTENSION not in available:
+                raise ValueError(f'Deck {pack} does not exist')
+        if len(packs) == 1:
+            deck = load_deck(CAH_DECKS_PATH / (deck_name + JSON_EXTENSION))
+        else:
+            composition = compose_deck(packs)
+            if composition.duplicates:
+                logger.info(f'{len(composition.duplicates)} repeated cards left out of {deck_name}')
+            deck = composition.deck
+        self.published.add(deck)
+        self.decks[deck_name] = deck
+        if len(self.decks) > MAX_LOADED_DECKS:
+            _, evicted = self.decks.popitem(last=False)
+            self.deck_payloads.pop(evicted.digest, None)
+            self.published.loaded.pop(evicted.digest, None)
+        return deck
+
+    def deck_payload(self, digest: str) -> str | None:
+        if digest not in self.deck_payloads:
+            if digest not in self.published:
+                return None
+            self.deck_payloads[digest] = self.published.payload(digest)
+        return self.deck_payloads[digest]
+
+    def start_match(self, key: QueueKey, tickets: list[Ticket]) -> None:
+        """Puts a group of matched players in a new room of their own."""
+
+        settings = GameSettings(deck=self.deck(key.deck), max_hand_size=key.max_hand_size, max_rounds=key.max_rounds)
+        room = self.rooms.create(settings, deck_name=key.deck)
+        room.matched = True
+        for ticket in tickets:
+            outbox = self.outboxes[ticket.connection_id]
+            self.rooms.join(room.code, outbox.websocket)
+            outbox.offer(outbox.codec.encode(Message(type=NetworkRequest.MATCHMAKE, data={'room': room.code})))
+        logger.info(f'Matched {len(tickets)} players into room {room.code} ({key})')
+
+    def owner_uri(self, code: str, host: str) -> str | None:
+        """Direct URI of the worker that owns a room, or None if it is us."""
+
+        if self.shard is None or self.shard.owns(code):
+            return None
+        owner = Shard.owner(code, self.shard.count)
+        return f'ws://{host}:{Shard.direct_port(self.port, owner)}/{code}'
+
+    def process_request(self, connection: ServerConnection, request: Request) -> Response | None:
+        """Redirects connections to rooms owned by another worker."""
+
+        code = request.path.strip('/').upper()
+        uri = self.owner_uri(code, request_host(request, self.host)) if code else None
+        if uri is None:
+            return None
+        response = connection.respond(HTTPStatus.TEMPORARY_REDIRECT, f'Room {code} is on another worker\n')
+        response.headers['Location'] = uri
+        return response
+
+    async def send(self, websocket: ServerConnection, message: Message) -> None:
+        """Queues a message in the connection's outbox."""
+
+        await self.outboxes[websocket.id].send(message)
+
     async def handle_network_request(self, websocket: ServerConnection) -> None:
-        protocol: dict[NetworkRequest, Callable[[ServerConnection, Self, Message], Future[None]]] = { #type: ignore
-            NetworkRequest.DISCONNECT:          handle_disconnect,
-            NetworkRequest.GET_GAME_STATE:      handle_get_game_state,
-            NetworkRequest.SET_PLAYER_CHOICES:  handle_set_player_choices,
-            NetworkRequest.SET_PLAYER_INFO:     handle_set_player_info
-        }
-        message: Message | None = None
-        message_dict = json.loads(await websocket.recv())
-        message = Message.model_validate(message_dict)
-        
+        """Serves a connection for as long as it stays open."""
+
+        if room_code := room_code_of(websocket):
+            try:
+                self.rooms.join(room_code, websocket)
+            except RoomNotFound:
+                logger.warning(f'{websocket.remote_address} tried to join unknown room {room_code}')
+                await send_message(websocket, Message(type=NetworkRequest.DISCONNECT, data={
+                    'reason': f'Room {room_code} does not exist'
+                }))
+                return
+
+        codec = codec_for(websocket)
+        outbox = Outbox(websocket)
+        self.outboxes[websocket.id] = outbox
+        outbox.start()
         try:
-            await protocol[message.type](websocket, self, message)
-            
-        except Exception:
-            logger.info(f'{'a'}')
+            async for frame in websocket:
+                BYTES_IN.inc(amount=len(frame))
+                try:
+                    message = codec.decode(frame)
+                except ValueError:
+                    INVALID_MESSAGES.inc()
+                    logger.warning(f'Invalid message from {websocket.remote_address}')
+                    continue
+
+                MESSAGES_IN.inc(message.type.name)
+                handler = PROTOCOL.get(message.type)
+                if handler is None:
+                    logger.warning(f'Unexpected {message.type.name} from {websocket.remote_address}')
+                    continue
+                try:
+                    await handler(websocket, self, message)
+                except Exception:
+                    logger.exception(f'Error handling {message.type.name} from {websocket.remote_address}')
+        finally:
+            self.matchmaker.cancel(websocket.id)
+            self.rooms.leave(websocket)
+            del self.outboxes[websocket.id]
+            await outbox.close()
             
             
+    async def open_event_log(self, stack: AsyncExitStack) -> None:
+        """Recovers the rooms saved in state_dir and records every change
+        from then on."""
+
+        assert self.state_dir is not None
+        directory = self.state_dir
+        if self.shard is not None:
+            directory = directory / f'shard-{self.shard.index}'
+        start = time.perf_counter()
+        sequence = self.rooms.recover(directory, self.deck)
+        logger.info(f'Recovered {len(self.rooms)} rooms in {time.perf_counter() - start:.3f}s')
+        for room in self.rooms.rooms.values():
+            resume_deadline(room)
+        self.rooms.expire_unclaimed()
+
+        log = EventLog(directory, sequence)
+        self.rooms.attach_log(log)
+        # Starts from a fresh snapshot, so the next restart is quick too
+        await log.snapshot(self.rooms.snapshot)
+        log.start()
+        stack.push_async_callback(log.close)
+        snapshots = asyncio.create_task(log.snapshot_periodically(self.rooms.snapshot))
+        stack.callback(snapshots.cancel)
+
+    async def open_metrics(self, stack: AsyncExitStack) -> None:
+        assert self.metrics_port is not None
+        REGISTRY.gauge('cah_connections', 'Open connections', lambda: len(self.outboxes))
+        REGISTRY.gauge('cah_rooms', 'Rooms hosted', lambda: len(self.rooms))
+        REGISTRY.gauge('cah_outbox_frames', 'Frames waiting in every outbox', lambda: sum(
+            outbox.queue.qsize() for outbox in self.outboxes.values()
+        ))
+        REGISTRY.gauge('cah_outbox_frames_max', 'Frames waiting in the fullest outbox', lambda: max(
+            (outbox.queue.qsize() for outbox in self.outboxes.values()), default=0
+        ))
+        REGISTRY.gauge('cah_timers', 'Round deadlines scheduled', lambda: len(timer_wheel()))
+        metrics = await serve_metrics(self.host, self.metrics_port)
+        stack.push_async_callback(metrics.wait_closed)
+        stack.callback(metrics.close)
+
+    def open_profiler(self, stack: AsyncExitStack) -> None:
+        """Samples the event loop until the server stops. Every room gets its
+        own profile when it is removed; the rest (accepting connections,
+        decoding messages, idle time...) is written when the server stops."""
+
+        assert self.profile_dir is not None
+        directory = self.profile_dir
+        if self.shard is not None:
+            directory = directory / f'shard-{self.shard.index}'
+        profiler = Profiler(directory, self.profile_rate)
+        tag_server(profiler)
+
+        def write_room(room: Room) -> None:
+            profiler.write(f'room-{room.code}', lambda tags: tags.get('room') == room.code)
+
+        self.rooms.on_remove = write_room
+        profiler.start()
+        stack.callback(profiler.write, 'server')
+        stack.callback(profiler.stop)
+
     async def serve(self) -> None:
-        async with serve(self.handle_network_request, host=self.host, port=self.port) as server:
+        async with AsyncExitStack() as stack:
+            if self.profile_dir is not None:
+                self.open_profiler(stack)
+            if self.state_dir is not None:
+                await self.open_event_log(stack)
+            if self.metrics_port is not None:
+                await self.open_metrics(stack)
+            server = await stack.enter_async_context(serve(
+                self.handle_network_request,
+                host=self.host,
+                port=self.port,
+                select_subprotocol=select_subprotocol,
+                process_request=self.process_request,
+                max_size=MAX_MESSAGE_SIZE,
+                # Every worker listens on the same port and the kernel
+                # balances the connections between them
+                reuse_port=self.shard is not None,
+            ))
+            self._websocket = server
+            if self.shard is not None:
+                await stack.enter_async_context(serve(
+                    self.handle_network_request,
+                    host=self.host,
+                    port=Shard.direct_port(self.port, self.shard.index),
+                    select_subprotocol=select_subprotocol,
+                    max_size=MAX_MESSAGE_SIZE,
+                ))
             await server.serve_forever()
             
+
+def room_tags(room: Any) -> dict[str, str] | None:
+    if not isinstance(room, Room):
+        return None
+    return {'room': room.code, 'phase': room.game_state.phase.name}
+
+
+def tag_server(profiler: Profiler) -> None:
+    """Tags the samples with the request being handled and the room (and
+    its phase) it is handled for."""
+
+    for request, handler in PROTOCOL.items():
+        profiler.tag(handler, lambda frame, request=request: {
+            'request': request.name, **(room_tags(frame.f_locals.get('room')) or {})
+        })
+    # Deadlines expire outside of any handler
+    for function in (start_round, start_judgement, end_round):
+        profiler.tag(function, lambda frame: room_tags(frame.f_locals.get('room')))
+    profiler.tag(Room._countdown, lambda frame: room_tags(frame.f_locals.get('self')))
+
+
+def room_code_of(websocket: ServerConnection) -> str:
+    if websocket.request is None:
+        return ''
+    return websocket.request.path.strip('/').upper()
+
+
+def request_host(request: Request | None, default: str) -> str:
+    """Host name the client used to reach us (without the port)."""
+
+    if request is None or 'Host' not in request.headers:
+        return default
+    return request.headers['Host'].rsplit(':', 1)[0]
+
+
+def check_setting(name: str, value: Any) -> int:
+    """Raises ValueError unless value is a valid integer for the setting."""
+
+    if name not in SETTING_RANGES:
+        raise ValueError(f'Unknown setting {name}')
+    low, high = SETTING_RANGES[name]
+    if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+        raise ValueError(f'{name} must be between {low} and {high}')
+    return value
+
+
+def room_settings(server: Server, data: dict[str, Any]) -> tuple[str, GameSettings]:
+    """Deck name and settings asked for in a CREATE_ROOM request. Raises
+    KeyError or ValueError if they are missing or invalid."""
+
+    settings = dict(data)
+    deck_name = str(settings.pop('deck'))
+    seed = settings.pop('random_seed', None)
+    for name, value in settings.items():
+        check_setting(name, value)
+    if seed is not None:
+        if isinstance(seed, bool) or not isinstance(seed, int):
+            raise ValueError('random_seed must be an integer')
+        settings['random_seed'] = seed
+    return deck_name, GameSettings(deck=server.deck(deck_name), **settings)
+
+
+def start_round(room: Room) -> None:
+    """Deals every hand back up to max_hand_size and draws a black card.
+    Players have max_round_time seconds to play their cards."""
+
+    state = room.game_state
+    settings = state.settings
+    missing: dict[UUID, int] = {}
+    for player in state.players:
+        if player.selected_cards:
+            # The cards played last round leave the hand
+            played = set(player.selected_cards)
+            player.hand = card_ids(card for card in player.hand if card not in played)
+            del player.selected_cards[:]
+        missing[player.id] = max(0, settings.max_hand_size - len(player.hand))
+    white = settings.deck.draw_white_ids(sum(missing.values()))
+    black = settings.deck.draw_black_ids()
+    start = 0
+    for player in state.players:
+        player.hand.extend(white[start:start + missing[player.id]])
+        start += missing[player.id]
+    if room.log is not None:
+        room.log.dealt(black, white, {player.id: player.hand for player in state.players})
+    room.sync.apply(
+        BlackCardDrawn(card_id=black[0]),
+        PhaseChanged(phase=Phase.PLAY_CARDS),
+    )
+    # Every player gets their new hand
+    room.sync.push_projections()
+    room.set_deadline(settings.max_round_time, lambda: start_judgement(room))
+
+
+def start_judgement(room: Room) -> None:
+    """Starts when every player has played or when the time is up."""
+
+    room.sync.apply(PhaseChanged(phase=Phase.JUDGEMENT))
+    room.set_deadline(room.game_state.settings.max_round_time, lambda: end_round(room))
+
+
+def end_round(room: Room) -> None:
+    room.cancel_deadline()
+    room.sync.apply(PhaseChanged(phase=Phase.SETUP))
+
+
+def resume_deadline(room: Room) -> None:
+    """Gives a recovered room the whole time of its phase again."""
+
+    max_round_time = room.game_state.settings.max_round_time
+    if room.game_state.phase is Phase.PLAY_CARDS:
+        room.set_deadline(max_round_time, lambda: start_judgement(room))
+    elif room.game_state.phase is Phase.JUDGEMENT:
+        room.set_deadline(max_round_time, lambda: end_round(room))
         
         
 async def handle_disconnect(
@@ -101,13 +452,13 @@ async def handle_disconnect(
     message: Message
 ) -> None:
     logger.info(f'Client disconnected from {websocket.remote_address}')
-    server.clients.pop(websocket.id)
-    if len(server.clients.keys()) < MIN_PLAYER_COUNT:
-        logger.warning('Closing program: not enough players at the moment.')
-        if server._websocket is None:
-            raise RuntimeError('This should not happen')
-        await server._websocket.close() # type: ignore
-        # If less than 3 players, then shut the game
+    room = server.rooms.leave(websocket)
+    if room is not None and not room.finished and len(room.clients) < MIN_PLAYER_COUNT:
+        # If less than 3 players, then shut the room
+        logger.warning(f'Closing room {room.code}: not enough players at the moment.')
+        server.rooms.finish(room.code)
+        for connection in list(room.connections.values()):
+            await connection.close()
     await websocket.close()
     
     
@@ -117,6 +468,17 @@ async def handle_get_game_state(
     message: Message
 ) -> None:
     logger.info(f'Client {websocket.remote_address} requesting game state')
+    room = server.rooms.room_of(websocket)
+    if room is None:
+        await server.send(websocket, Message(type=NetworkRequest.DISCONNECT, data={
+            'reason': 'Join a room first'
+        }))
+        return
+    # Clients send the last version they know about to only get what they missed
+    if websocket.id in room.spectators:
+        room.sync.watch(websocket, message.data.get('version'))
+    else:
+        room.sync.subscribe(server.outboxes[websocket.id], message.data.get('version'))
     
 
 async def handle_set_player_info(
@@ -125,11 +487,54 @@ async def handle_set_player_info(
     message: Message
 ) -> None:
     logger.info(f'Creating new user from {websocket.remote_address}.')
-    player_info = json.loads(await websocket.recv())
-    player_info['uuid'] = websocket.id
-    player = Player(**player_info)
-    logger.info(f'User registered as {player}')
-    
+    room = server.rooms.room_of(websocket)
+    if room is None:
+        await server.send(websocket, Message(type=NetworkRequest.DISCONNECT, data={
+            'reason': 'Join a room first'
+        }))
+        return
+    if websocket.id in room.clients or websocket.id in room.spectators:
+        await server.send(websocket, Message(type=NetworkRequest.DISCONNECT, data={
+            'reason': f'Already registered in room {room.code}'
+        }))
+        return
+    if message.data.get('role') == PlayerRole.SPECTATOR:
+        # Spectators are not players of the game: they only get its public state
+        room.spectators.add(websocket.id)
+        logger.info(f'{websocket.remote_address} watches room {room.code}')
+        await server.send(websocket, Message(type=NetworkRequest.ACK))
+        return
+    if 'player_id' in message.data:
+        # Clients of a recovered room take their player back
+        try:
+            player = room.reclaim(UUID(str(message.data['player_id'])), websocket.id)
+        except (KeyError, ValueError):
+            await server.send(websocket, Message(type=NetworkRequest.DISCONNECT, data={
+                'reason': f'No player to reclaim in room {room.code}'
+            }))
+            return
+        logger.info(f'User {player.name} came back to room {room.code}')
+        await server.send(websocket, Message(type=NetworkRequest.ACK, data={'player_id': str(player.id)}))
+        return
+    # Players of a recovered room keep their seat until they are reclaimed
+    if len(room.game_state.players) >= room.game_state.settings.max_player_count:
+        await server.send(websocket, Message(type=NetworkRequest.DISCONNECT, data={
+            'reason': f'Room {room.code} is full'
+        }))
+        return
+    try:
+        # Only the name and color are up to the client: the rest is the server's
+        player = Player(id=websocket.id, name=message.data['name'], color=message.data.get('color'))
+    except (KeyError, ValueError) as error:
+        await server.send(websocket, Message(type=NetworkRequest.DISCONNECT, data={
+            'reason': f'Invalid player info: {error}'
+        }))
+        return
+    room.sync.apply(player_joined(player))
+    room.clients[websocket.id] = room.sync.player(player.id)
+    logger.info(f'User registered as {player} in room {room.code}')
+    # Its id is what the client sends to reclaim it after a restart
+    await server.send(websocket, Message(type=NetworkRequest.ACK, data={'player_id': str(player.id)}))
     
 
 
@@ -139,6 +544,29 @@ async def handle_set_player_choices(
     message: Message
 ) -> None:
     logger.info(f'Assigning new card choices for {websocket.remote_address}')
+    room = server.rooms.room_of(websocket)
+    player = None if room is None else room.clients.get(websocket.id)
+    if room is None or player is None or room.game_state.phase is not Phase.PLAY_CARDS:
+        logger.warning(f'{websocket.remote_address} cannot play cards now')
+        return
+    # The cards are given by their position in the hand
+    positions = message.data.get('cards', [])
+    state = room.game_state
+    pick = 1 if state.black_card_id is None else state.settings.deck.table.pick(state.black_card_id)
+    if (
+        not isinstance(positions, list)
+        or len(positions) != pick
+        or not all(type(position) is int and 0 <= position < len(player.hand) for position in positions)
+        or len(set(positions)) != pick
+    ):
+        logger.warning(f'{websocket.remote_address} played invalid cards {positions}')
+        return
+    player.selected_cards = card_ids(player.hand[position] for position in positions)
+    if room.log is not None:
+        room.log.choices(player.id, player.selected_cards)
+    if all(p.selected_cards for p in room.clients.values() if p.role is PlayerRole.PLAYER):
+        # Everyone played before the deadline
+        start_judgement(room)
 
 async def handle_ready(
     websocket: ServerConnection,
@@ -146,9 +574,13 @@ async def handle_ready(
     message: Message
 ) -> None:
     logger.info(f'Checking if the game can start')
-    await websocket.send(Message(type=NetworkRequest.READY, data={
-        'players': len(server.game_state.players)
-    }).model_dump_json())
+    room = server.rooms.room_of(websocket)
+    player = None if room is None else room.clients.get(websocket.id)
+    if player is not None and not player.ready:
+        room.sync.apply(PlayerReady(player_id=player.id))
+    await server.send(websocket, Message(type=NetworkRequest.READY, data={
+        'players': 0 if room is None else len(room.game_state.players)
+    }))
 
 async def handle_start(
     websocket: ServerConnection,
@@ -156,11 +588,152 @@ async def handle_start(
     message: Message
 ) -> None:
     logger.info(f'Trying to start game')
-    await websocket.send(Message(type=NetworkRequest.START).model_dump_json())
+    room = server.rooms.room_of(websocket)
+    if room is None:
+        reason = 'Join a room first'
+    elif websocket.id in room.spectators:
+        reason = 'Spectators cannot start the game'
+    elif room.game_state.phase is not Phase.SETUP:
+        reason = 'The game already started'
+    elif len(room.clients) < MIN_PLAYER_COUNT:
+        reason = f'At least {MIN_PLAYER_COUNT} players are needed'
+    elif room.matched and len(room.game_state.players) < len(room.connections) - len(room.spectators):
+        reason = 'Waiting for every matched player to join'
+    else:
+        try:
+            start_round(room)
+        except CAHDrawingListEmpty:
+            logger.warning(f'Room {room.code} ran out of cards')
+            reason = 'The deck ran out of cards'
+        else:
+            await server.send(websocket, Message(type=NetworkRequest.START))
+            return
+    await server.send(websocket, Message(type=NetworkRequest.DISCONNECT, data={
+        'reason': f'Cannot start: {reason}'
+    }))
+
+
+async def handle_get_deck(
+    websocket: ServerConnection,
+    server: Server,
+    message: Message
+) -> None:
+    digest = str(message.data.get('digest', ''))
+    try:
+        payload = server.deck_payload(digest)
+    except ValueError:
+        payload = None
+    if payload is None:
+        logger.warning(f'{websocket.remote_address} asked for unknown deck {digest}')
+        return
+    if len(payload) >= MAX_MESSAGE_SIZE:
+        logger.error(f'Deck {digest[:8]} is too large to be sent')
+        await server.send(websocket, Message(type=NetworkRequest.DISCONNECT, data={
+            'reason': f'Deck {digest} is too large'
+        }))
+        return
+    logger.info(f'Sending deck {digest[:8]} to {websocket.remote_address}')
+    await server.send(websocket, Message(type=NetworkRequest.GET_DECK, data={
+        'digest': digest,
+        'deck': payload
+    }))
+
+
+async def handle_matchmake(
+    websocket: ServerConnection,
+    server: Server,
+    message: Message
+) -> None:
+    if server.rooms.room_of(websocket) is not None:
+        logger.warning(f'{websocket.remote_address} is already in a room')
+        return
+    try:
+        key = QueueKey(
+            deck=str(message.data['deck']),
+            max_hand_size=check_setting('max_hand_size', message.data.get('max_hand_size', HAND_SIZE_DEFAULT)),
+            max_rounds=check_setting('max_rounds', message.data.get('max_rounds', ROUND_COUNT_DEFAULT)),
+        )
+        server.deck(key.deck)
+    except (KeyError, ValueError) as error:
+        await server.send(websocket, Message(type=NetworkRequest.DISCONNECT, data={
+            'reason': f'Invalid matchmaking request: {error}'
+        }))
+        return
+    # Tells the player how many are waiting before a match puts them in a room
+    waiting = server.matchmaker.waiting(key) + 1
+    await server.send(websocket, Message(type=NetworkRequest.MATCHMAKE, data={
+        'waiting': waiting
+    }))
+    server.matchmaker.enqueue(websocket.id, key)
+    logger.info(f'{websocket.remote_address} waits for a game with {waiting - 1} others ({key})')
+
+
+async def handle_create_room(
+    websocket: ServerConnection,
+    server: Server,
+    message: Message
+) -> None:
+    try:
+        deck_name, settings = room_settings(server, message.data)
+    except (KeyError, ValueError) as error:
+        await server.send(websocket, Message(type=NetworkRequest.DISCONNECT, data={
+            'reason': f'Invalid room settings: {error}'
+        }))
+        return
+    room = server.rooms.create(settings, deck_name=deck_name)
+    server.rooms.join(room.code, websocket)
+    logger.info(f'{websocket.remote_address} created room {room.code}')
+    await server.send(websocket, Message(type=NetworkRequest.CREATE_ROOM, data={
+        'room': room.code
+    }))
+
+
+async def handle_join_room(
+    websocket: ServerConnection,
+    server: Server,
+    message: Message
+) -> None:
+    uri = server.owner_uri(message.data['room'].upper(), request_host(websocket.request, server.host))
+    if uri is not None:
+        # The room lives on another worker: the client has to reconnect there
+        await server.send(websocket, Message(type=NetworkRequest.JOIN_ROOM, data={
+            'room': message.data['room'],
+            'redirect': uri
+        }))
+        return
+    try:
+        room = server.rooms.join(message.data['room'], websocket)
+    except RoomNotFound:
+        await server.send(websocket, Message(type=NetworkRequest.DISCONNECT, data={
+            'reason': f'Room {message.data['room']} does not exist'
+        }))
+        return
+    logger.info(f'{websocket.remote_address} joined room {room.code}')
+    await server.send(websocket, Message(type=NetworkRequest.JOIN_ROOM, data={
+        'room': room.code
+    }))
+
+
+Handler = Callable[[ServerConnection, Server, Message], Awaitable[None]]
+
+# Built once: every connection dispatches its messages through this table
+PROTOCOL: dict[NetworkRequest, Handler] = {
+    NetworkRequest.DISCONNECT:          handle_disconnect,
+    NetworkRequest.READY:               handle_ready,
+    NetworkRequest.START:               handle_start,
+    NetworkRequest.GET_GAME_STATE:      handle_get_game_state,
+    NetworkRequest.GET_DECK:            handle_get_deck,
+    NetworkRequest.SET_PLAYER_CHOICES:  handle_set_player_choices,
+    NetworkRequest.SET_PLAYER_INFO:     handle_set_player_info,
+    NetworkRequest.CREATE_ROOM:         handle_create_room,
+    NetworkRequest.JOIN_ROOM:           handle_join_room,
+    NetworkRequest.MATCHMAKE:           handle_matchmake
+}
+# Every handler is counted and timed (see metrics.py)
+PROTOCOL = {request: instrument(request.name, handler) for request, handler in PROTOCOL.items()}
 
 
 def list_decks(print_to_stdout: bool = True) -> list[str]:
-    print('Select one Deck to play with: ', end='')
     decks = []
     files = os.listdir(CAH_DECKS_PATH)
     for file in files:
@@ -169,6 +742,7 @@ def list_decks(print_to_stdout: bool = True) -> list[str]:
              decks.append(file)
     
     if print_to_stdout:    
+        print('Select one Deck to play with: ', end='')
         [print(f'- {deck[:-len(JSON_EXTENSION)]}', end='\n') for deck in decks]
     return decks
 
@@ -253,14 +827,17 @@ def get_seed() -> int:
     logger.info(' '.join([a.capitalize() for a in f'{seed = } '.split('_')]))
     return seed 
 
-async def host() -> None:
+async def host(
+    room_code: str | None = None,
+    profile_dir: Path | None = None,
+    profile_rate: float = DEFAULT_RATE,
+) -> None:
     # Host mode
     # 2.a -> GAME SETTINGS 
     # DECK SETTINGS
     deck_path: str = select_deck()
-    deck: Optional[Deck] = None
-    with open(CAH_DECKS_PATH / (deck_path + JSON_EXTENSION), 'r', encoding='utf-8') as deck_file:
-        deck = Deck(**json.load(deck_file))
+    server = Server(profile_dir=profile_dir, profile_rate=profile_rate)
+    deck: Deck = server.deck(deck_path)
         
     max_player_count = get_max_player_count()
     max_hand_size = get_max_hand_size()
@@ -278,7 +855,8 @@ async def host() -> None:
         random_seed=seed
     )
     
-    server = Server(GameState(settings=game_settings))
+    room = server.rooms.create(game_settings, code=room_code, deck_name=deck_path)
+    logger.info(f'Room code: {room.code}')
     
     await server.serve()
     
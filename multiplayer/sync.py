@@ -0,0 +1,232 @@
+"""Versioned state synchronization.
+
+Every change of a GameState is described by a small delta. Applying a delta
+bumps the state version and pushes only that delta to the subscribed
+connections. Full snapshots (without the deck nor the hands) are only sent
+when a client subscribes or asks again after missing some versions.
+
+Spectators get the same public feed without ever seeing a hand. A room can
+have thousands of them, so they skip the outboxes: every frame is encoded
+once per codec and written to all their sockets at once with websockets'
+broadcast, which never waits. Spectators with too much data still waiting
+in their socket are dropped instead of buffering for them without limit.
+"""
+from pydantic_core import to_json
+from collections import deque
+from typing import Annotated, Any, Iterable, Literal
+
+from pydantic import BaseModel, Field, TypeAdapter
+from pydantic.types import UUID4
+from websockets.asyncio.server import ServerConnection, broadcast
+
+from codec import Codec, codec_for
+from eventlog import RoomLog
+from metrics import BYTES_OUT
+from models import GameState, NetworkRequest, Phase, Player, PlayerRole
+from outbox import Outbox, drop_client
+
+
+# How many past deltas are kept to catch up clients that missed a few
+DELTA_HISTORY: int = 256
+# Spectators with more bytes than this waiting to be sent are dropped
+SPECTATOR_WRITE_LIMIT: int = 256 * 1024
+
+
+class PhaseChanged(BaseModel):
+    kind: Literal['phase'] = 'phase'
+    phase: Phase
+
+
+class BlackCardDrawn(BaseModel):
+    kind: Literal['black_card'] = 'black_card'
+    card_id: int
+
+
+class PlayerJoined(BaseModel):
+    kind: Literal['player_joined'] = 'player_joined'
+    id: UUID4
+    name: str
+    color: None | str = None
+    role: PlayerRole = PlayerRole.PLAYER
+    score: int = 0
+    ready: bool = False
+
+
+class PlayerLeft(BaseModel):
+    kind: Literal['player_left'] = 'player_left'
+    player_id: UUID4
+
+
+class PlayerReady(BaseModel):
+    kind: Literal['player_ready'] = 'player_ready'
+    player_id: UUID4
+    ready: bool = True
+
+
+class PlayerReconnected(BaseModel):
+    """A player of a recovered room came back with a new connection, whose
+    id becomes their id."""
+
+    kind: Literal['player_reconnected'] = 'player_reconnected'
+    player_id: UUID4
+    id: UUID4
+
+
+Delta = Annotated[
+    PhaseChanged | BlackCardDrawn | PlayerJoined | PlayerLeft | PlayerReady | PlayerReconnected,
+    Field(discriminator='kind'),
+]
+DELTAS_ADAPTER: TypeAdapter[list[Delta]] = TypeAdapter(list[Delta])
+
+def player_joined(player: Player) -> PlayerJoined:
+    return PlayerJoined(**player.model_dump(include=set(PlayerJoined.model_fields) - {'kind'}))
+
+
+def apply_delta(state: GameState, delta: Delta) -> None:
+    """Applies a delta to a state. Used by the server to change its state and
+    by clients to keep their copy up to date. It does not touch the version."""
+
+    match delta:
+        case PhaseChanged(phase=phase):
+            state.phase = phase
+        case BlackCardDrawn(card_id=card_id):
+            state.black_card_id = card_id
+        case PlayerJoined():
+            state.players.append(Player(**delta.model_dump(exclude={'kind'})))
+        case PlayerLeft(player_id=player_id):
+            state.players.remove(state.player(player_id))
+        case PlayerReady(player_id=player_id, ready=ready):
+            state.player(player_id).ready = ready
+        case PlayerReconnected(player_id=player_id, id=new_id):
+            state.player(player_id).id = new_id
+
+
+class StateSync:
+    """Owns the version of a GameState and keeps its subscribers in sync."""
+
+    def __init__(self, state: GameState) -> None:
+        self.state = state
+        # Grouped by codec so each message is encoded once per wire format
+        self.subscribers: dict[Codec, dict[UUID4, Outbox]] = {}
+        # Connections of the spectators, grouped the same way
+        self.spectators: dict[Codec, dict[UUID4, ServerConnection]] = {}
+        # (version reached after the delta, delta dump)
+        self.history: deque[tuple[int, dict[str, Any]]] = deque(maxlen=DELTA_HISTORY)
+        # Where the deltas are recorded for crash recovery, if anywhere
+        self.log: RoomLog | None = None
+
+    @property
+    def version(self) -> int:
+        return self.state.version
+
+    def player(self, player_id: UUID4) -> Player:
+        return self.state.player(player_id)
+
+    def apply(self, *deltas: Delta) -> None:
+        """Applies the deltas and pushes them to every subscriber in a single
+        STATE_DELTA message."""
+
+        if not deltas:
+            return
+        first_version = self.state.version + 1
+        dumps = []
+        for delta in deltas:
+            apply_delta(self.state, delta)
+            self.state.version += 1
+            dump = delta.model_dump(mode='json')
+            self.history.append((self.state.version, dump))
+            dumps.append(dump)
+        if self.log is not None:
+            self.log.deltas(first_version, dumps)
+        if self.subscribers or self.spectators:
+            self.broadcast(NetworkRequest.STATE_DELTA, self._delta_data(first_version, dumps))
+
+    def broadcast(self, request: NetworkRequest, data: bytes) -> None:
+        """Sends a message to every subscriber and spectator, encoded once
+        per codec."""
+
+        frames: dict[Codec, bytes] = {}
+        for codec, outboxes in self.subscribers.items():
+            frame = frames[codec] = codec.encode_raw(request, data)
+            for outbox in list(outboxes.values()):
+                outbox.offer(frame)
+        for codec, spectators in self.spectators.items():
+            frame = frames.get(codec) or codec.encode_raw(request, data)
+            connections = self._keeping_up(spectators)
+            broadcast(connections, frame, text=codec.text)
+            BYTES_OUT.inc(amount=len(frame) * len(connections))
+
+    def _keeping_up(self, spectators: dict[UUID4, ServerConnection]) -> list[ServerConnection]:
+        """The spectators that can take one more frame. The rest are dropped."""
+
+        connections = []
+        for spectator_id, connection in list(spectators.items()):
+            if connection.transport.get_write_buffer_size() <= SPECTATOR_WRITE_LIMIT:
+                connections.append(connection)
+            else:
+                del spectators[spectator_id]
+                drop_client(connection)
+        return connections
+
+    def push_projections(self) -> None:
+        """Sends every subscriber the state as they see it, for when their
+        private view (their hand) changes."""
+
+        for codec, outboxes in self.subscribers.items():
+            for player_id, outbox in list(outboxes.items()):
+                outbox.offer(codec.encode_raw(NetworkRequest.GET_GAME_STATE, self.state.projection(player_id)))
+
+    def _delta_data(self, first_version: int, dumps: list[dict[str, Any]]) -> bytes:
+        return to_json({
+            'from_version': first_version,
+            'version': first_version + len(dumps) - 1,
+            'deltas': dumps,
+        })
+
+    def snapshot_message(self, player_id: UUID4 | None = None) -> tuple[NetworkRequest, bytes]:
+        """Full state as seen by the given player (see GameState.projection)."""
+
+        return NetworkRequest.GET_GAME_STATE, self.state.projection(player_id)
+
+    def catch_up_message(
+        self,
+        known_version: int | None,
+        player_id: UUID4 | None = None,
+    ) -> tuple[NetworkRequest, bytes]:
+        """Deltas since known_version if they are still in the history, or a
+        full snapshot otherwise."""
+
+        oldest = self.history[0][0] if self.history else self.state.version + 1
+        if known_version is None or known_version + 1 < oldest or known_version > self.state.version:
+            return self.snapshot_message(player_id)
+        dumps = [dump for version, dump in self.history if version > known_version]
+        return NetworkRequest.STATE_DELTA, self._delta_data(known_version + 1, dumps)
+
+    def subscribe(self, outbox: Outbox, known_version: int | None = None) -> None:
+        """Subscribes a player. Its catch up is queued in the same step, so
+        no delta can be applied in between and get lost."""
+
+        # Players are registered with their connection id as player id
+        websocket_id = outbox.websocket.id
+        if outbox.offer(outbox.codec.encode_raw(*self.catch_up_message(known_version, websocket_id))):
+            self.subscribers.setdefault(outbox.codec, {})[websocket_id] = outbox
+
+    def watch(self, websocket: ServerConnection, known_version: int | None = None) -> None:
+        """Subscribes a spectator. Its catch up goes straight to its socket
+        too, so it always comes before the next broadcast."""
+
+        codec = codec_for(websocket)
+        frame = codec.encode_raw(*self.catch_up_message(known_version))
+        broadcast([websocket], frame, text=codec.text)
+        BYTES_OUT.inc(amount=len(frame))
+        self.spectators.setdefault(codec, {})[websocket.id] = websocket
+
+    def unsubscribe(self, websocket: ServerConnection) -> None:
+        for outboxes in self.subscribers.values():
+            outboxes.pop(websocket.id, None)
+        for spectators in self.spectators.values():
+            spectators.pop(websocket.id, None)
+
+
+def parse_deltas(data: Iterable[dict[str, Any]]) -> list[Delta]:
+    return DELTAS_ADAPTER.validate_python(data)
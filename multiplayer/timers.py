@@ -0,0 +1,184 @@
+"""Round deadlines of every room, on a single hierarchical timer wheel.
+
+Instead of one sleeping task per room and phase, every deadline of an event
+loop goes into the same wheel, driven by a single task that wakes up once per
+tick (and only while there are timers). Scheduling and cancelling a timer are
+O(1): a timer is a key of the dict of its slot. Level 0 has one slot per tick;
+every level above has slots WHEEL_SLOTS times wider, whose timers cascade
+down to the level below when the wheel gets to them.
+
+Timers may also have a countdown callback: it is called on every tick with
+the remaining seconds, so a room sends one countdown per second whatever its
+number of players.
+"""
+import asyncio
+import math
+from typing import Any, Callable
+from weakref import WeakKeyDictionary
+
+from loguru import logger
+
+
+TICK: float = 1.0
+WHEEL_BITS: int = 6
+WHEEL_SLOTS: int = 1 << WHEEL_BITS
+WHEEL_MASK: int = WHEEL_SLOTS - 1
+# 64 ** 3 ticks (more than 3 days with 1s ticks)
+WHEEL_LEVELS: int = 3
+MAX_TICKS: int = WHEEL_SLOTS ** WHEEL_LEVELS - 1
+
+
+class Timer:
+    __slots__ = ('deadline', 'callback', 'countdown', '_wheel', '_slot')
+
+    def __init__(
+        self,
+        wheel: 'TimerWheel',
+        deadline: int,
+        callback: Callable[[], Any],
+        countdown: Callable[[int], Any] | None = None,
+    ) -> None:
+        self.deadline = deadline
+        self.callback = callback
+        self.countdown = countdown
+        self._wheel = wheel
+        self._slot: dict['Timer', None] | None = None
+
+    @property
+    def active(self) -> bool:
+        return self._slot is not None
+
+    def remaining(self) -> float:
+        """Seconds until the timer fires."""
+
+        return (self.deadline - self._wheel.current) * self._wheel.tick
+
+    def cancel(self) -> None:
+        if self._slot is None:
+            return
+        del self._slot[self]
+        self._slot = None
+        self._wheel._discard(self)
+
+
+class TimerWheel:
+    def __init__(self, tick: float = TICK) -> None:
+        self.tick = tick
+        # Ticks elapsed while the wheel was running
+        self.current = 0
+        self.levels: list[list[dict[Timer, None]]] = [
+            [{} for _ in range(WHEEL_SLOTS)] for _ in range(WHEEL_LEVELS)
+        ]
+        self.countdowns: dict[Timer, None] = {}
+        self._size = 0
+        self._task: asyncio.Task[None] | None = None
+        # Loop time of the next tick, while running
+        self._next_tick = 0.0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def schedule(
+        self,
+        delay: float,
+        callback: Callable[[], Any],
+        countdown: Callable[[int], Any] | None = None,
+    ) -> Timer:
+        """Calls callback after delay seconds (rounded up to the tick). If
+        given, countdown is called on every tick until then with the whole
+        seconds left."""
+
+        ticks = self._ticks_for(delay)
+        if ticks > MAX_TICKS:
+            raise ValueError(f'Timers cannot be longer than {MAX_TICKS * self.tick}s')
+        timer = Timer(self, self.current + ticks, callback, countdown)
+        self._place(timer)
+        self._size += 1
+        if countdown is not None:
+            self.countdowns[timer] = None
+        self._ensure_running()
+        return timer
+
+    def _ticks_for(self, delay: float) -> int:
+        # Part of the current tick that has already gone by
+        elapsed = 0.0
+        if self._task is not None:
+            elapsed = max(0.0, self.tick - (self._next_tick - asyncio.get_running_loop().time()))
+        return max(1, math.ceil((elapsed + delay) / self.tick - 1e-9))
+
+    def _place(self, timer: Timer) -> None:
+        delta = timer.deadline - self.current
+        level = 0
+        while delta >= WHEEL_SLOTS ** (level + 1):
+            level += 1
+        slot = self.levels[level][(timer.deadline >> (WHEEL_BITS * level)) & WHEEL_MASK]
+        slot[timer] = None
+        timer._slot = slot
+
+    def _discard(self, timer: Timer) -> None:
+        self._size -= 1
+        self.countdowns.pop(timer, None)
+
+    def advance(self) -> None:
+        """Moves the wheel one tick: cascades the upper levels, fires the
+        timers that are due and sends the countdowns."""
+
+        self.current += 1
+        for level in range(1, WHEEL_LEVELS):
+            if self.current & ((1 << (WHEEL_BITS * level)) - 1):
+                break
+            index = (self.current >> (WHEEL_BITS * level)) & WHEEL_MASK
+            timers = self.levels[level][index]
+            self.levels[level][index] = {}
+            for timer in timers:
+                self._place(timer)
+
+        index = self.current & WHEEL_MASK
+        due = self.levels[0][index]
+        self.levels[0][index] = {}
+        for timer in due:
+            timer._slot = None
+            self._discard(timer)
+            try:
+                timer.callback()
+            except Exception:
+                logger.exception('Timer callback failed')
+
+        for timer in list(self.countdowns):
+            try:
+                timer.countdown(math.ceil(timer.remaining()))  # type: ignore[misc]
+            except Exception:
+                logger.exception('Countdown callback failed')
+
+    def _ensure_running(self) -> None:
+        if self._task is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside of a loop the wheel is only moved by calling advance
+            return
+        self._next_tick = loop.time() + self.tick
+        self._task = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while self._size:
+                await asyncio.sleep(max(0.0, self._next_tick - loop.time()))
+                self._next_tick += self.tick
+                self.advance()
+        finally:
+            self._task = None
+
+
+_wheels: 'WeakKeyDictionary[asyncio.AbstractEventLoop, TimerWheel]' = WeakKeyDictionary()
+
+
+def timer_wheel() -> TimerWheel:
+    """The wheel of the running event loop."""
+
+    loop = asyncio.get_running_loop()
+    if loop not in _wheels:
+        _wheels[loop] = TimerWheel()
+    return _wheels[loop]
@@ -0,0 +1,96 @@
+"""Multi-process server mode.
+
+N worker processes are forked and all of them listen on the same port with
+SO_REUSEPORT, so the kernel spreads the connections between them. Every
+worker only creates rooms whose code it owns (see rooms.Shard). A client that
+lands on the wrong worker for a room is redirected to the direct port of the
+owner (port + 1 + worker index).
+"""
+import asyncio
+import os
+import signal
+import socket
+from pathlib import Path
+
+from loguru import logger
+
+from profiler import DEFAULT_RATE
+from rooms import Shard
+from server import DEFAULT_HOST, DEFAULT_PORT, Server
+
+
+def run_worker(
+    shard: Shard,
+    host: str,
+    port: int,
+    state_dir: Path | None = None,
+    metrics_port: int | None = None,
+    profile_dir: Path | None = None,
+    profile_rate: float = DEFAULT_RATE,
+) -> None:
+    # Every worker serves its own metrics, on consecutive ports
+    if metrics_port is not None:
+        metrics_port += shard.index
+    server = Server(
+        host=host,
+        port=port,
+        shard=shard,
+        state_dir=state_dir,
+        metrics_port=metrics_port,
+        profile_dir=profile_dir,
+        profile_rate=profile_rate,
+    )
+    logger.info(f'Worker {shard.index} ({os.getpid()}) listening on {port} and {Shard.direct_port(port, shard.index)}')
+    asyncio.run(server.serve())
+
+
+def serve_workers(
+    workers: int,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    state_dir: Path | None = None,
+    metrics_port: int | None = None,
+    profile_dir: Path | None = None,
+    profile_rate: float = DEFAULT_RATE,
+) -> None:
+    if workers < 1:
+        raise ValueError('There must be at least one worker')
+    if workers == 1:
+        asyncio.run(Server(
+            host=host,
+            port=port,
+            state_dir=state_dir,
+            metrics_port=metrics_port,
+            profile_dir=profile_dir,
+            profile_rate=profile_rate,
+        ).serve())
+        return
+    if not hasattr(socket, 'SO_REUSEPORT') or not hasattr(os, 'fork'):
+        raise RuntimeError('Several workers need fork and SO_REUSEPORT (Linux)')
+
+    children: list[int] = []
+    for index in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(Shard(index, workers), host, port, state_dir, metrics_port, profile_dir, profile_rate)
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                logger.exception(f'Worker {index} crashed')
+                code = 1
+            finally:
+                os._exit(code)
+        children.append(pid)
+
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        logger.info('Stopping workers')
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
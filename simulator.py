@@ -0,0 +1,229 @@
+"""Headless game simulator for deck balance analytics.
+
+Plays many games at once with the rules of main.Game: a random first ZAR that
+rotates every round, HAND_SIZE cards per hand, every other player plays the
+black card's pick, the ZAR picks a winner, the players draw back what they
+played and the first to WINNING_POINTS wins. Every game of a batch is a row
+of NumPy arrays, so a round of the whole batch is a handful of array
+operations.
+
+    python simulator.py decks/CAH-ES.json --players 4 --games 100000
+"""
+import argparse
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Protocol
+
+import numpy as np
+
+from main import HAND_SIZE, WINNING_POINTS
+from multiplayer.deckfile import ensure_compiled, load_compiled
+
+
+# Max amount of white card ids generated per batch (rows x deck size)
+BATCH_BUDGET: int = 32_000_000
+NO_CARD: int = -1
+
+
+class Policy(Protocol):
+    def play(self, hands: np.ndarray, black: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """Given the hands (games x players x HAND_SIZE card ids) and the black
+        card of every game, returns the hand slots of every player sorted by
+        preference. The first `pick` slots are played."""
+        ...
+
+
+class Judge(Protocol):
+    def judge(self, played: np.ndarray, black: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """Given the played cards (games x players x max pick, NO_CARD where
+        nothing was played), returns a score per player. The highest wins."""
+        ...
+
+
+class RandomPolicy:
+    def play(self, hands: np.ndarray, black: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        return np.argsort(rng.random(hands.shape), axis=2)
+
+
+@dataclass
+class GreedyPolicy:
+    """Always plays the cards with the highest weight."""
+
+    weights: np.ndarray
+
+    def play(self, hands: np.ndarray, black: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        return np.argsort(-self.weights[hands], axis=2, kind='stable')
+
+
+class RandomJudge:
+    def judge(self, played: np.ndarray, black: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        return rng.random(played.shape[:2])
+
+
+@dataclass
+class WeightedJudge:
+    """Picks the answer whose cards add up to the highest weight (plus some
+    noise so ties are broken at random)."""
+
+    weights: np.ndarray
+    noise: float = 1e-3
+
+    def judge(self, played: np.ndarray, black: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        scores = np.where(played == NO_CARD, 0.0, self.weights[played]).sum(axis=2)
+        return scores + rng.random(scores.shape) * self.noise
+
+
+@dataclass
+class SimulationResult:
+    white_count: int
+    black_count: int
+    games: int = 0
+    finished_games: int = 0
+    rounds: int = 0
+    white_plays: np.ndarray = field(init=False)
+    white_wins: np.ndarray = field(init=False)
+    black_plays: np.ndarray = field(init=False)
+    # Rounds that gave the last point of a game
+    black_deciding: np.ndarray = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.white_plays = np.zeros(self.white_count, dtype=np.int64)
+        self.white_wins = np.zeros(self.white_count, dtype=np.int64)
+        self.black_plays = np.zeros(self.black_count, dtype=np.int64)
+        self.black_deciding = np.zeros(self.black_count, dtype=np.int64)
+
+    def white_win_rate(self) -> np.ndarray:
+        return self.white_wins / np.maximum(self.white_plays, 1)
+
+
+def simulate_batch(
+    result: SimulationResult,
+    picks: np.ndarray,
+    games: int,
+    players: int,
+    policy: Policy,
+    judge: Judge,
+    rng: np.random.Generator,
+) -> None:
+    white_count, black_count = result.white_count, result.black_count
+    max_pick = int(picks.max())
+    rows = np.arange(games)
+    player_ids = np.arange(players)
+
+    white_order = rng.permuted(np.tile(np.arange(white_count, dtype=np.int32), (games, 1)), axis=1)
+    black_order = rng.permuted(np.tile(np.arange(black_count, dtype=np.int32), (games, 1)), axis=1)
+
+    hands = white_order[:, :players * HAND_SIZE].reshape(games, players, HAND_SIZE).copy()
+    cursor = np.full(games, players * HAND_SIZE)
+    points = np.zeros((games, players), dtype=np.int32)
+    zar = rng.integers(players, size=games)
+    active = np.ones(games, dtype=bool)
+
+    for round_index in range(black_count):
+        if not active.any():
+            break
+        black = black_order[:, round_index]
+        pick = picks[black]
+        is_zar = player_ids[None, :] == zar[:, None]
+
+        order = policy.play(hands, black, rng)[:, :, :max_pick]
+        valid = (
+            (np.arange(max_pick)[None, None, :] < pick[:, None, None])
+            & ~is_zar[:, :, None]
+            & active[:, None, None]
+        )
+        played = np.where(valid, np.take_along_axis(hands, order, axis=2), NO_CARD)
+
+        scores = judge.judge(played, black, rng).astype(float)
+        scores[is_zar] = -np.inf
+        winner = scores.argmax(axis=1)
+        points[rows, winner] += active
+        winning_cards = played[rows, winner]
+
+        result.rounds += int(active.sum())
+        result.white_plays += np.bincount(played[valid], minlength=white_count)
+        result.white_wins += np.bincount(winning_cards[winning_cards != NO_CARD], minlength=white_count)
+        result.black_plays += np.bincount(black[active], minlength=black_count)
+
+        finished = active & (points.max(axis=1) >= WINNING_POINTS)
+        result.black_deciding += np.bincount(black[finished], minlength=black_count)
+        result.finished_games += int(finished.sum())
+        active &= ~finished
+
+        # Players draw back what they played; games that run out of cards end
+        draws = valid.sum(axis=(1, 2))
+        active &= cursor + draws <= white_count
+        used = np.zeros(hands.shape, dtype=bool)
+        np.put_along_axis(used, order, valid, axis=2)
+        used &= active[:, None, None]
+        used = used.reshape(games, -1)
+        positions = np.minimum(cursor[:, None] + np.cumsum(used, axis=1) - 1, white_count - 1)
+        flat_hands = hands.reshape(games, -1)
+        flat_hands[used] = np.take_along_axis(white_order, positions, axis=1)[used]
+        cursor += np.where(active, draws, 0)
+
+        zar = (zar + 1) % players
+
+    result.games += games
+
+
+def simulate(
+    picks: np.ndarray,
+    white_count: int,
+    games: int,
+    players: int = 4,
+    policy: Policy | None = None,
+    judge: Judge | None = None,
+    seed: int | None = None,
+) -> SimulationResult:
+    """Plays `games` games and returns the play and win counts of every
+    card. picks is the pick of every black card."""
+
+    picks = np.asarray(picks, dtype=np.int32)
+    if players < 3:
+        raise ValueError('At least 3 players are needed')
+    if picks.max() > HAND_SIZE:
+        raise ValueError(f'Black cards cannot pick more than {HAND_SIZE} cards')
+    if white_count < players * HAND_SIZE:
+        raise ValueError('Not enough white cards to deal')
+
+    policy = policy if policy is not None else RandomPolicy()
+    judge = judge if judge is not None else RandomJudge()
+    rng = np.random.default_rng(seed)
+    result = SimulationResult(white_count=white_count, black_count=len(picks))
+    batch_size = max(1, BATCH_BUDGET // white_count)
+    while result.games < games:
+        simulate_batch(result, picks, min(batch_size, games - result.games), players, policy, judge, rng)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Simulate games to analyze a deck.')
+    parser.add_argument('deck', type=Path, help='Deck JSON file')
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--games', type=int, default=100_000)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--top', type=int, default=10, help='Cards to show at each end of the ranking')
+    args = parser.parse_args()
+
+    deck = load_compiled(ensure_compiled(args.deck))
+    picks = np.frombuffer(deck.picks, dtype=np.uint8)
+    result = simulate(picks, len(deck.white_texts), args.games, args.players, seed=args.seed)
+
+    print(f'{result.games} games ({result.finished_games} finished), {result.rounds} rounds')
+    rates = result.white_win_rate()
+    ranking = np.argsort(-rates, kind='stable')
+    print('Best white cards:')
+    for card_id in ranking[:args.top]:
+        print(f'  {rates[card_id]:6.1%}  {deck.white_texts[card_id]}')
+    print('Worst white cards:')
+    for card_id in ranking[-args.top:]:
+        print(f'  {rates[card_id]:6.1%}  {deck.white_texts[card_id]}')
+    print('Black cards that decide most games:')
+    deciding = result.black_deciding / np.maximum(result.black_plays, 1)
+    for card_id in np.argsort(-deciding, kind='stable')[:args.top]:
+        print(f'  {deciding[card_id]:6.1%}  {deck.black_texts[card_id]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import json
+import os
+
+from cardindex import CardIndex, CardMatch
+from cards import normalize_text
+
+
+def write_deck(path, black, white, mtime=None):
+    path.write_text(json.dumps({
+        'name': path.stem,
+        'codeName': path.stem,
+        'blackCards': [{'text': text, 'pick': 1} for text in black],
+        'whiteCards': white,
+    }), encoding='utf-8')
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_normalize_ignores_case_accents_and_spaces():
+    assert normalize_text('  ¿Qué   ES\teso? ') == '¿que es eso?'
+
+
+def test_search_finds_cards_in_every_deck(tmp_path):
+    write_deck(tmp_path / 'uno.json', ['¿Qué es _?'], ['Un gato', 'Un perro', 'Gatos &amp; perros'])
+    write_deck(tmp_path / 'dos.json', ['_ y _'], ['El GATO de Schrödinger', 'Un pato'])
+    index = CardIndex(tmp_path)
+    assert index.refresh() == ['dos', 'uno']
+
+    assert sorted(index.search('gato')) == [
+        CardMatch('dos', False, 0, 'El GATO de Schrödinger'),
+        CardMatch('uno', False, 0, 'Un gato'),
+        CardMatch('uno', False, 2, 'Gatos & perros'),
+    ]
+    assert list(index.search('que es')) == [CardMatch('uno', True, 0, '¿Qué es _?')]
+    assert index.decks_matching('un') == {'dos': 1, 'uno': 2}
+    assert index.decks_matching('jirafa') == {}
+
+
+def test_refresh_only_reindexes_changed_decks(tmp_path):
+    write_deck(tmp_path / 'uno.json', ['_'], ['Un gato'], mtime=1_000_000)
+    write_deck(tmp_path / 'dos.json', ['_'], ['Un perro'], mtime=1_000_000)
+    index = CardIndex(tmp_path)
+    index.refresh()
+    assert index.refresh() == []
+
+    write_deck(tmp_path / 'uno.json', ['_'], ['Un loro'])
+    assert index.refresh() == ['uno']
+    assert index.decks_matching('gato') == {}
+    assert index.decks_matching('loro') == {'uno': 1}
+
+    (tmp_path / 'dos.json').unlink()
+    index.refresh()
+    assert list(index.decks) == ['uno']
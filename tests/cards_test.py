@@ -0,0 +1,44 @@
+import pytest
+
+from cards import CardTable
+from models import Deck, Player, WhiteCard
+
+
+DECK_JSON = {
+    'name': 'Test',
+    'codeName': 'test',
+    'official': False,
+    'blackCards': [{'text': '&iquest;Qu&eacute; es _&quest;', 'pick': 1}, {'text': '_ y _', 'pick': 2}],
+    'whiteCards': ['Una &ntilde;', 'Dos', 'Tres', 'Cuatro'],
+}
+
+
+def test_card_table_is_immutable():
+    table = CardTable(white_texts=['a'], black_texts=['b _'], picks=[1])
+    with pytest.raises(AttributeError):
+        table.picks = None  # type: ignore
+    assert table.pick(0) == 1 and table.white_text(0) == 'a'
+
+
+def test_deck_builds_table_and_views():
+    deck = Deck(**DECK_JSON)
+    assert deck.table.white_count == 4 and deck.table.black_count == 2
+    assert deck.black_card(0).text == '¿Qué es _?'
+    assert deck.black_card(1).pick == 2
+    assert deck.white_card(0) == WhiteCard(text='Una ñ')
+
+
+def test_deck_round_trip_through_json():
+    deck = Deck(**DECK_JSON)
+    again = Deck.model_validate(deck.model_dump(by_alias=True))
+    assert again.table.white_texts == deck.table.white_texts
+    assert list(again.table.picks) == [1, 2]
+
+
+def test_player_hand_holds_card_ids():
+    deck = Deck(**DECK_JSON)
+    player = Player(name='Ana')
+    player.hand.extend(deck.draw_white_ids(3))
+    assert len(deck.used_white_cards) == 3
+    assert Player.model_validate_json(player.model_dump_json()).hand == player.hand
+    assert [card.text for card in deck.white_cards_of(player.hand)] == [deck.table.white_text(i) for i in player.hand]
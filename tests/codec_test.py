@@ -0,0 +1,41 @@
+import pytest
+
+from codec import BINARY_CODEC, HEADER, JSON_CODEC, select_subprotocol, BINARY_SUBPROTOCOL, JSON_SUBPROTOCOL
+from models import Message, NetworkRequest
+
+
+@pytest.mark.parametrize('codec', [BINARY_CODEC, JSON_CODEC])
+@pytest.mark.parametrize('request_type', list(NetworkRequest))
+def test_round_trip(codec, request_type):
+    for data in ({}, {'room': 'ABCDE', 'players': 3, 'deltas': [{'kind': 'phase'}]}):
+        message = Message(type=request_type, data=data)
+        decoded = codec.decode(codec.encode(message))
+        assert decoded == message and decoded.model_dump_json() == message.model_dump_json()
+
+
+def test_binary_frames_are_compact():
+    assert len(BINARY_CODEC.encode(Message(type=NetworkRequest.ACK))) == HEADER.size
+    message = Message(type=NetworkRequest.JOIN_ROOM, data={'room': 'ABCDE'})
+    assert len(BINARY_CODEC.encode(message)) < len(JSON_CODEC.encode(message))
+
+
+def test_raw_data_is_wrapped_like_a_message():
+    data = b'{"version":1}'
+    for codec in (BINARY_CODEC, JSON_CODEC):
+        message = codec.decode(codec.encode_raw(NetworkRequest.GET_GAME_STATE, data))
+        assert message == Message(type=NetworkRequest.GET_GAME_STATE, data={'version': 1})
+
+
+@pytest.mark.parametrize('frame', [
+    b'\xff\x00\x00\x00\x00', HEADER.pack(2, 10) + b'{}', '{"type":"2"}', HEADER.pack(2, 2) + b'[]', HEADER.pack(2, 1) + b'3',
+    b'', b'\x01', HEADER.pack(2, 0)[:-1],
+])
+def test_binary_rejects_malformed_frames(frame):
+    with pytest.raises(ValueError):
+        BINARY_CODEC.decode(frame)
+
+
+def test_subprotocol_negotiation():
+    assert select_subprotocol(None, [JSON_SUBPROTOCOL, BINARY_SUBPROTOCOL]) == BINARY_SUBPROTOCOL  # type: ignore
+    assert select_subprotocol(None, [JSON_SUBPROTOCOL]) == JSON_SUBPROTOCOL  # type: ignore
+    assert select_subprotocol(None, []) is None  # type: ignore
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+import main
+from cards import Deduplicator
+import server as server_module
+from compose import MAX_PACKS, Duplicate, compose_deck, composed_path, split_packs
+from models import Deck
+from server import Server
+
+
+def write_pack(path, black, white, official=True):
+    path.write_text(json.dumps({
+        'name': path.stem.capitalize(),
+        'codeName': path.stem,
+        'official': official,
+        'blackCards': [{'text': text, 'pick': pick} for text, pick in black],
+        'whiteCards': white,
+    }), encoding='utf-8')
+
+
+def test_deduplicator_keeps_the_first_of_every_text():
+    seen = Deduplicator()
+    assert [seen.add(text) for text in ['Un gato', 'Un perro', 'UN  GATO', 'Un gató', 'Un perro']] == [
+        None, None, 0, 0, 1
+    ]
+    assert seen.kept == ['Un gato', 'Un perro']
+
+
+def test_packs_are_merged_without_repeated_cards(tmp_path):
+    write_pack(tmp_path / 'uno.json', [('¿Qué es _?', 1)], ['Un gato', 'Un perro'])
+    write_pack(tmp_path / 'dos.json', [('¿Que es _?', 2), ('_ y _', 2)], ['Un GATO', 'Un loro', 'Un loro'], official=False)
+
+    composition = compose_deck(['uno', 'dos'], tmp_path)
+    deck = composition.deck
+    assert (deck.name, deck.code_name, deck.official) == ('Uno + Dos', 'uno+dos', False)
+    assert [card.text for card in deck.white_cards] == ['Un gato', 'Un perro', 'Un loro']
+    assert [(card.text, card.pick) for card in deck.black_cards] == [('¿Qué es _?', 1), ('_ y _', 2)]
+    assert composition.duplicates == [
+        Duplicate('¿Que es _?', True, 'dos', 'uno'),
+        Duplicate('Un GATO', False, 'dos', 'uno'),
+        Duplicate('Un loro', False, 'dos', 'dos'),
+    ]
+
+    # Composed again from the saved file, until a pack changes
+    cached = compose_deck(['uno', 'dos'], tmp_path)
+    assert cached.path == composition.path
+    assert cached.duplicates == composition.duplicates
+    assert not list(composition.path.parent.glob('*.tmp'))
+    write_pack(tmp_path / 'dos.json', [('_ y _', 2)], ['Un loro'])
+    changed = compose_deck(['uno', 'dos'], tmp_path)
+    assert changed.path == composed_path(['uno', 'dos'], tmp_path) != composition.path
+    assert changed.duplicates == []
+
+
+def test_composition_needs_different_packs(tmp_path):
+    with pytest.raises(ValueError):
+        compose_deck([], tmp_path)
+    with pytest.raises(ValueError):
+        compose_deck(['uno', 'uno'], tmp_path)
+
+
+def test_server_checks_every_pack_of_a_deck():
+    with pytest.raises(ValueError):
+        Server().deck('CAH-ES+missing')
+
+
+def test_any_order_of_a_few_packs_is_the_same_deck():
+    assert split_packs('dos+uno') == split_packs('uno+dos') == ['dos', 'uno']
+    with pytest.raises(ValueError):
+        split_packs('+'.join(f'pack{i}' for i in range(MAX_PACKS + 1)))
+
+
+def test_server_only_keeps_the_decks_used_last(monkeypatch):
+    monkeypatch.setattr(server_module, 'MAX_LOADED_DECKS', 1)
+    server = Server()
+    old = server.decks['old'] = Deck(name='Old', codeName='old', official=False, blackCards=[], whiteCards=[])
+    old.digest = '0' * 64
+    server.deck_payloads[old.digest] = 'payload'
+    deck = server.deck('CAH-ES')
+    assert list(server.decks) == ['CAH-ES'] and old.digest not in server.deck_payloads
+    assert server.deck('CAH-ES') is deck
+
+
+def test_single_player_deck_drops_repeated_cards():
+    assert main.WhiteCard(text='Un gato') == main.WhiteCard(text='Un gato')
+    assert main.WhiteCard(text='Un gato') != 'Un gato'
+    with pytest.warns(UserWarning, match='1 cartas repetidas'):
+        deck = main.Deck(
+            white_cards=[main.WhiteCard(text=text) for text in ['Un gato', 'Un perro', 'UN GATO']],
+            black_cards=[main.BlackCard(text='_', pick=1)],
+        )
+    assert [card.text for card in deck.white_cards] == ['Un gato', 'Un perro']
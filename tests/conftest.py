@@ -0,0 +1,46 @@
+import asyncio
+import socket
+import sys
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable
+
+import pytest
+
+# The multiplayer modules import each other by their flat names (they are run
+# as scripts from their own folder), so that folder has to be importable too.
+# It goes last so that the root main.py still wins over multiplayer/main.py.
+sys.path.append(str(Path(__file__).parent.parent / 'multiplayer'))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def running(**fields: Any) -> AsyncIterator[Any]:
+    """Serves a Server (built with the given fields) on a free local port
+    until the block ends."""
+
+    from server import Server
+
+    server = Server(host='127.0.0.1', port=free_port(), **fields)
+    serving = asyncio.create_task(server.serve())
+    while server._websocket is None:
+        await asyncio.sleep(0.01)
+    try:
+        yield server
+    finally:
+        # Cancelling serve() would wait for the open connections
+        server._websocket.close()
+        await serving
+
+
+@pytest.fixture
+def running_server() -> Callable[..., AbstractAsyncContextManager[Any]]:
+    """`async with running_server(**fields) as server:` inside the test's
+    own event loop."""
+
+    return running
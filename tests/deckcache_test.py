@@ -0,0 +1,97 @@
+import asyncio
+import io
+import os
+
+import pytest
+from websockets.asyncio.client import connect
+
+from codec import MAX_MESSAGE_SIZE, SUBPROTOCOLS, recv_message, send_message
+from deckcache import DeckCache, decode_deck
+from gameview import GameView
+from models import Deck, Message, NetworkRequest
+from screen import Screen
+
+
+def new_deck(white=('Un gato', 'Un perro')):
+    return Deck(name='Test', codeName='test', official=False, blackCards=[{'text': '_', 'pick': 1}], whiteCards=list(white))
+
+
+def test_decks_are_named_after_their_content(tmp_path):
+    cache = DeckCache(tmp_path)
+    digest = cache.add(new_deck())
+    assert cache.add(new_deck()) == digest
+    assert cache.add(new_deck(['Un loro'])) != digest
+    assert new_deck().fresh(1).digest is None
+
+    deck = cache.get(digest)
+    assert deck is not None and deck.digest == digest
+    assert deck.fresh(1).digest == digest
+    assert [card.text for card in deck.white_cards] == ['Un gato', 'Un perro']
+    assert cache.get('0' * 64) is None
+    with pytest.raises(ValueError):
+        cache.get('../deck')
+
+
+def test_received_decks_are_checked(tmp_path):
+    server_cache, client_cache = DeckCache(tmp_path / 'server'), DeckCache(tmp_path / 'client')
+    digest = server_cache.add(new_deck())
+    data = decode_deck(server_cache.payload(digest))
+
+    with pytest.raises(ValueError):
+        client_cache.put(digest, data[:-1] + b'x')
+    assert digest not in client_cache
+    assert list(client_cache.directory.iterdir()) == []
+    assert client_cache.put(digest, data).table.white_text(1) == 'Un perro'
+    assert digest in client_cache
+
+
+def test_clients_only_download_unknown_decks(tmp_path, running_server):
+    client_cache = DeckCache(tmp_path / 'client')
+
+    async def play(server) -> list[NetworkRequest]:
+        """Creates a room, follows its state and returns the messages that
+        were received."""
+
+        view = GameView(Screen(80, 20, io.StringIO()), client_cache)
+        received = []
+        async with connect(f'ws://127.0.0.1:{server.port}/', subprotocols=SUBPROTOCOLS) as websocket:
+            await send_message(websocket, Message(type=NetworkRequest.CREATE_ROOM, data={'deck': 'CAH-ES'}))
+            await recv_message(websocket)
+            await send_message(websocket, Message(type=NetworkRequest.SET_PLAYER_INFO, data={'name': 'Ana'}))
+            await recv_message(websocket)
+            request = Message(type=NetworkRequest.GET_GAME_STATE)
+            while request is not None:
+                await send_message(websocket, request)
+                message = await asyncio.wait_for(recv_message(websocket), 5)
+                received.append(message.type)
+                request = view.receive(message)
+        assert view.deck is not None and view.deck.name == server.decks['CAH-ES'].name
+        return received
+
+    async def run() -> tuple[list[NetworkRequest], list[NetworkRequest]]:
+        async with running_server(published=DeckCache(tmp_path / 'server')) as server:
+            # A new game with the same deck
+            return await play(server), await play(server)
+
+    first, second = asyncio.run(run())
+    assert NetworkRequest.GET_DECK in first
+    assert NetworkRequest.GET_DECK not in second
+
+
+def test_decks_larger_than_a_default_frame_are_downloaded(tmp_path, running_server):
+    # Random texts, so that compressing them does not make them small again
+    deck = new_deck(os.urandom(48).hex() for _ in range(20_000))
+    client_cache = DeckCache(tmp_path / 'client')
+
+    async def run() -> Message:
+        async with running_server(published=DeckCache(tmp_path / 'server')) as server:
+            digest = server.published.add(deck)
+            assert len(server.deck_payload(digest)) > 2 ** 20
+            uri = f'ws://127.0.0.1:{server.port}/'
+            async with connect(uri, subprotocols=SUBPROTOCOLS, max_size=MAX_MESSAGE_SIZE) as websocket:
+                await send_message(websocket, Message(type=NetworkRequest.GET_DECK, data={'digest': digest}))
+                return await asyncio.wait_for(recv_message(websocket), 5)
+
+    reply = asyncio.run(run())
+    downloaded = client_cache.put(reply.data['digest'], decode_deck(reply.data['deck']))
+    assert downloaded.table.white_text(19_999) == deck.table.white_text(19_999)
@@ -0,0 +1,105 @@
+import json
+import tracemalloc
+
+import pytest
+
+from deckfile import DeckStream, compile_deck, ensure_compiled, load_compiled, replacing
+from models import load_deck
+
+
+DECK_JSON = {
+    'name': 'Test',
+    'codeName': 'test',
+    'official': True,
+    'blackCards': [{'text': '&iquest;Qu&eacute; es _&quest;', 'pick': 1}, {'text': '_ y _', 'pick': 2}],
+    'whiteCards': ['Una &ntilde;', {'text': 'Dos'}, 'Tres'],
+}
+
+
+def test_compiled_deck_round_trip(tmp_path):
+    json_path = tmp_path / 'test.json'
+    json_path.write_text(json.dumps(DECK_JSON), encoding='utf-8')
+    compiled = load_compiled(compile_deck(json_path))
+    assert (compiled.name, compiled.code_name, compiled.official) == ('Test', 'test', True)
+    assert list(compiled.black_texts) == ['¿Qué es _?', '_ y _']
+    assert list(compiled.white_texts) == ['Una ñ', 'Dos', 'Tres']
+    assert compiled.white_texts[-1] == 'Tres'
+    assert list(compiled.picks) == [1, 2]
+
+
+def test_load_deck_compiles_on_demand(tmp_path):
+    json_path = tmp_path / 'test.json'
+    json_path.write_text(json.dumps(DECK_JSON), encoding='utf-8')
+    deck = load_deck(json_path)
+    assert ensure_compiled(json_path).exists()
+    assert deck.code_name == 'test'
+    assert deck.black_card(1).pick == 2
+    assert sorted(card.text for card in deck.draw_white_cards(3)) == ['Dos', 'Tres', 'Una ñ']
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+def test_deck_stream_reads_every_card(tmp_path, chunk_size):
+    deck = {**DECK_JSON, 'whiteCards': [*DECK_JSON['whiteCards'], {'text': 'Cuatro', 'id': 12345}]}
+    json_path = tmp_path / 'test.json'
+    json_path.write_text(json.dumps(deck, indent=chunk_size % 5), encoding='utf-8')
+    with open(json_path, encoding='utf-8') as deck_file:
+        items = list(DeckStream(deck_file, chunk_size))
+    assert items == [
+        ('name', 'Test'),
+        ('codeName', 'test'),
+        ('official', True),
+        *(('blackCards', card) for card in deck['blackCards']),
+        *(('whiteCards', card) for card in deck['whiteCards']),
+    ]
+    compiled = load_compiled(compile_deck(json_path, chunk_size=chunk_size))
+    assert list(compiled.white_texts) == ['Una ñ', 'Dos', 'Tres', 'Cuatro']
+
+
+@pytest.mark.parametrize('deck', [
+    {'name': 'Test', 'codeName': 'test', 'blackCards': [{'text': '_', 'pick': 0}]},
+    {'name': 'Test', 'codeName': 'test', 'whiteCards': [1]},
+    {'name': 'Test', 'whiteCards': []},
+])
+def test_invalid_decks_are_rejected(tmp_path, deck):
+    json_path = tmp_path / 'test.json'
+    json_path.write_text(json.dumps(deck), encoding='utf-8')
+    with pytest.raises(ValueError):
+        compile_deck(json_path)
+
+
+def test_compiling_does_not_load_the_whole_deck(tmp_path):
+    json_path = tmp_path / 'big.json'
+    with open(json_path, 'w', encoding='utf-8') as deck_file:
+        deck_file.write('{"name": "Big", "codeName": "big", "official": false, "blackCards": [')
+        deck_file.write(','.join(json.dumps({'text': f'Carta negra {i} _', 'pick': 1}) for i in range(20_000)))
+        deck_file.write('], "whiteCards": [')
+        deck_file.write(','.join(json.dumps(f'Carta blanca n&uacute;mero {i}') for i in range(100_000)))
+        deck_file.write(']}')
+
+    tracemalloc.start()
+    try:
+        compiled_path = compile_deck(json_path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # The offsets of the cards (4 bytes each) and a chunk of the file
+    assert peak < json_path.stat().st_size / 5, peak
+    compiled = load_compiled(compiled_path)
+    assert compiled.white_texts[-1] == 'Carta blanca número 99999'
+    assert len(compiled.black_texts) == 20_000
+
+
+def test_concurrent_writers_replace_whole_files(tmp_path):
+    path = tmp_path / 'test.cahd'
+    with replacing(path) as first, replacing(path) as second:
+        first.write(b'first')
+        second.write(b'second')
+        assert not path.exists()
+    assert path.read_bytes() == b'first'
+
+    with pytest.raises(RuntimeError):
+        with replacing(path) as file:
+            file.write(b'half')
+            raise RuntimeError('Interrupted')
+    assert path.read_bytes() == b'first'
+    assert [file.name for file in tmp_path.iterdir()] == ['test.cahd']
@@ -0,0 +1,64 @@
+import random
+import pytest
+
+from drawing import DrawPile, CAHDrawingListEmpty, seeded_rng
+from models import random_subset_choice_with_tracking
+
+
+def test_draw_pile_never_repeats():
+    pile = DrawPile(list(range(100)), random.Random(0))
+    drawn = pile.draw(60) + pile.draw(40)
+    assert sorted(drawn) == list(range(100))
+    assert len(pile) == 0
+    with pytest.raises(CAHDrawingListEmpty):
+        pile.draw()
+
+
+def test_draw_pile_tracks_used_cards_without_touching_cards():
+    cards = ['a', 'b', 'c', 'd', 'e']
+    pile = DrawPile(cards, random.Random(1))
+    drawn = pile.draw(3)
+    assert cards == ['a', 'b', 'c', 'd', 'e']
+    assert list(pile.used()) == drawn
+    assert len(pile) == 2
+    pile.reset()
+    assert len(pile) == 5 and list(pile.used()) == []
+
+
+def test_draw_pile_is_reproducible_with_same_seed():
+    first = DrawPile(list(range(50)), random.Random(42)).draw(10)
+    second = DrawPile(list(range(50)), random.Random(42)).draw(10)
+    assert first == second
+
+
+@pytest.mark.parametrize('total', [0, 1, 5, 10])
+def test_random_subset_choice_with_tracking(total):
+    drawing_list = list(range(10))
+    tracking_list: list[int] = []
+    choices = random_subset_choice_with_tracking(drawing_list, tracking_list, total)
+    assert choices == tracking_list
+    assert len(drawing_list) == 10 - total
+    assert sorted(drawing_list + choices) == list(range(10))
+
+
+def test_draw_pile_take_ids_restores_a_position():
+    original = DrawPile(list(range(30)), random.Random(3))
+    drawn = list(original.draw_ids(12))
+    restored = DrawPile(list(range(30)), random.Random(4))
+    restored.take_ids(drawn[:5])
+    restored.take_ids(drawn[5:])
+    assert list(restored.used_ids()) == drawn
+    assert sorted(drawn + list(restored.draw_ids(18))) == list(range(30))
+    with pytest.raises(ValueError):
+        DrawPile(list(range(30))).take_ids([7, 7])
+
+
+def test_draw_pile_replay_ids_goes_on_with_the_same_sequence():
+    original = DrawPile(list(range(30)), seeded_rng(7, 'white'))
+    drawn = list(original.draw_ids(10))
+    replayed = DrawPile(list(range(30)), seeded_rng(7, 'white'))
+    replayed.replay_ids(drawn)
+    assert list(replayed.draw_ids(5)) == list(original.draw_ids(5))
+    other = DrawPile(list(range(30)), seeded_rng(8, 'white'))
+    other.replay_ids(drawn)
+    assert list(other.used_ids()) == drawn
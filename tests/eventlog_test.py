@@ -0,0 +1,81 @@
+import asyncio
+
+from eventlog import LOG_NAME, EventLog, RecordKind, read_log
+from models import Deck, GameSettings, Phase, Player
+from rooms import RoomRegistry
+from server import start_judgement, start_round
+from sync import PlayerReady, player_joined
+
+
+DECK = Deck(
+    name='Test',
+    codeName='test',
+    official=False,
+    blackCards=[{'text': f'{i} _', 'pick': 1} for i in range(10)],
+    whiteCards=[str(i) for i in range(100)],
+)
+
+
+def deck(name: str) -> Deck:
+    assert name == 'test'
+    return DECK
+
+
+def test_log_skips_a_torn_last_record(tmp_path):
+    async def run():
+        log = EventLog(tmp_path)
+        log.append(RecordKind.CREATE, 'ABCDE', {'deck': 'test', 'settings': {}})
+        log.append(RecordKind.REMOVE, 'ABCDE', {})
+        await log.close()
+
+    asyncio.run(run())
+    path = tmp_path / LOG_NAME
+    path.write_bytes(path.read_bytes()[:-3])
+    assert [(record.sequence, record.kind) for record in read_log(path)] == [(1, RecordKind.CREATE)]
+
+    async def reopen():
+        log = EventLog(tmp_path, sequence=1)
+        log.append(RecordKind.REMOVE, 'ABCDE', {})
+        await log.close()
+
+    asyncio.run(reopen())
+    assert [record.sequence for record in read_log(path)] == [1, 2]
+
+
+def test_rooms_are_recovered_from_snapshot_and_log(tmp_path):
+    async def play() -> list[dict]:
+        rooms = RoomRegistry()
+        log = EventLog(tmp_path)
+        rooms.attach_log(log)
+        first = rooms.create(GameSettings(deck=DECK), code='AAAAA', deck_name='test')
+        second = rooms.create(GameSettings(deck=DECK), code='BBBBB', deck_name='test')
+        players = [Player(name=f'Jugador {i}') for i in range(3)]
+        for room in (first, second):
+            room.sync.apply(*(player_joined(player) for player in players))
+        start_round(first)
+        await log.snapshot(rooms.snapshot)
+
+        # Only in the log
+        first.sync.apply(PlayerReady(player_id=players[0].id))
+        player = first.game_state.player(players[1].id)
+        player.selected_cards.append(player.hand[0])
+        first.log.choices(player.id, player.selected_cards)
+        start_judgement(first)
+        start_round(second)
+        rooms.remove('BBBBB')
+        rooms.create(GameSettings(deck=DECK), code='CCCCC', deck_name='test')
+        snapshot = rooms.snapshot()
+        for room in rooms.rooms.values():
+            room.cancel_deadline()
+        await log.close()
+        return snapshot
+
+    before = asyncio.run(play())
+    assert not list(tmp_path.glob('*.tmp'))
+    recovered = RoomRegistry()
+    sequence = recovered.recover(tmp_path, deck)
+    assert sequence == 13
+    assert recovered.snapshot() == before
+    state = recovered.get('AAAAA').game_state
+    assert state.phase is Phase.JUDGEMENT and state.players[0].ready
+    assert len(state.settings.deck.drawn_ids()[1]) == 15
@@ -0,0 +1,71 @@
+import asyncio
+import io
+import os
+
+import pytest
+
+from deckcache import DeckCache
+from gameview import GameView
+from keyboard import BACKSPACE, CHAR, DOWN, ENTER, ESCAPE, UP, Key, Keyboard, parse_keys
+from models import Deck, Message, NetworkRequest, Phase
+from screen import Screen
+
+
+def test_keys_are_parsed_from_escape_sequences():
+    keys, rest = parse_keys('añ\x1b[A\x1bOB\r\n\x7f\x1b[15~\x1b')
+    assert keys == [Key(CHAR, 'a'), Key(CHAR, 'ñ'), Key(UP), Key(DOWN), Key(ENTER), Key(BACKSPACE), Key(ESCAPE)]
+    assert rest == ''
+
+    # A sequence cut between two reads is finished by the next one
+    keys, rest = parse_keys('x\x1b[1;')
+    assert (keys, rest) == ([Key(CHAR, 'x')], '\x1b[1;')
+    assert parse_keys(rest + '5A') == ([Key(UP)], '')
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='Windows consoles are read by a thread')
+def test_lines_are_read_from_the_event_loop():
+    async def read() -> tuple[str, str, Key]:
+        read_fd, write_fd = os.pipe()
+        echo = io.StringIO()
+        with open(read_fd, encoding='utf-8') as stdin:
+            async with Keyboard(stdin, echo) as keyboard:
+                os.write(write_fd, 'Anx\x7fa\r'.encode())
+                # Split in the middle of a character
+                os.write(write_fd, 'Ñ'.encode()[:1])
+                await asyncio.sleep(0.01)
+                os.write(write_fd, 'Ñ'.encode()[1:] + b'\r\x1b[B')
+                first = await asyncio.wait_for(keyboard.line('Name: '), 1)
+                second = await asyncio.wait_for(keyboard.line(), 1)
+                key = await asyncio.wait_for(keyboard.key(), 1)
+        os.close(write_fd)
+        assert echo.getvalue().startswith('Name: Anx\b \ba\n')
+        return first, second, key
+
+    assert asyncio.run(read()) == ('Ana', 'Ñ', Key(DOWN))
+
+
+def test_cards_are_chosen_with_number_keys(tmp_path):
+    cache = DeckCache(tmp_path)
+    digest = cache.add(Deck(
+        name='Test', codeName='test', official=False,
+        blackCards=[{'text': '_ y _', 'pick': 2}], whiteCards=['Un gato', 'Un perro', 'Un loro'],
+    ))
+    view = GameView(Screen(80, 20, io.StringIO()), cache)
+    view.receive(Message(type=NetworkRequest.GET_GAME_STATE, data={
+        'version': 1,
+        'state': {
+            'settings': {'deck_digest': digest, 'max_round_time': 30},
+            'phase': Phase.PLAY_CARDS.value,
+            'players': [],
+            'black_card_id': 0,
+        },
+        'private': {'hand': [2, 0, 1]},
+    }))
+    assert view.press(Key(ENTER)) is None
+    for char in '33931':
+        assert view.press(Key(CHAR, char)) is None
+    # A second press unchooses a card; 9 is not in the hand
+    assert view.chosen == [2, 0]
+    message = view.press(Key(ENTER))
+    assert message is not None
+    assert (message.type, message.data) == (NetworkRequest.SET_PLAYER_CHOICES, {'cards': [2, 0]})
@@ -0,0 +1,135 @@
+import asyncio
+import uuid
+
+from websockets.asyncio.client import connect
+
+from codec import SUBPROTOCOLS, recv_message, send_message
+from matchmaking import Matchmaker, QueueKey
+from models import Message, NetworkRequest, Phase
+
+
+SPANISH = QueueKey('CAH-ES', 5, 3)
+LONG = QueueKey('CAH-ES', 5, 10)
+
+
+def collect(matchmaker):
+    groups = []
+    matchmaker.on_match = lambda key, tickets: groups.append((key, [ticket.connection_id for ticket in tickets]))
+    return groups
+
+
+def test_full_groups_are_matched_in_arrival_order():
+    matchmaker = Matchmaker(3, room_size=3, max_wait=None)
+    groups = collect(matchmaker)
+    players = [uuid.uuid4() for _ in range(4)]
+
+    matchmaker.enqueue(players[0], SPANISH)
+    matchmaker.enqueue(players[1], LONG)
+    matchmaker.enqueue(players[2], SPANISH)
+    assert groups == []
+    assert matchmaker.waiting(SPANISH) == 2 and matchmaker.waiting(LONG) == 1
+    # Waiting with other settings moves the player to the other queue
+    matchmaker.enqueue(players[1], SPANISH)
+    assert groups == [(SPANISH, [players[0], players[2], players[1]])]
+    assert matchmaker.queues == {} and len(matchmaker) == 0
+
+    matchmaker.enqueue(players[3], LONG)
+    assert players[3] in matchmaker and matchmaker.waiting(LONG) == 1
+
+
+def test_players_that_leave_are_skipped():
+    matchmaker = Matchmaker(3, room_size=200, max_wait=None)
+    groups = collect(matchmaker)
+    players = [uuid.uuid4() for _ in range(350)]
+    for player in players[:150]:
+        matchmaker.enqueue(player, SPANISH)
+    for player in players[:149]:
+        assert matchmaker.cancel(player)
+    assert not matchmaker.cancel(players[0])
+    # Most of the heap was gone: it was rebuilt
+    assert len(matchmaker.queues[SPANISH].heap) < 100
+
+    for player in players[150:349]:
+        matchmaker.enqueue(player, SPANISH)
+    assert [len(tickets) for _, tickets in groups] == [200]
+    assert groups[0][1][0] == players[149]
+
+    matchmaker.enqueue(players[349], SPANISH)
+    matchmaker.cancel(players[349])
+    assert matchmaker.queues == {}
+
+
+def test_smaller_groups_are_matched_after_waiting():
+    async def run():
+        matchmaker = Matchmaker(2, room_size=4, max_wait=0)
+        groups = collect(matchmaker)
+        first, second, third = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        matchmaker.enqueue(first, SPANISH)
+        await asyncio.sleep(0.1)
+        assert groups == []
+        matchmaker.enqueue(second, SPANISH)
+        matchmaker.enqueue(third, LONG)
+        await asyncio.sleep(1.5)
+        return groups
+
+    assert [len(tickets) for _, tickets in asyncio.run(run())] == [2]
+
+
+def test_the_wait_counts_from_the_oldest_ticket_left():
+    async def run() -> tuple[int, int, list]:
+        matchmaker = Matchmaker(2, room_size=4, max_wait=10)
+        groups = collect(matchmaker)
+        first = matchmaker.enqueue(uuid.uuid4(), SPANISH)
+        second = matchmaker.enqueue(uuid.uuid4(), SPANISH)
+        matchmaker.enqueue(uuid.uuid4(), SPANISH)
+        # As if the second one had arrived much later
+        second.enqueued_at = first.enqueued_at + 100
+        timer = matchmaker.queues[SPANISH].timer
+        matchmaker.cancel(first.connection_id)
+        rescheduled = matchmaker.queues[SPANISH].timer
+        assert timer is not None and rescheduled is not None and rescheduled is not timer
+        deadlines = timer.deadline, rescheduled.deadline
+        rescheduled.cancel()
+        return *deadlines, groups
+
+    first_deadline, deadline, groups = asyncio.run(run())
+    assert deadline - first_deadline >= 99 and groups == []
+
+
+def test_matched_players_share_a_room_that_starts_with_all_of_them(running_server):
+    matchmaker = Matchmaker(3, room_size=3, max_wait=None)
+
+    async def play(server, name: str, joined: asyncio.Barrier, late: bool = False) -> str:
+        async with connect(f'ws://127.0.0.1:{server.port}/', subprotocols=SUBPROTOCOLS) as websocket:
+            await send_message(websocket, Message(type=NetworkRequest.MATCHMAKE, data={'deck': 'CAH-ES'}))
+            waiting = await recv_message(websocket)
+            assert waiting.type == NetworkRequest.MATCHMAKE and waiting.data['waiting'] >= 1
+            room = (await recv_message(websocket)).data['room']
+            if late:
+                # The last one takes its time to join the game
+                await asyncio.sleep(0.1)
+            await send_message(websocket, Message(type=NetworkRequest.SET_PLAYER_INFO, data={'name': name}))
+            await recv_message(websocket)
+            await send_message(websocket, Message(type=NetworkRequest.START))
+            # Only the START that starts the game is answered with START
+            reply = await recv_message(websocket)
+            assert reply.type == (NetworkRequest.START if late else NetworkRequest.DISCONNECT)
+            if not late:
+                assert server.rooms.get(room).game_state.phase is Phase.SETUP
+            await joined.wait()
+            # Everyone is in: the last START started the game
+            assert server.rooms.get(room).game_state.phase is Phase.PLAY_CARDS
+            return room
+
+    async def run() -> list[str]:
+        async with running_server(matchmaker=matchmaker) as server:
+            joined = asyncio.Barrier(3)
+            return await asyncio.gather(
+                play(server, 'Ana', joined),
+                play(server, 'Bea', joined),
+                play(server, 'Cris', joined, late=True),
+            )
+
+    rooms = asyncio.run(run())
+    assert len(set(rooms)) == 1
+    assert len(matchmaker) == 0
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from metrics import Registry, instrument, serve_metrics
+import metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('latency_seconds', 'Latency', ('request',))
+    histogram.buckets = (0.1, 1.0)
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, 'PING')
+    assert registry.render().splitlines() == [
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{request="PING",le="0.1"} 2',
+        'latency_seconds_bucket{request="PING",le="1.0"} 3',
+        'latency_seconds_bucket{request="PING",le="+Inf"} 4',
+        'latency_seconds_sum{request="PING"} 2.65',
+        'latency_seconds_count{request="PING"} 4',
+    ]
+
+
+def test_instrument_times_handlers_and_counts_errors():
+    async def fails() -> None:
+        raise RuntimeError
+
+    async def run():
+        await instrument('TEST_OK', asyncio.sleep)(0)
+        with pytest.raises(RuntimeError):
+            await instrument('TEST_FAIL', fails)()
+
+    asyncio.run(run())
+    assert metrics.HANDLER_SECONDS.counts[('TEST_OK',)][-1] == 0
+    assert sum(metrics.HANDLER_SECONDS.counts[('TEST_FAIL',)]) == 1
+    assert metrics.HANDLER_ERRORS.values[('TEST_FAIL',)] == 1
+    assert ('TEST_OK',) not in metrics.HANDLER_ERRORS.values
+
+
+def test_metrics_are_served_over_http():
+    async def run() -> bytes:
+        server = await serve_metrics('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        response = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response
+
+    response = asyncio.run(run())
+    assert response.startswith(b'HTTP/1.1 200 OK')
+    assert b'# TYPE cah_handler_seconds histogram' in response
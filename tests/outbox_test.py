@@ -0,0 +1,73 @@
+import asyncio
+from uuid import uuid4
+
+from metrics import DROPPED_CLIENTS
+from models import Message, NetworkRequest
+from outbox import Outbox
+
+
+class SlowConnection:
+    def __init__(self) -> None:
+        self.id = uuid4()
+        self.subprotocol = None
+        self.remote_address = ('127.0.0.1', 0)
+        self.sent: list[bytes] = []
+        self.closed = False
+        self.close_calls = 0
+        self.unblock = asyncio.Event()
+
+    async def send(self, frame: bytes, text: bool | None = None) -> None:
+        await self.unblock.wait()
+        self.sent.append(frame)
+
+    async def close(self, code: int = 1000, reason: str = '') -> None:
+        self.closed = True
+        self.close_calls += 1
+
+
+def test_outbox_sends_in_order():
+    async def run():
+        connection = SlowConnection()
+        connection.unblock.set()
+        outbox = Outbox(connection, maxsize=4)  # type: ignore
+        outbox.start()
+        for request in (NetworkRequest.ACK, NetworkRequest.READY, NetworkRequest.START):
+            await outbox.send(Message(type=request))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        await outbox.close()
+        return connection
+
+    connection = asyncio.run(run())
+    assert [Message.model_validate_json(frame).type for frame in connection.sent] == [
+        NetworkRequest.ACK, NetworkRequest.READY, NetworkRequest.START,
+    ]
+
+
+def test_full_outbox_drops_the_client_instead_of_blocking():
+    async def run():
+        connection = SlowConnection()
+        outbox = Outbox(connection, maxsize=2)  # type: ignore
+        outbox.start()
+        results = [outbox.offer(b'{}') for _ in range(4)]
+        await asyncio.sleep(0)
+        await outbox.close()
+        return connection, results
+
+    connection, results = asyncio.run(run())
+    assert results.count(False) >= 1
+    assert connection.closed
+
+
+def test_dropped_clients_are_only_dropped_once():
+    async def run():
+        connection = SlowConnection()
+        outbox = Outbox(connection, maxsize=1)  # type: ignore
+        dropped_before = DROPPED_CLIENTS.values.get((), 0)
+        results = [outbox.offer(b'{}') for _ in range(5)]
+        await asyncio.sleep(0)
+        return connection, results, DROPPED_CLIENTS.values.get((), 0) - dropped_before, outbox.dropped
+
+    connection, results, dropped, flagged = asyncio.run(run())
+    assert results == [True, False, False, False, False]
+    assert connection.close_calls == 1 and dropped == 1 and flagged
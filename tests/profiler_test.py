@@ -0,0 +1,69 @@
+import sys
+import time
+
+from models import Deck, GameSettings, Phase
+from profiler import Profiler
+from rooms import RoomRegistry
+from server import start_judgement, tag_server
+
+
+DECK = Deck(name='Test', codeName='test', official=False, blackCards=[{'text': '_', 'pick': 1}], whiteCards=['a', 'b', 'c'])
+
+
+def outer(profiler: Profiler, phase: str) -> None:
+    inner(profiler)
+
+
+def inner(profiler: Profiler) -> None:
+    profiler.sample(sys._getframe())
+
+
+def test_samples_are_tagged_by_the_frames_on_the_stack(tmp_path):
+    profiler = Profiler(tmp_path)
+    profiler.tag(outer, lambda frame: {'phase': frame.f_locals['phase'], 'room': 'ABCDE'})
+    profiler.tag(inner, lambda frame: {'request': 'START', 'phase': 'INNER'})
+    outer(profiler, 'SETUP')
+    outer(profiler, 'SETUP')
+    profiler.tag(inner, lambda frame: None)
+    outer(profiler, 'JUDGEMENT')
+
+    [judgement] = profiler.collapsed(lambda tags: tags['phase'] == 'JUDGEMENT')
+    assert judgement.startswith('phase:JUDGEMENT;')
+    assert judgement.endswith(';outer (profiler_test.py:13);inner (profiler_test.py:17) 1')
+    [setup] = profiler.collapsed()
+    # The innermost frame wins, and only the prefix tags are written
+    assert setup.startswith('phase:INNER;request:START;')
+    assert setup.endswith(' 2')
+    assert profiler.collapsed() == []
+
+
+def test_room_profiles_are_written_when_the_room_is_removed(tmp_path):
+    profiler = Profiler(tmp_path)
+    tag_server(profiler)
+    rooms = RoomRegistry()
+    rooms.on_remove = lambda room: profiler.write(f'room-{room.code}', lambda tags: tags.get('room') == room.code)
+    room = rooms.create(GameSettings(deck=DECK), code='ABCDE')
+    other = rooms.create(GameSettings(deck=DECK), code='FGHIJ')
+    room.sync.apply = lambda *deltas: profiler.sample(sys._getframe())  # type: ignore
+    room.set_deadline = lambda *args: None  # type: ignore
+    start_judgement(room)
+    rooms.remove(other.code)
+    assert list(tmp_path.iterdir()) == []
+
+    rooms.remove(room.code)
+    [path] = tmp_path.iterdir()
+    assert path.name.startswith('room-ABCDE-')
+    [line] = path.read_text().splitlines()
+    assert line.startswith(f'phase:{Phase.SETUP.name};')
+    assert 'start_judgement (server.py:' in line
+
+
+def test_sampler_thread_profiles_the_current_thread(tmp_path):
+    profiler = Profiler(tmp_path, rate=1000)
+    with profiler:
+        end = time.perf_counter() + 0.1
+        while time.perf_counter() < end:
+            pass
+    lines = profiler.collapsed()
+    assert lines
+    assert all('test_sampler_thread_profiles_the_current_thread' in line for line in lines)
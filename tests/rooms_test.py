@@ -0,0 +1,122 @@
+import asyncio
+from uuid import UUID, uuid4
+
+import pytest
+
+from models import Deck, GameSettings, Player
+from rooms import RoomNotFound, RoomRegistry, Shard
+
+
+DECK = Deck(name='Test', codeName='test', official=False, blackCards=[{'text': '_', 'pick': 1}], whiteCards=['a', 'b', 'c'])
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.id = uuid4()
+        self.subprotocol = None
+
+
+def connection():
+    return FakeConnection()
+
+
+def test_rooms_have_their_own_game_state_and_piles():
+    rooms = RoomRegistry()
+    first = rooms.create(GameSettings(deck=DECK))
+    second = rooms.create(GameSettings(deck=DECK))
+    assert first.code != second.code and len(rooms) == 2
+    first.game_state.settings.deck.draw_white_cards(3)
+    assert len(second.game_state.settings.deck.draw_white_cards(3)) == 3
+    assert first.game_state.settings.deck.table is second.game_state.settings.deck.table
+
+
+def test_join_and_leave_routes_connections():
+    rooms = RoomRegistry()
+    room = rooms.create(GameSettings(deck=DECK), code='ABCDE')
+    alice, bob = connection(), connection()
+    assert rooms.join('abcde', alice) is room
+    rooms.join('ABCDE', bob)
+    assert rooms.room_of(bob) is room
+    player = Player(name='Alice', id=alice.id)
+    room.clients[alice.id] = player
+    room.game_state.players.append(player)
+
+    rooms.leave(alice)
+    assert rooms.room_of(alice) is None and room.game_state.players == []
+    rooms.leave(bob)
+    with pytest.raises(RoomNotFound):
+        rooms.get('ABCDE')
+
+
+def test_finished_rooms_are_removed():
+    rooms = RoomRegistry()
+    room = rooms.create(GameSettings(deck=DECK))
+    alice = connection()
+    rooms.join(room.code, alice)
+    rooms.finish(room.code)
+    assert rooms.get(room.code).finished
+    rooms.leave(alice)
+    assert len(rooms) == 0
+    rooms.finish(rooms.create(GameSettings(deck=DECK)).code)
+    assert len(rooms) == 0
+
+
+def test_sharded_registry_only_creates_owned_rooms():
+    shards = [Shard(index, 3) for index in range(3)]
+    for shard in shards:
+        rooms = RoomRegistry(shard=shard)
+        for _ in range(20):
+            code = rooms.create(GameSettings(deck=DECK)).code
+            assert shard.owns(code)
+            assert [other.owns(code) for other in shards].count(True) == 1
+
+
+def test_rooms_draw_their_seeded_sequence():
+    deck = Deck(name='Test', codeName='test', official=False, blackCards=[{'text': f'{i} _', 'pick': 1} for i in range(20)], whiteCards=[str(i) for i in range(50)])
+    rooms = RoomRegistry()
+    first = rooms.create(GameSettings(deck=deck, random_seed=11)).game_state.settings.deck
+    second = rooms.create(GameSettings(deck=deck, random_seed=11)).game_state.settings.deck
+    other = rooms.create(GameSettings(deck=deck, random_seed=12)).game_state.settings.deck
+    # Drawing black cards does not change the white sequence
+    first.draw_black_ids(3)
+    white = first.draw_white_ids(10)
+    assert white == second.draw_white_ids(10) != other.draw_white_ids(10)
+    black_sequence, white_sequence = deck.card_sequence(11)
+    assert white == white_sequence[:10]
+    assert first.drawn_ids()[0] == black_sequence[:3]
+
+
+def test_rooms_nobody_reclaims_are_removed():
+    async def run() -> RoomRegistry:
+        rooms = RoomRegistry()
+        rooms.create(GameSettings(deck=DECK), code='AAAAA')
+        rooms.create(GameSettings(deck=DECK), code='BBBBB')
+        rooms.expire_unclaimed(0)
+        rooms.join('BBBBB', connection())
+        await asyncio.sleep(1.5)
+        return rooms
+
+    rooms = asyncio.run(run())
+    assert list(rooms.rooms) == ['BBBBB']
+
+
+def test_players_nobody_reclaims_are_dropped():
+    async def run() -> tuple[list[UUID], UUID]:
+        rooms = RoomRegistry()
+        room = rooms.create(GameSettings(deck=DECK), code='AAAAA')
+        # As recovered: players without a connection
+        players = [Player(name=name) for name in ('Ana', 'Bea')]
+        room.game_state.players.extend(players)
+        rooms.expire_unclaimed(0)
+        bea = connection()
+        rooms.join('AAAAA', bea)
+        with pytest.raises(KeyError):
+            room.reclaim(uuid4(), bea.id)
+        room.reclaim(players[1].id, bea.id)
+        with pytest.raises(KeyError):
+            room.reclaim(bea.id, connection().id)
+        await asyncio.sleep(1.5)
+        return [player.id for player in room.game_state.players], bea.id
+
+    player_ids, bea_id = asyncio.run(run())
+    assert player_ids == [bea_id]
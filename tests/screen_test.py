@@ -0,0 +1,110 @@
+import io
+import json
+import uuid
+
+from deckcache import DeckCache
+from gameview import GameView
+from models import Deck, Message, NetworkRequest, Phase
+from screen import BOLD, Screen, draw_cards, draw_timer
+
+
+def test_unchanged_frames_write_nothing():
+    out = io.StringIO()
+    screen = Screen(20, 5, out)
+    screen.text(0, 0, 'Hola')
+    assert screen.flush() > 0
+    assert 'Hola' in out.getvalue()
+
+    written = len(out.getvalue())
+    screen.clear()
+    screen.text(0, 0, 'Hola')
+    assert screen.flush() == 0
+    assert len(out.getvalue()) == written
+
+
+def test_only_changed_cells_are_written():
+    screen = Screen(20, 5, io.StringIO())
+    screen.text(0, 1, 'Un gato negro')
+    screen.flush()
+
+    screen.text(3, 1, 'pato')
+    assert screen.render() == '\x1b[2;4H\x1b[0mp'
+    # Short unchanged gaps are written again instead of moving the cursor
+    screen.text(3, 1, 'pita')
+    assert screen.render() == '\x1b[2;5H\x1b[0mita'
+    screen.text(0, 3, 'x', BOLD)
+    assert screen.render() == '\x1b[4;1H\x1b[0;1mx\x1b[0m'
+
+
+def test_text_is_clipped_to_the_screen():
+    screen = Screen(10, 2, io.StringIO())
+    assert screen.text(6, 0, 'abcdefgh') == 4
+    assert screen.text(-2, 1, 'abcdef', width=4) == 2
+    assert screen.text(0, 5, 'abc') == 0
+    assert [''.join(row) for row in screen.chars] == ['      abcd', 'cd        ']
+
+
+def test_cards_wrap_in_rows():
+    screen = Screen(50, 20, io.StringIO())
+    height = draw_cards(screen, 0, 0, ['Un gato', 'Un perro muy grande y peludo', 'Un loro'], width=20)
+    # Two cards per row; the second row is as tall as its only card
+    assert height == 4 + 3
+    assert ''.join(screen.chars[0][:6]) == '+- 1 -'
+    assert ''.join(screen.chars[4][:6]) == '+- 3 -'
+
+
+def test_timer_empties_as_time_runs_out():
+    screen = Screen(20, 1, io.StringIO())
+    draw_timer(screen, 0, 0, 7.5, 15, width=20)
+    assert ''.join(screen.chars[0]) == ' 7.5s ' + '#' * 7 + '.' * 7
+
+
+def test_game_view_follows_deltas_and_the_countdown(tmp_path):
+    cache = DeckCache(tmp_path)
+    digest = cache.add(Deck(
+        name='Test', codeName='test', official=False,
+        blackCards=[{'text': '¿Qué es _?', 'pick': 1}], whiteCards=['Un perro', 'Un gato'],
+    ))
+    player_id = str(uuid.uuid4())
+    view = GameView(Screen(80, 20, io.StringIO()), cache)
+    state = {
+        'settings': {'deck': 'Test', 'deck_digest': digest, 'max_round_time': 30},
+        'phase': Phase.SETUP.value,
+        'players': [{'id': player_id, 'name': 'Ana', 'color': 'red', 'score': 0, 'ready': False}],
+        'black_card_id': None,
+    }
+    private = {'hand': [1], 'selected_cards': []}
+    # The deck is in the cache: nothing to ask for
+    assert view.receive(Message(type=NetworkRequest.GET_GAME_STATE, data={
+        'version': 3, 'state': state, 'private': private,
+    })) is None
+    deltas = [
+        {'kind': 'black_card', 'card_id': 0},
+        {'kind': 'phase', 'phase': Phase.PLAY_CARDS.value},
+        {'kind': 'player_ready', 'player_id': player_id, 'ready': True},
+    ]
+    assert view.receive(Message(type=NetworkRequest.STATE_DELTA, data={
+        'from_version': 4, 'version': 6, 'deltas': deltas,
+    })) is None
+    assert view.version == 6
+    assert view.state['phase'] == Phase.PLAY_CARDS.value
+    assert view.state['players'][0]['ready']
+
+    # Missed versions: the state has to be asked for again
+    request = view.receive(Message(type=NetworkRequest.STATE_DELTA, data={
+        'from_version': 9, 'version': 9, 'deltas': [json.loads('{"kind": "phase", "phase": "1"}')],
+    }))
+    assert request == Message(type=NetworkRequest.GET_GAME_STATE, data={'version': 6})
+
+    view.receive(Message(type=NetworkRequest.COUNTDOWN, data={'remaining': 15}), now=100.0)
+    view.draw(now=100.0)
+    view.screen.flush()
+    # Between countdown messages only the timer changes
+    view.draw(now=100.05)
+    assert view.screen.render() == ''
+    view.draw(now=101.0)
+    changes = view.screen.render()
+    assert changes.startswith('\x1b[2;') and 'gato' not in changes
+    rows = [''.join(row) for row in view.screen.chars]
+    assert any('¿Qué es _____?' in row for row in rows)
+    assert any('Un gato' in row for row in rows)
@@ -0,0 +1,160 @@
+import asyncio
+from uuid import UUID, uuid4
+
+import pytest
+from websockets.asyncio.client import connect
+
+from codec import SUBPROTOCOLS, recv_message, send_message
+from eventlog import EventLog
+from models import Deck, GameSettings, Message, NetworkRequest, Phase, Player
+from rooms import RoomRegistry
+from server import Server, handle_set_player_choices, start_round
+from sync import player_joined
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.id = uuid4()
+        self.subprotocol = None
+        self.remote_address = ('127.0.0.1', 0)
+
+
+async def request(websocket, request: NetworkRequest, **data) -> Message:
+    await send_message(websocket, Message(type=request, data=data))
+    return await asyncio.wait_for(recv_message(websocket), 5)
+
+
+def test_rooms_are_only_created_with_valid_settings(running_server):
+    async def run() -> list[Message]:
+        async with running_server() as server, connect(f'ws://127.0.0.1:{server.port}/', subprotocols=SUBPROTOCOLS) as websocket:
+            replies = [
+                await request(websocket, NetworkRequest.CREATE_ROOM),
+                await request(websocket, NetworkRequest.CREATE_ROOM, deck='CAH-ES', max_round_time=10 ** 9),
+                await request(websocket, NetworkRequest.CREATE_ROOM, deck='CAH-ES', max_hand_size='5'),
+                await request(websocket, NetworkRequest.CREATE_ROOM, deck='CAH-ES', seats=4),
+                await request(websocket, NetworkRequest.CREATE_ROOM, deck='missing'),
+            ]
+            assert len(server.rooms) == 0
+            replies.append(await request(websocket, NetworkRequest.CREATE_ROOM, deck='CAH-ES', max_round_time=60))
+            assert server.rooms.get(replies[-1].data['room']).game_state.settings.max_round_time == 60
+            return replies
+
+    *rejected, created = asyncio.run(run())
+    assert all(reply.type == NetworkRequest.DISCONNECT and reply.data['reason'] for reply in rejected)
+    assert created.type == NetworkRequest.CREATE_ROOM
+
+
+def test_full_rooms_reject_more_players(running_server):
+    async def run() -> list[NetworkRequest]:
+        async with running_server() as server, connect(f'ws://127.0.0.1:{server.port}/', subprotocols=SUBPROTOCOLS) as host:
+            code = (await request(host, NetworkRequest.CREATE_ROOM, deck='CAH-ES', max_player_count=3)).data['room']
+            replies = []
+            connections = [host] + [await connect(f'ws://127.0.0.1:{server.port}/{code}', subprotocols=SUBPROTOCOLS) for _ in range(3)]
+            for index, websocket in enumerate(connections):
+                replies.append((await request(websocket, NetworkRequest.SET_PLAYER_INFO, name=f'P{index}')).type)
+            assert len(server.rooms.get(code).game_state.players) == 3
+            for websocket in connections[1:]:
+                await websocket.close()
+            return replies
+
+    assert asyncio.run(run()) == [NetworkRequest.ACK] * 3 + [NetworkRequest.DISCONNECT]
+
+
+def test_players_register_once_with_only_their_name_and_color(running_server):
+    async def run() -> list[NetworkRequest]:
+        async with running_server() as server, connect(f'ws://127.0.0.1:{server.port}/', subprotocols=SUBPROTOCOLS) as websocket:
+            code = (await request(websocket, NetworkRequest.CREATE_ROOM, deck='CAH-ES')).data['room']
+            replies = [
+                await request(websocket, NetworkRequest.SET_PLAYER_INFO, name='Ana', color='red', score=999, role='judge'),
+                await request(websocket, NetworkRequest.SET_PLAYER_INFO, name='Ana'),
+                await request(websocket, NetworkRequest.SET_PLAYER_INFO, role='spectator'),
+            ]
+            [player] = server.rooms.get(code).game_state.players
+            assert (player.name, player.color, player.score, player.role.value) == ('Ana', 'red', 0, 'player')
+            return [reply.type for reply in replies]
+
+    assert asyncio.run(run()) == [NetworkRequest.ACK, NetworkRequest.DISCONNECT, NetworkRequest.DISCONNECT]
+
+
+def test_players_are_ready_once(running_server):
+    async def run() -> tuple[list[Message], int]:
+        async with running_server() as server, connect(f'ws://127.0.0.1:{server.port}/', subprotocols=SUBPROTOCOLS) as websocket:
+            code = (await request(websocket, NetworkRequest.CREATE_ROOM, deck='CAH-ES')).data['room']
+            await request(websocket, NetworkRequest.SET_PLAYER_INFO, name='Ana')
+            room = server.rooms.get(code)
+            version = room.sync.version
+            replies = [await request(websocket, NetworkRequest.READY) for _ in range(2)]
+            assert room.game_state.players[0].ready
+            return replies, room.sync.version - version
+
+    replies, deltas = asyncio.run(run())
+    assert [(reply.type, reply.data['players']) for reply in replies] == [(NetworkRequest.READY, 1)] * 2
+    assert deltas == 1
+
+
+@pytest.mark.parametrize('cards', [[0, 0, 1], [0], [0, 1, 2], [0, 1.0], [0, True], [[0], [1]], '01', [0, 5]])
+def test_invalid_choices_are_ignored(cards):
+    server = Server()
+    deck = Deck(name='Test', codeName='test', official=False, blackCards=[{'text': '_ y _', 'pick': 2}], whiteCards=list('abcd'))
+    room = server.rooms.create(GameSettings(deck=deck))
+    websocket = FakeConnection()
+    server.rooms.join(room.code, websocket)  # type: ignore[arg-type]
+    player = room.clients[websocket.id] = Player(id=websocket.id, name='Ana')
+    player.hand.extend([3, 2, 1, 0])
+    room.game_state.players.append(player)
+    room.game_state.phase = Phase.PLAY_CARDS
+    room.game_state.black_card_id = 0
+
+    asyncio.run(handle_set_player_choices(websocket, server, Message(type=NetworkRequest.SET_PLAYER_CHOICES, data={'cards': cards})))  # type: ignore[arg-type]
+    assert player.selected_cards.tolist() == []
+    asyncio.run(handle_set_player_choices(websocket, server, Message(type=NetworkRequest.SET_PLAYER_CHOICES, data={'cards': [2, 0]})))  # type: ignore[arg-type]
+    assert player.selected_cards.tolist() == [1, 3]
+
+
+def test_players_of_a_recovered_room_reconnect_and_play(tmp_path, running_server):
+    async def crash() -> list[Player]:
+        # Saved in the middle of a round, as if the server had died there
+        rooms = RoomRegistry()
+        log = EventLog(tmp_path)
+        rooms.attach_log(log)
+        room = rooms.create(GameSettings(deck=Server().deck('CAH-ES')), code='AAAAA', deck_name='CAH-ES')
+        room.sync.apply(*(player_joined(Player(name=f'P{i}')) for i in range(4)))
+        start_round(room)
+        room.cancel_deadline()
+        await log.close()
+        return [player.model_copy(deep=True) for player in room.game_state.players]
+
+    async def run(players: list[Player]) -> None:
+        async with running_server(state_dir=tmp_path) as server:
+            room = server.rooms.get('AAAAA')
+            # Judged a second after the last card, to see the round end
+            room.game_state.settings.max_round_time = 1
+            uri = f'ws://127.0.0.1:{server.port}/AAAAA'
+            # The last player does not come back
+            clients = [await connect(uri, subprotocols=SUBPROTOCOLS) for _ in players[:3]]
+            for websocket, player in zip(clients, players):
+                reply = await request(websocket, NetworkRequest.SET_PLAYER_INFO, player_id=str(player.id))
+                assert reply.type == NetworkRequest.ACK and room.clients[UUID(reply.data['player_id'])].name == player.name
+            async with connect(uri, subprotocols=SUBPROTOCOLS) as intruder:
+                for player_id in (players[0].id, uuid4(), 'nobody'):
+                    reply = await request(intruder, NetworkRequest.SET_PLAYER_INFO, player_id=str(player_id))
+                    assert reply.type == NetworkRequest.DISCONNECT
+            assert [player.id for player in room.unclaimed()] == [players[3].id]
+
+            for websocket, player in zip(clients, players):
+                snapshot = await request(websocket, NetworkRequest.GET_GAME_STATE)
+                assert snapshot.data['private']['hand'] == player.hand.tolist()
+                pick = room.game_state.settings.deck.table.pick(room.game_state.black_card_id)
+                await send_message(websocket, Message(type=NetworkRequest.SET_PLAYER_CHOICES, data={'cards': list(range(pick))}))
+
+            async def round_over() -> None:
+                while room.game_state.phase is not Phase.SETUP:
+                    await asyncio.sleep(0.05)
+
+            await asyncio.wait_for(round_over(), 5)
+            scores = [(player.name, player.score) for player in room.game_state.players]
+            assert scores == [(player.name, player.score) for player in players]
+            for websocket in clients:
+                await websocket.close()
+
+    asyncio.run(run(asyncio.run(crash())))
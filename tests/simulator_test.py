@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from main import WINNING_POINTS
+from simulator import GreedyPolicy, WeightedJudge, simulate
+
+
+PICKS = np.array([1, 1, 2, 1, 2, 1, 1, 1, 3, 1] * 6)
+WHITE_COUNT = 200
+
+
+@pytest.mark.parametrize('players', [3, 4, 6])
+def test_counts_are_consistent(players):
+    result = simulate(PICKS, WHITE_COUNT, games=500, players=players, seed=0)
+    cards_per_round = (result.black_plays * PICKS).sum()
+    assert result.games == 500
+    assert result.rounds == result.black_plays.sum()
+    assert result.white_wins.sum() == cards_per_round
+    assert result.white_plays.sum() == (players - 1) * cards_per_round
+    # A card is never dealt twice in the same game
+    assert result.white_plays.max() <= result.games
+    assert result.black_deciding.sum() == result.finished_games
+    assert result.rounds >= result.finished_games * WINNING_POINTS
+
+
+def test_same_seed_same_result():
+    first = simulate(PICKS, WHITE_COUNT, games=200, seed=3)
+    second = simulate(PICKS, WHITE_COUNT, games=200, seed=3)
+    assert np.array_equal(first.white_wins, second.white_wins)
+
+
+def test_policies_shift_the_win_rates():
+    weights = np.zeros(WHITE_COUNT)
+    weights[:10] = 1.0
+    result = simulate(PICKS, WHITE_COUNT, games=2000, seed=1, policy=GreedyPolicy(weights), judge=WeightedJudge(weights))
+    rates = result.white_win_rate()
+    assert rates[:10].mean() > rates[10:].mean()
@@ -0,0 +1,102 @@
+import asyncio
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+from websockets.frames import CloseCode
+
+import sync
+from codec import BINARY_CODEC, JSON_CODEC, JSON_SUBPROTOCOL, SUBPROTOCOLS, recv_message, send_message
+from metrics import BYTES_OUT
+from models import Message, NetworkRequest, PlayerRole
+
+
+SPECTATORS = 40
+
+
+def count_encodes(monkeypatch, codec) -> list[tuple[NetworkRequest, int]]:
+    encoded = []
+    encode_raw = codec.encode_raw
+
+    def counting(request, data):
+        frame = encode_raw(request, data)
+        encoded.append((request, len(frame)))
+        return frame
+
+    monkeypatch.setattr(codec, 'encode_raw', counting, raising=False)
+    return encoded
+
+
+async def register(uri: str, subprotocols, data: dict) -> object:
+    websocket = await connect(uri, subprotocols=subprotocols)
+    await send_message(websocket, Message(type=NetworkRequest.SET_PLAYER_INFO, data=data))
+    assert (await recv_message(websocket)).type == NetworkRequest.ACK
+    return websocket
+
+
+def test_spectators_share_every_frame_and_see_no_hands(monkeypatch, running_server):
+    encoded = {codec: count_encodes(monkeypatch, codec) for codec in (BINARY_CODEC, JSON_CODEC)}
+
+    async def run() -> None:
+        async with running_server() as server, connect(f'ws://127.0.0.1:{server.port}/', subprotocols=SUBPROTOCOLS) as host:
+            await send_message(host, Message(type=NetworkRequest.CREATE_ROOM, data={'deck': 'CAH-ES'}))
+            code = (await recv_message(host)).data['room']
+            await send_message(host, Message(type=NetworkRequest.SET_PLAYER_INFO, data={'name': 'Ana'}))
+            await recv_message(host)
+            uri = f'ws://127.0.0.1:{server.port}/{code}'
+
+            # Half of them speak JSON
+            spectators = await asyncio.gather(*(
+                register(uri, SUBPROTOCOLS if i % 2 else [JSON_SUBPROTOCOL], {'role': PlayerRole.SPECTATOR})
+                for i in range(SPECTATORS)
+            ))
+            for spectator in spectators:
+                await send_message(spectator, Message(type=NetworkRequest.GET_GAME_STATE))
+                snapshot = await recv_message(spectator)
+                assert snapshot.type == NetworkRequest.GET_GAME_STATE and 'private' not in snapshot.data
+            room = server.rooms.get(code)
+            assert len(room.spectators) == SPECTATORS and len(room.clients) == 1
+
+            for codec in encoded.values():
+                codec.clear()
+            bytes_out = BYTES_OUT.values.get((), 0)
+            bea = await register(uri, SUBPROTOCOLS, {'name': 'Bea'})
+            for spectator in spectators:
+                delta = await asyncio.wait_for(recv_message(spectator), 5)
+                assert delta.type == NetworkRequest.STATE_DELTA
+                assert delta.data['deltas'][0]['name'] == 'Bea'
+            # One frame per wire format, whatever the number of spectators
+            deltas = {codec: [size for request, size in frames if request is NetworkRequest.STATE_DELTA] for codec, frames in encoded.items()}
+            assert [len(sizes) for sizes in deltas.values()] == [1, 1]
+            # Half of the spectators got each of them
+            assert BYTES_OUT.values[()] - bytes_out >= sum(sizes[0] for sizes in deltas.values()) * SPECTATORS // 2
+
+            # Spectators cannot start the game
+            await send_message(spectators[0], Message(type=NetworkRequest.START))
+            assert (await recv_message(spectators[0])).type == NetworkRequest.DISCONNECT
+            assert room.game_state.phase.name == 'SETUP'
+            for spectator in [bea, *spectators]:
+                await spectator.close()
+
+    asyncio.run(run())
+
+
+def test_spectators_that_fall_behind_are_dropped(monkeypatch, running_server):
+    async def run() -> CloseCode | None:
+        async with running_server() as server, connect(f'ws://127.0.0.1:{server.port}/', subprotocols=SUBPROTOCOLS) as host:
+            await send_message(host, Message(type=NetworkRequest.CREATE_ROOM, data={'deck': 'CAH-ES'}))
+            uri = f'ws://127.0.0.1:{server.port}/{(await recv_message(host)).data['room']}'
+            async with await register(uri, SUBPROTOCOLS, {'role': PlayerRole.SPECTATOR}) as spectator:
+                await send_message(spectator, Message(type=NetworkRequest.GET_GAME_STATE))
+                await recv_message(spectator)
+                # Anything still waiting in its socket is too much from now on
+                monkeypatch.setattr(sync, 'SPECTATOR_WRITE_LIMIT', -1)
+                await send_message(host, Message(type=NetworkRequest.SET_PLAYER_INFO, data={'name': 'Ana'}))
+                await recv_message(host)
+                try:
+                    while True:
+                        await asyncio.wait_for(recv_message(spectator), 5)
+                except ConnectionClosed:
+                    pass
+                return spectator.close_code
+
+    assert asyncio.run(run()) == CloseCode.TRY_AGAIN_LATER
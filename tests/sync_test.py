@@ -0,0 +1,110 @@
+import json
+from uuid import uuid4
+
+from codec import JSON_CODEC
+from models import Deck, GameSettings, GameState, NetworkRequest, Phase, Player
+from sync import (
+    DELTA_HISTORY,
+    BlackCardDrawn,
+    PhaseChanged,
+    PlayerReady,
+    StateSync,
+    apply_delta,
+    parse_deltas,
+    player_joined,
+)
+from outbox import Outbox
+
+
+DECK = Deck(name='Test', codeName='test', official=False, blackCards=[{'text': '_', 'pick': 1}], whiteCards=['a', 'b', 'c'])
+
+
+def new_sync() -> StateSync:
+    return StateSync(GameState(settings=GameSettings(deck=DECK)))
+
+
+def test_apply_bumps_version_per_delta():
+    sync = new_sync()
+    player = Player(name='Ana')
+    sync.apply(player_joined(player), PlayerReady(player_id=player.id))
+    sync.apply(PhaseChanged(phase=Phase.PLAY_CARDS))
+    assert sync.version == 3
+    assert sync.player(player.id).ready and sync.state.phase is Phase.PLAY_CARDS
+
+
+def test_snapshot_hides_deck_and_hands():
+    sync = new_sync()
+    player = Player(name='Ana')
+    sync.apply(player_joined(player))
+    sync.player(player.id).hand.extend([0, 1])
+    request, data = sync.snapshot_message()
+    assert request == NetworkRequest.GET_GAME_STATE
+    state = json.loads(data)['state']
+    assert json.loads(data)['version'] == 1
+    assert state['settings']['deck'] == 'Test'
+    assert 'hand' not in state['players'][0]
+
+
+def test_catch_up_sends_deltas_that_rebuild_the_state():
+    sync = new_sync()
+    client_state = GameState(settings=GameSettings(deck=DECK))
+    player = Player(name='Ana')
+    sync.apply(player_joined(player))
+    for delta in parse_deltas(json.loads(sync.catch_up_message(0)[1])['deltas']):
+        apply_delta(client_state, delta)
+
+    sync.apply(PhaseChanged(phase=Phase.PLAY_CARDS), BlackCardDrawn(card_id=0))
+    data = json.loads(sync.catch_up_message(1)[1])
+    assert (data['from_version'], data['version']) == (2, 3)
+    for delta in parse_deltas(data['deltas']):
+        apply_delta(client_state, delta)
+    assert client_state.phase == Phase.PLAY_CARDS
+    assert client_state.black_card_id == sync.state.black_card_id == 0
+    assert [p.name for p in client_state.players] == ['Ana']
+
+
+def test_catch_up_falls_back_to_snapshot_after_a_gap():
+    sync = new_sync()
+    player = Player(name='Ana')
+    sync.apply(player_joined(player))
+    for version in range(DELTA_HISTORY + 1):
+        sync.apply(PlayerReady(player_id=player.id, ready=version % 2 == 0))
+    assert sync.catch_up_message(0)[0] == NetworkRequest.GET_GAME_STATE
+    assert sync.catch_up_message(None)[0] == NetworkRequest.GET_GAME_STATE
+    assert sync.catch_up_message(sync.version - 1)[0] == NetworkRequest.STATE_DELTA
+
+
+def test_projection_reuses_public_view_and_adds_private_part():
+    sync = new_sync()
+    ana, bea = Player(name='Ana'), Player(name='Bea')
+    sync.apply(player_joined(ana), player_joined(bea))
+    sync.player(ana.id).hand.extend(DECK.draw_white_ids(2))
+
+    public = sync.state.public_view()
+    assert sync.state.public_view() is public
+    for_ana = json.loads(sync.state.projection(ana.id))
+    for_bea = json.loads(sync.state.projection(bea.id))
+    assert for_ana['state'] == for_bea['state']
+    # Cards go as their ids in the deck
+    assert for_ana['private']['hand'] == sync.player(ana.id).hand.tolist()
+    assert for_bea['private']['hand'] == []
+    assert 'private' not in json.loads(sync.state.projection())
+
+    sync.apply(PlayerReady(player_id=bea.id))
+    assert sync.state.public_view() is not public
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.id = uuid4()
+        self.subprotocol = None
+
+
+def test_subscribers_get_every_delta_after_their_catch_up():
+    sync = new_sync()
+    outbox = Outbox(FakeConnection())  # type: ignore[arg-type]
+    sync.subscribe(outbox)
+    sync.apply(PhaseChanged(phase=Phase.PLAY_CARDS))
+    frames = [JSON_CODEC.decode(outbox.queue.get_nowait()) for _ in range(outbox.queue.qsize())]
+    assert [frame.type for frame in frames] == [NetworkRequest.GET_GAME_STATE, NetworkRequest.STATE_DELTA]
+    assert frames[1].data['from_version'] == frames[0].data['version'] + 1
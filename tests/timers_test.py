@@ -0,0 +1,77 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from codec import JSON_CODEC
+from models import Deck, GameSettings, NetworkRequest
+from rooms import RoomRegistry
+from timers import MAX_TICKS, TimerWheel, timer_wheel
+
+
+DECK = Deck(name='Test', codeName='test', official=False, blackCards=[{'text': '_', 'pick': 1}], whiteCards=['a', 'b', 'c'])
+
+
+@pytest.mark.parametrize('delay', [1, 5, 63, 64, 65, 4095, 4096, 5000, 200_000])
+def test_timers_fire_on_their_tick(delay):
+    wheel = TimerWheel()
+    wheel.advance()  # Not aligned with the slots
+    fired = []
+    wheel.schedule(delay, lambda: fired.append(wheel.current))
+    start = wheel.current
+    for _ in range(delay):
+        wheel.advance()
+    assert fired == [start + delay]
+    assert len(wheel) == 0
+
+
+def test_cancelled_timers_do_not_fire():
+    wheel = TimerWheel()
+    fired = []
+    timer = wheel.schedule(100, lambda: fired.append('cancelled'))
+    wheel.schedule(100, lambda: fired.append('kept'))
+    timer.cancel()
+    timer.cancel()
+    for _ in range(100):
+        wheel.advance()
+    assert fired == ['kept']
+    assert not timer.active
+
+
+def test_countdown_every_tick():
+    wheel = TimerWheel()
+    ticks = []
+    wheel.schedule(3, lambda: None, ticks.append)
+    for _ in range(5):
+        wheel.advance()
+    assert ticks == [2, 1]
+
+
+def test_timers_have_a_max_length():
+    with pytest.raises(ValueError):
+        TimerWheel().schedule(MAX_TICKS + 1, lambda: None)
+
+
+def test_room_deadline_sends_countdowns_and_expires():
+    class FakeOutbox:
+        def __init__(self) -> None:
+            self.frames: list[bytes] = []
+
+        def offer(self, frame: bytes) -> bool:
+            self.frames.append(frame)
+            return True
+
+    async def run():
+        timer_wheel().tick = 0.01
+        room = RoomRegistry().create(GameSettings(deck=DECK))
+        outbox = FakeOutbox()
+        room.sync.subscribers[JSON_CODEC] = {uuid4(): outbox}  # type: ignore
+        expired = asyncio.Event()
+        room.set_deadline(0.05, expired.set)
+        await asyncio.wait_for(expired.wait(), 1)
+        return outbox
+
+    outbox = asyncio.run(run())
+    messages = [JSON_CODEC.decode(frame) for frame in outbox.frames]
+    assert [message.type for message in messages] == [NetworkRequest.COUNTDOWN] * 4
+    assert [message.data['remaining'] for message in messages] == [1, 1, 1, 1]